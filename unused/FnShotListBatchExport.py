@@ -0,0 +1,216 @@
+# FnShotListBatchExport.py
+# Writes the shot lists of many sequences in many projects without the export
+# dialog, using the same rows and columns as the Spreadsheet CSV Exporter
+# (FnShotListExportTask.py). Each project is opened, exported and closed in
+# turn, and the shot lists are written one CSV file per sequence or all to one
+# combined CSV file.
+#
+# Projects are exported one at a time unless --processes is given. Then they
+# are shared between worker processes forked from this one. hiero.core has
+# already been imported when they are forked, but no project has been opened,
+# so each worker opens only its own projects. Forking is only supported on
+# platforms that have os.fork. Where there is no fork, multiprocessing would
+# start the workers by running this interpreter (possibly the Hiero binary)
+# again, so the projects are exported in this process instead.
+#
+# Run it with a Python that can import hiero.core without the Hiero UI, for
+# example:
+#   FnShotListBatchExport.py show/*.hrox --sequence "reel*" --output reports
+#   FnShotListBatchExport.py show/*.hrox --combined reports/show.csv --columns shotName srcIn srcOut
+# Project paths may be glob patterns, sequences are chosen by name or glob
+# pattern and all columns are written unless --columns is given.
+
+import os
+import re
+import sys
+import glob
+import fnmatch
+import argparse
+import multiprocessing
+
+import hiero.core
+import FnShotListExportTask
+import HieroBinWalk
+
+def matchesAny(name, patterns):
+  '''Whether @name matches any of the glob @patterns, or there are none
+  '''
+  return not patterns or any([fnmatch.fnmatchcase(name, pattern) for pattern in patterns])
+
+def safeFileName(name):
+  return re.sub(r"[^\w.-]+", "_", name).strip("_") or "untitled"
+
+def uniquePath(path, usedPaths):
+  '''@path, or if it is in @usedPaths, the first of path_2, path_3, ...
+     (before the extension) that isn't. The path returned is added to
+     @usedPaths. Paths are compared ignoring case, as some file systems do.
+  '''
+  base, extension = os.path.splitext(path)
+  unique = path
+  count = 1
+  while unique.lower() in usedPaths:
+    count += 1
+    unique = "%s_%i%s" % (base, count, extension)
+  usedPaths.add(unique.lower())
+  return unique
+
+class BatchShotList:
+  """Reads the shot list rows of @sequence for the columns with the knob names
+  in @columnNames, as ShotListExportTask would export them. It stands in for
+  the task as the parent of the ShotListExportTrackTasks doing the work."""
+  def __init__(self, sequence, columnNames):
+    self._sequence = sequence
+    self._fps = sequence.framerate().toInt()
+    self._context = FnShotListExportTask.ShotListExportContext(sequence)
+    self._preset = FnShotListExportTask.ShotListExportPreset("Batch", {})
+    self._columns = [column for column in FnShotListExportTask.ShotListExportTask.columns if column.knobName in columnNames]
+
+  def enabledColumns(self):
+    return self._columns
+
+  def header(self):
+    return [column.knobName for column in self._columns]
+
+  def rows(self):
+    """The rows of each video track in turn, one list of rows per track"""
+    for track in self._sequence.videoTracks():
+      trackTask = FnShotListExportTask.ShotListExportTrackTask(self, track, list(track))
+      while trackTask.taskStep():
+        pass
+      yield trackTask.takeEdits()
+
+def exportProject(job):
+  '''Export the shot lists of one project, possibly in a worker process.
+     @job is (project path, sequence patterns, column names, output directory).
+     With an output directory, which must only be used by this project, each
+     sequence is written to its own file and (project, sequence, file path,
+     row count) returned for each. Without one (project, sequence, rows) is
+     returned for each sequence.
+     Returns the results and an error message, or None if the project was exported.
+  '''
+  projectPath, sequencePatterns, columnNames, outputDirectory = job
+  results = []
+  usedPaths = set()
+  project = None
+  error = None
+  try:
+    project = hiero.core.openProject(projectPath)
+    projectName = project.name()
+    for sequence in HieroBinWalk.projectSequences(project):
+      if not matchesAny(sequence.name(), sequencePatterns):
+        continue
+      shotList = BatchShotList(sequence, columnNames)
+      if outputDirectory is None:
+        rows = []
+        for trackRows in shotList.rows():
+          rows += trackRows
+        results.append((projectName, sequence.name(), rows))
+        continue
+
+      # Sequences whose names only differ in characters a file name can't have still get a file each
+      path = uniquePath(os.path.join(outputDirectory, safeFileName(sequence.name()) + ".csv"), usedPaths)
+      writer = FnShotListExportTask.CSVFileWriter(shotList, shotList.header())
+      writer.open(path)
+      rowCount = 0
+      try:
+        for trackRows in shotList.rows():
+          writer.addEdits(trackRows)
+          rowCount += len(trackRows)
+      finally:
+        writer.close()
+      results.append((projectName, sequence.name(), path, rowCount))
+  except Exception as e:
+    error = "%s: %s" % (projectPath, str(e))
+  finally:
+    if project is not None:
+      # A project that won't close must not hide what was exported from it
+      try:
+        project.close()
+      except Exception as e:
+        closeError = "%s: unable to close the project: %s" % (projectPath, str(e))
+        error = closeError if error is None else "%s; %s" % (error, closeError)
+  return results, error
+
+def projectPaths(patterns):
+  '''The project files matching @patterns, each listed once in the order given
+  '''
+  paths = []
+  for pattern in patterns:
+    for path in sorted(glob.glob(pattern)) or [pattern]:
+      path = os.path.abspath(path)
+      if path not in paths:
+        paths.append(path)
+  return paths
+
+def parseArguments(arguments):
+  columnNames = [column.knobName for column in FnShotListExportTask.ShotListExportTask.columns]
+  parser = argparse.ArgumentParser(description="Write the shot lists of sequences in Hiero projects as CSV files.")
+  parser.add_argument("projects", nargs="+", help="Hiero project files or glob patterns")
+  parser.add_argument("--sequence", dest="sequences", action="append", default=[],
+                      help="Name or glob pattern of the sequences to export, may be repeated. All sequences by default.")
+  parser.add_argument("--columns", nargs="+", choices=columnNames, default=columnNames,
+                      help="Columns to write, in shot list order. All columns by default.")
+  parser.add_argument("--processes", type=int, default=1,
+                      help="Number of projects to export at once, in forked worker processes. One by default.")
+  output = parser.add_mutually_exclusive_group(required=True)
+  output.add_argument("--output", help="Directory to write a CSV file per sequence to, in a folder per project")
+  output.add_argument("--combined", help="CSV file to write every shot list to, with project and sequence columns")
+  return parser.parse_args(arguments)
+
+def main(arguments):
+  options = parseArguments(arguments)
+  paths = projectPaths(options.projects)
+  jobs = []
+  usedDirectories = set()
+  for path in paths:
+    outputDirectory = None
+    if options.output:
+      # A folder per project file, projects with the same name get one each
+      projectName = safeFileName(os.path.splitext(os.path.basename(path))[0])
+      outputDirectory = uniquePath(os.path.join(os.path.abspath(options.output), projectName), usedDirectories)
+    jobs.append((path, options.sequences, options.columns, outputDirectory))
+
+  combined = None
+  if options.combined:
+    columnNames = [column.knobName for column in FnShotListExportTask.ShotListExportTask.columns if column.knobName in options.columns]
+    combined = FnShotListExportTask.CSVFileWriter(None, ["project", "sequence"] + columnNames)
+    combined.open(os.path.abspath(options.combined))
+
+  # Projects are opened in separate processes, never shared between threads
+  pool = None
+  processes = min(options.processes, len(jobs))
+  if processes > 1 and not hasattr(os, "fork"):
+    print >> sys.stderr, "Worker processes can't be forked on this platform, exporting one project at a time"
+    processes = 1
+  if processes > 1:
+    pool = multiprocessing.Pool(processes)
+    exported = pool.imap(exportProject, jobs)
+  else:
+    exported = (exportProject(job) for job in jobs)
+
+  errors = []
+  try:
+    for results, error in exported:
+      if error is not None:
+        errors.append(error)
+      for result in results:
+        if combined is not None:
+          projectName, sequenceName, rows = result
+          combined.addEdits([[projectName, sequenceName] + row for row in rows])
+          print "%s / %s: %i shots" % (projectName, sequenceName, len(rows))
+        else:
+          projectName, sequenceName, path, rowCount = result
+          print "%s / %s: %i shots written to %s" % (projectName, sequenceName, rowCount, path)
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
+    if combined is not None:
+      combined.close()
+
+  for error in errors:
+    print >> sys.stderr, "Unable to export %s" % error
+  return 1 if errors else 0
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
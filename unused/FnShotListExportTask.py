@@ -7,6 +7,72 @@ import math
 import csv
 
 import hiero.core
+import FnTimecode
+
+class ShotListExportContext:
+  """The values every row of a shot list export of @sequence needs: the frame
+  rate, drop frame setting and timecode start of the sequence, the EDL
+  timecode preference and the timecode start of each clip. They are looked
+  up once per export, not once or more per row, as are the values of the
+  costliest columns for each clip. Unless @dropFrame is given,
+  timecodes are drop frame if the sequence is, at 29.97 or 59.94 fps."""
+  def __init__(self, sequence, dropFrame=None):
+    self.fps = sequence.framerate().toInt()
+    if dropFrame is None:
+      dropFrame = hasattr(sequence, "dropFrame") and bool(sequence.dropFrame())
+    # Only NTSC rates have a drop frame timecode
+    self.dropFrame = dropFrame and FnTimecode.nominalFps(self.fps) % 30 == 0
+    self.timecodeStart = sequence.timecodeStart()
+    # The user Preference for 'Timecode > EDL-Style Spreadsheet Timecodes' puts out points a frame later
+    self.outOffset = int(hiero.core.ApplicationSettings().boolValue('useVideoEDLTimecodes'))
+    self._clipTimecodeStarts = {}
+    self._clipValues = {}
+
+  def clipTimecodeStart(self, clip):
+    if clip not in self._clipTimecodeStarts:
+      self._clipTimecodeStarts[clip] = clip.timecodeStart()
+    return self._clipTimecodeStarts[clip]
+
+  def clipValue(self, column, trackTask, trackItem):
+    """The value of @column for @trackItem, read once for each source clip"""
+    key = (column.knobName, trackItem.source())
+    if key not in self._clipValues:
+      self._clipValues[key] = column.extract(trackTask, trackItem)
+    return self._clipValues[key]
+
+  # Columns at least this long are converted as numpy arrays, if numpy is installed
+  kArrayColumnLength = 256
+
+  def timecodes(self, frames):
+    """Format a column of frame numbers as timecodes"""
+    if FnTimecode.numpy is not None and len(frames) >= self.kArrayColumnLength:
+      return FnTimecode.framesToTimecodes(FnTimecode.numpy.array(frames), self.fps, self.dropFrame).tolist()
+    return FnTimecode.framesToTimecodes(frames, self.fps, self.dropFrame)
+
+  def timecode(self, frame):
+    return self.timecodes([frame])[0]
+
+class ShotListColumn:
+  """A column of the shot list: the knob name of its checkbox (also its header),
+  its title in the UI, whether it is exported by default, the function reading
+  its value from a track item and the cost of calling it. Timecode columns read
+  frame numbers, which are formatted as timecodes a whole column at a time.
+  Columns costing kCostMedia only depend on the source clip, and are read
+  once per clip rather than once per shot."""
+
+  # Costs of reading a column, in rough order of magnitude
+  kCostAttribute = 1  # A value the track item has to hand
+  kCostLookup = 2     # Metadata, clips and tracks
+  kCostMedia = 3      # File information of the media source, the same for every shot of a clip
+
+  def __init__(self, knobName, title, extract, cost=kCostAttribute, isTimecode=False, value=True):
+    self.knobName = knobName
+    self.title = title
+    # extract(trackTask, trackItem) returns the value of the column
+    self.extract = extract
+    self.cost = cost
+    self.isTimecode = isTimecode
+    self.value = value
 
 class ShotListExportTrackTask:
   def __init__(self, parent, track, trackItems):
@@ -20,11 +86,41 @@ class ShotListExportTrackTask:
     self._fps = parent._fps
     self._preset = parent._preset
     self._edits = []
-    self._dropFrame = False
-  
+    self._context = parent._context
+    self._dropFrame = self._context.dropFrame
+    # Rows whose timecodes are still frame numbers, formatted a column at a time
+    self._pendingEdits = []
+
+    # Only the columns chosen in the preset are read
+    columns = parent.enabledColumns()
+    self._extractors = [self.clipExtractor(column) if column.cost >= ShotListColumn.kCostMedia else column.extract for column in columns]
+    self._timecodeColumns = [index for index, column in enumerate(columns) if column.isTimecode]
+
+  @staticmethod
+  def clipExtractor(column):
+    """Read @column through the context, once per source clip"""
+    return lambda trackTask, trackItem: trackTask._context.clipValue(column, trackTask, trackItem)
+
+  def formatPendingEdits(self):
+    if not self._pendingEdits:
+      return
+    columns = [self._context.timecodes([row[column] for row in self._pendingEdits]) for column in self._timecodeColumns]
+    for i, row in enumerate(self._pendingEdits):
+      for column, timecodes in zip(self._timecodeColumns, columns):
+        row[column] = timecodes[i]
+    self._edits += self._pendingEdits
+    self._pendingEdits = []
+
   def edits(self):
+    self.formatPendingEdits()
     return self._edits
 
+  def takeEdits(self):
+    """Return the rows made so far and forget them, once they have been written"""
+    edits = self.edits()
+    self._edits = []
+    return edits
+
 
   #### Shot Methods ####
   def getStatus(self, trackItem):
@@ -35,7 +131,7 @@ class ShotListExportTrackTask:
 
   def timecodePrefCheck(self):
     # We need to check the user Preference for 'Timecode > EDL-Style Spreadsheet Timecodes'
-    return int(hiero.core.ApplicationSettings().boolValue('useVideoEDLTimecodes'))
+    return self._context.outOffset
 
   def getReelName(self,trackItem):
     reelName = ""
@@ -44,34 +140,30 @@ class ShotListExportTrackTask:
       reelName = M.value('foundry.edl.sourceReel')
     return reelName
 
+  # Timecodes as frame numbers, relative to the timecode start of the clip or sequence
+  def getSrcInFrame(self,trackItem):
+    return self._context.clipTimecodeStart(trackItem.source())+trackItem.sourceIn()
+
+  def getSrcOutFrame(self,trackItem):
+    return self._context.clipTimecodeStart(trackItem.source())+trackItem.sourceOut()+self._context.outOffset
+
+  def getDstInFrame(self,trackItem):
+    return self._context.timecodeStart+trackItem.timelineIn()
+
+  def getDstOutFrame(self,trackItem):
+    return self._context.timecodeStart+trackItem.timelineOut()+self._context.outOffset
+
   def getSrcIn(self,trackItem):
-    fps = trackItem.parent().parent().framerate()
-    clip = trackItem.source()
-    clipstartTimeCode = clip.timecodeStart()
-    srcIn = hiero.core.Timecode.timeToString(clipstartTimeCode+trackItem.sourceIn(), fps, hiero.core.Timecode.kDisplayTimecode)
-    return srcIn
+    return self._context.timecode(self.getSrcInFrame(trackItem))
 
   def getSrcOut(self,trackItem):
-
-    fps = trackItem.parent().parent().framerate()
-    clip = trackItem.source()
-    clipstartTimeCode = clip.timecodeStart()
-    srcOut = hiero.core.Timecode.timeToString(clipstartTimeCode+trackItem.sourceOut()+self.timecodePrefCheck(), fps, hiero.core.Timecode.kDisplayTimecode)
-    return srcOut
+    return self._context.timecode(self.getSrcOutFrame(trackItem))
 
   def getDstIn(self,trackItem):
-    seq = trackItem.parent().parent()
-    tStart = seq.timecodeStart()
-    fps = seq.framerate()
-    dstIn = hiero.core.Timecode.timeToString(tStart+trackItem.timelineIn(),fps,hiero.core.Timecode.kDisplayTimecode)
-    return dstIn
+    return self._context.timecode(self.getDstInFrame(trackItem))
 
   def getDstOut(self,trackItem):
-    seq = trackItem.parent().parent()
-    tStart = seq.timecodeStart()
-    fps = seq.framerate()
-    dstOut = hiero.core.Timecode.timeToString(tStart+trackItem.timelineOut()+self.timecodePrefCheck(), fps, hiero.core.Timecode.kDisplayTimecode)
-    return dstOut
+    return self._context.timecode(self.getDstOutFrame(trackItem))
 
   # Get a Nuke Read node style file path
   def getNukeStyleFilePath(self,trackItem):
@@ -111,24 +203,10 @@ class ShotListExportTrackTask:
   
     # Get all Tracks in the Sequence...
     if isinstance(trackItem,hiero.core.TrackItem):
-      #M = trackItem.metadata()
-
-      shotRow = [str(trackItem.eventNumber()),
-                    str(self.getStatus(trackItem)),
-                    str(trackItem.name()),
-                    str(self.getReelName(trackItem)),
-                    str(trackItem.parent().name()),
-                    "%.1f" % (100.0*float(trackItem.playbackSpeed())),
-                    str(self.getSrcIn(trackItem)),
-                    str(self.getSrcOut(trackItem)),
-                    str(math.floor(trackItem.sourceDuration())),
-                    str(self.getDstIn(trackItem)),
-                    str(self.getDstOut(trackItem)),
-                    str(trackItem.duration()),
-                    str(trackItem.source().name()),
-                    str(self.getNukeStyleFilePath(trackItem))]
-
-    self._edits.append( shotRow )    
+      shotRow = [extract(self, trackItem) for extract in self._extractors]
+
+      # The timecodes of the row are formatted with those of the rest of the track
+      self._pendingEdits.append( shotRow )
 
   def taskStep(self):
     if len(self._trackItems) == 0:
@@ -143,35 +221,44 @@ class ShotListExportTrackTask:
     return self._trackItemIndex < len(self._trackItems)
 
 class CSVFileWriter():
+  """Streams rows to a CSV file. The file is opened and the header row written
+  once, rows are then appended as they are made and the file closed at the end,
+  so only the rows of one track are ever held in memory."""
+
+  # Bytes of rows to buffer between writes to the file
+  kBufferSize = 1 << 16
+
   def __init__(self, parent, columnHeaderList):
     self._parent = parent
     
     # This is a list of the selected Column Header titles, specified via the UI
     self._csvHeaderRow = columnHeaderList
-    print 'THIS LIST:',self._csvHeaderRow
-    self._edits = []
-
-  def addEdits(self, edits):
-    self._edits += edits
+    self._file = None
+    self._writer = None
 
-  def write(self, filePath):
-    
-    
+  def open(self, filePath):
     try:
       # check export root exists
       dir = os.path.dirname(filePath)
       if not os.path.exists(dir):
         os.makedirs(dir)
       # Write the Header row to the CSV file
-      self._writer = csv.writer(open(filePath, 'w'), delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
+      self._file = open(filePath, 'wb', self.kBufferSize)
+      self._writer = csv.writer(self._file, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
       self._writer.writerow(self._csvHeaderRow)
     except IOError:
-      error( "CSVFileWriter.write failed %s" % exportPath )
+      hiero.core.log.error( "CSVFileWriter.open failed %s" % filePath )
+      self.close()
       raise
-    
-    eventIndex = 1
-    for shotRow in self._edits:
-      self._writer.writerow(shotRow)
+
+  def addEdits(self, edits):
+    self._writer.writerows(edits)
+
+  def close(self):
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+      self._writer = None
 
 
 
@@ -182,6 +269,7 @@ class ShotListExportTask(hiero.core.TaskBase):
     self._currentTrack = None
     hiero.core.TaskBase.__init__(self, initDict)
     self._fps = self._sequence.framerate().toInt()
+    self._context = ShotListExportContext(self._sequence)
     self._trackTasks = []
     self._trackTaskIndex = 0
     self._audioTask = None
@@ -193,14 +281,14 @@ class ShotListExportTask(hiero.core.TaskBase):
     # Initialise a CSV File Writer with selected column headers
     self._fileWriter = CSVFileWriter(self,csvColumnHeaders)
 
+  def enabledColumns(self):
+    """The ShotListColumns whose checkboxes are checked in the preset, in order"""
+    csvData = self._preset.properties()["csvData"]
+    return [column for column in ShotListExportTask.columns if csvData.get(column.knobName, column.value)==True]
+
   def getColumnHeaderTitleList(self):
     # Here, we construct a list of column headers, based on csvData Dict for checkboxes which are True
-    columnHeaders = []
-    for data in ShotListExportTask.csvPropertyData:
-      key = data['knobName']
-      value = self._preset.properties()["csvData"][key]
-      if value==True:
-        columnHeaders+=[key]
+    columnHeaders = [column.knobName for column in self.enabledColumns()]
     
     print 'CSV Column headers:',columnHeaders
     return columnHeaders
@@ -230,6 +318,8 @@ class ShotListExportTask(hiero.core.TaskBase):
       task = ShotListExportTrackTask(self, track, trackItems)
       self._trackTasks.append( task )
 
+    self._fileWriter.open( self.exportFilePath() )
+
 
   def exportFilePath(self):
     exportPath = self.resolvedExportPath()
@@ -242,21 +332,20 @@ class ShotListExportTask(hiero.core.TaskBase):
     trackTask = self._trackTasks[self._trackTaskIndex]
     self._currentTrack = trackTask._track
     if not trackTask.taskStep():
-      path = self.exportFilePath()
-
-      self._fileWriter.addEdits( trackTask.edits() )
+      # Append the rows of the finished track, they aren't needed after that
+      self._fileWriter.addEdits( trackTask.takeEdits() )
 
       """if self._audioTask:
-        self._fileWriter.addEdits( self._audioTask.edits() )
+        self._fileWriter.addEdits( self._audioTask.takeEdits() )
         self._audioTask = None"""
 
-      self._fileWriter.write( path )
       self._trackTaskIndex += 1
 
     self._stepCount += 1
     return self._stepCount < self._stepTotal
   
   def finishTask(self):
+    self._fileWriter.close()
     hiero.core.TaskBase.finishTask(self)
 
   def progress(self):
@@ -266,21 +355,26 @@ class ShotListExportTask(hiero.core.TaskBase):
       return float(self._stepCount / self._stepTotal)
 
 
-ShotListExportTask.csvPropertyData = (
-                          {'title':"Event", 'knobName':"event", 'value' : True },
-                          {'title':"Status", 'knobName':"status", 'value' : True},
-                          {'title':"Shot Name", 'knobName':"shotName", 'value' : True},
-                          {'title':"Reel", 'knobName':"reel", 'value' : True},
-                          {'title':"Track", 'knobName':"track", 'value' : True},
-                          {'title':"Speed", 'knobName':"speed", 'value' : True},
-                          {'title':"Src In", 'knobName':"srcIn", 'value' :  True},
-                          {'title':"Src Out", 'knobName':"srcOut", 'value' : True},
-                          {'title':"Src Duration", 'knobName':"srcDuration", 'value' : True},
-                          {'title':"Dst In", 'knobName':"dstIn", 'value' : True},
-                          {'title':"Dst Out", 'knobName':"dstOut", 'value' : True},
-                          {'title':"Dst Duration", 'knobName':"dstDuration", 'value' : True},
-                          {'title':"Clip Name", 'knobName':"clip", 'value' : True},
-                          {'title':"Clip Media", 'knobName':"clipMedia", 'value' : True})
+# The columns a shot list can have, in the order they are written.
+# Each reads its value through a method of ShotListExportTrackTask.
+ShotListExportTask.columns = (
+  ShotListColumn("event", "Event", lambda task, trackItem: str(trackItem.eventNumber())),
+  ShotListColumn("status", "Status", lambda task, trackItem: str(task.getStatus(trackItem)), ShotListColumn.kCostLookup),
+  ShotListColumn("shotName", "Shot Name", lambda task, trackItem: str(trackItem.name())),
+  ShotListColumn("reel", "Reel", lambda task, trackItem: str(task.getReelName(trackItem)), ShotListColumn.kCostLookup),
+  ShotListColumn("track", "Track", lambda task, trackItem: str(trackItem.parent().name()), ShotListColumn.kCostLookup),
+  ShotListColumn("speed", "Speed", lambda task, trackItem: "%.1f" % (100.0*float(trackItem.playbackSpeed()))),
+  ShotListColumn("srcIn", "Src In", lambda task, trackItem: task.getSrcInFrame(trackItem), ShotListColumn.kCostLookup, isTimecode=True),
+  ShotListColumn("srcOut", "Src Out", lambda task, trackItem: task.getSrcOutFrame(trackItem), ShotListColumn.kCostLookup, isTimecode=True),
+  ShotListColumn("srcDuration", "Src Duration", lambda task, trackItem: str(math.floor(trackItem.sourceDuration()))),
+  ShotListColumn("dstIn", "Dst In", lambda task, trackItem: task.getDstInFrame(trackItem), isTimecode=True),
+  ShotListColumn("dstOut", "Dst Out", lambda task, trackItem: task.getDstOutFrame(trackItem), isTimecode=True),
+  ShotListColumn("dstDuration", "Dst Duration", lambda task, trackItem: str(trackItem.duration())),
+  ShotListColumn("clip", "Clip Name", lambda task, trackItem: str(trackItem.source().name()), ShotListColumn.kCostLookup),
+  ShotListColumn("clipMedia", "Clip Media", lambda task, trackItem: str(task.getNukeStyleFilePath(trackItem)), ShotListColumn.kCostMedia) )
+
+# The checkboxes of the columns, shown by ShotListExportUI
+ShotListExportTask.csvPropertyData = tuple([ {'title':column.title, 'knobName':column.knobName, 'value':column.value} for column in ShotListExportTask.columns ])
 
 class ShotListExportPreset(hiero.core.TaskPresetBase):
   def __init__(self, name, properties):
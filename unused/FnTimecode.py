@@ -0,0 +1,149 @@
+# FnTimecode.py
+# Conversion between frame numbers and SMPTE timecode (hh:mm:ss:ff) that
+# doesn't need Hiero, for the shot list exporter (FnShotListExportTask.py) and
+# anything else that formats whole columns of timecodes at once.
+#
+# Timecode counts whole frames at the nominal rate of a frame rate: 23.976 fps
+# counts as 24, 29.97 as 30 and 59.94 as 60, the way hiero.core.Timecode
+# displays it. Drop frame timecode (separated by ';') is counted at 29.97 and
+# 59.94, skipping the first 2 (or 4) frame numbers of every minute that isn't
+# a multiple of ten so the timecode keeps up with the clock.
+#
+# Lists of frames are converted in pure Python. If numpy is installed, numpy
+# arrays are converted with array operations and an array is returned.
+
+import re
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+_timecodeRegex = re.compile(r"^\s*(-?)(\d+)[:;.](\d+)[:;.](\d+)([:;.])(\d+)\s*$")
+
+def nominalFps(fps):
+  '''The whole number of frames a second timecode counts at @fps
+  '''
+  nominal = int(round(float(fps)))
+  if nominal <= 0:
+    raise ValueError("Invalid frame rate %s" % fps)
+  return nominal
+
+class _Counting(object):
+  '''The constants needed to count timecode at a frame rate
+  '''
+  def __init__(self, fps, dropFrame):
+    self.fps = nominalFps(fps)
+    self.dropFrame = dropFrame
+    if dropFrame and self.fps % 30 != 0:
+      raise ValueError("Drop frame timecode needs a frame rate of 29.97 or 59.94, not %s" % fps)
+    self.framesPerMinute = self.fps * 60
+    self.framesPerHour = self.fps * 3600
+    self.separator = ";" if dropFrame else ":"
+    if dropFrame:
+      self.dropped = self.fps // 15
+      self.framesPerTenMinutes = self.framesPerMinute * 10 - self.dropped * 9
+      self.framesPerDropMinute = self.framesPerMinute - self.dropped
+
+def framesToTimecodes(frames, fps, dropFrame=False):
+  '''Format each of @frames as a timecode at @fps. Fractional frames are
+     truncated. Returns a list, or a numpy array of strings if @frames is
+     a numpy array.
+  '''
+  counting = _Counting(fps, dropFrame)
+  if numpy is not None and isinstance(frames, numpy.ndarray):
+    return _numpyTimecodes(frames, counting)
+
+  timecodes = []
+  append = timecodes.append
+  fps = counting.fps
+  framesPerHour = counting.framesPerHour
+  framesPerMinute = counting.framesPerMinute
+  separator = counting.separator
+  for frame in frames:
+    frame = int(frame)
+    sign = ""
+    if frame < 0:
+      sign = "-"
+      frame = -frame
+    if dropFrame:
+      tens, remainder = divmod(frame, counting.framesPerTenMinutes)
+      frame += counting.dropped * 9 * tens
+      if remainder > counting.dropped:
+        frame += counting.dropped * ((remainder - counting.dropped) // counting.framesPerDropMinute)
+    hours, frame = divmod(frame, framesPerHour)
+    minutes, frame = divmod(frame, framesPerMinute)
+    seconds, frame = divmod(frame, fps)
+    append("%s%02i:%02i:%02i%s%02i" % (sign, hours, minutes, seconds, separator, frame))
+  return timecodes
+
+def _numpyTimecodes(frames, counting):
+  frames = frames.astype(numpy.int64)
+  if len(frames) == 0 or frames.min() < 0 or counting.fps > 100:
+    return _formatEach(frames, counting)
+  # The frame number each timecode would have if no frames were dropped
+  counts = frames
+  if counting.dropFrame:
+    tens, remainder = numpy.divmod(frames, counting.framesPerTenMinutes)
+    minutes = numpy.maximum(remainder - counting.dropped, 0) // counting.framesPerDropMinute
+    counts = frames + counting.dropped * 9 * tens + counting.dropped * minutes
+  if counts.max() >= counting.framesPerHour * 100:
+    return _formatEach(frames, counting)
+  hours, remainder = numpy.divmod(counts, counting.framesPerHour)
+  minutes, remainder = numpy.divmod(remainder, counting.framesPerMinute)
+  seconds, remainder = numpy.divmod(remainder, counting.fps)
+
+  # Write the characters of every timecode into the rows of a byte array
+  # and view each row as one string
+  characters = numpy.empty((len(frames), 11), dtype=numpy.uint8)
+  for column, values in ((0, hours), (3, minutes), (6, seconds), (9, remainder)):
+    characters[:, column] = values // 10 + ord("0")
+    characters[:, column+1] = values % 10 + ord("0")
+  characters[:, 2] = characters[:, 5] = ord(":")
+  characters[:, 8] = ord(counting.separator)
+  return characters.view("S11").reshape(len(frames))
+
+def _formatEach(frames, counting):
+  '''Signs, three digit frame counts and hours don't fit the fixed width
+     layout of _numpyTimecodes, timecodes with them are formatted one at a time
+  '''
+  return numpy.array(framesToTimecodes(frames.tolist(), counting.fps, counting.dropFrame))
+
+def framesToTimecode(frame, fps, dropFrame=False):
+  '''Format @frame as a timecode at @fps
+  '''
+  return framesToTimecodes([frame], fps, dropFrame)[0]
+
+def timecodesToFrames(timecodes, fps, dropFrame=None):
+  '''The frame numbers of @timecodes at @fps. Timecodes with a ';' before
+     the frames are read as drop frame unless @dropFrame says otherwise.
+     Raises ValueError for text that isn't a timecode.
+  '''
+  countings = {}
+  frames = []
+  for timecode in timecodes:
+    match = _timecodeRegex.match(timecode)
+    if match is None:
+      raise ValueError("Invalid timecode %r" % timecode)
+    sign, hours, minutes, seconds, separator, frame = match.groups()
+    isDropFrame = separator == ";" if dropFrame is None else dropFrame
+    if isDropFrame not in countings:
+      countings[isDropFrame] = _Counting(fps, isDropFrame)
+    counting = countings[isDropFrame]
+
+    hours, minutes, seconds, frame = int(hours), int(minutes), int(seconds), int(frame)
+    if minutes >= 60 or seconds >= 60 or frame >= counting.fps:
+      raise ValueError("Invalid timecode %r at %s fps" % (timecode, fps))
+    totalMinutes = hours * 60 + minutes
+    count = (totalMinutes * 60 + seconds) * counting.fps + frame
+    if isDropFrame:
+      if frame < counting.dropped and seconds == 0 and minutes % 10 != 0:
+        raise ValueError("Timecode %r is dropped at %s fps" % (timecode, fps))
+      count -= counting.dropped * (totalMinutes - totalMinutes // 10)
+    frames.append(-count if sign else count)
+  return frames
+
+def timecodeToFrames(timecode, fps, dropFrame=None):
+  '''The frame number of @timecode at @fps
+  '''
+  return timecodesToFrames([timecode], fps, dropFrame)[0]
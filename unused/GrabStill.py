@@ -7,6 +7,10 @@ import hiero.ui
 import os.path
 from PySide.QtGui import *
 from PySide.QtCore import *
+try:
+  import HieroProjectTracker
+except ImportError:
+  HieroProjectTracker = None
 
 def mapRetime(ti, timelineTime):
   return ti.sourceIn() + int((timelineTime - ti.timelineIn()) * ti.playbackSpeed())
@@ -77,6 +81,9 @@ class GrabThisFrameAction(QAction):
         bi = hiero.core.BinItem(clip)
         clip.setName(bi.name()+'_frame%i' % currentFrame)
         b.addItem(bi)
+        # Let the Find panel know the bins have changed
+        if HieroProjectTracker is not None:
+          HieroProjectTracker.projectTracker.projectEdited(proj)
         
         # Make sure the Clip has the correct Source Media Colour Transform applied...
         bi.activeItem().setSourceMediaColourTransform(cTransform)
@@ -0,0 +1,33 @@
+# HieroBinWalk.py
+# Walks the bins of a Hiero project. Shared by the Find tools (through
+# HieroProjectTracker.py) and the batch shot list export
+# (FnShotListBatchExport.py), which runs without the Hiero UI and so only
+# imports hiero.core.
+
+import hiero.core
+
+def walkBin(bin):
+  '''Iterate over every bin item below @bin, depth first in bin order.
+     Uses a stack of iterators rather than recursion so deeply nested
+     bins can't hit the recursion limit.
+  '''
+  stack = [iter(bin.items())]
+  while stack:
+    for item in stack[-1]:
+      if isinstance(item, hiero.core.Bin):
+        stack.append(iter(item.items()))
+        break
+      if isinstance(item, hiero.core.BinItem) and hasattr(item, "activeItem"):
+        yield item
+    else:
+      stack.pop()
+
+def projectSequences(project):
+  '''Every sequence in the bins of @project, in walkBin order
+  '''
+  sequences = []
+  for binItem in walkBin(project.clipsBin()):
+    activeItem = binItem.activeItem()
+    if isinstance(activeItem, hiero.core.Sequence):
+      sequences.append(activeItem)
+  return sequences
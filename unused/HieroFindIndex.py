@@ -0,0 +1,970 @@
+# HieroFindIndex.py
+# Search index shared by the Find panel (HieroFindWidget.py) and the
+# status bar Find (HieroStatusBarFind.py).
+# The searchable text of each track item (shot and source names, metadata
+# and tag notes) is read from Hiero once and kept in a token index per project,
+# so a search only has to look at the track items that can possibly match.
+# This module does not import hiero itself, it only calls methods on the
+# objects it is given.
+
+import re
+import sre_parse
+import sre_constants
+import heapq
+import threading
+from collections import OrderedDict
+
+# The search options offered in the Find dialog and the fields they look in
+kSearchAll = "Search All"
+kSearchNames = "Search Names"
+kSearchMetadata = "Search Metadata"
+kSearchTagNotes = "Search Tag Notes"
+kSearchFuzzy = "Fuzzy Search Names"
+
+kNames = "names"
+kMetadata = "metadata"
+kTagNotes = "tags"
+
+kSearchFields = { kSearchAll : (kNames, kMetadata, kTagNotes),
+                  kSearchNames : (kNames,),
+                  kSearchMetadata : (kMetadata,),
+                  kSearchTagNotes : (kTagNotes,),
+                  kSearchFuzzy : (kNames,) }
+
+# Fuzzy searches return at most this many of the best matches, scored from
+# 0 to 1, and only those at least this similar to the search text
+kFuzzyResults = 100
+kFuzzyThreshold = 0.6
+
+# Recent searches offered by the search fields
+kSearchHistorySize = 10
+
+# The (key, value) pairs of the track item and source metadata, kept
+# alongside the searchable fields for key scoped searches
+kMetadataItems = "metadataItems"
+
+# A search for a single metadata key, e.g. "foundry.edl.sourceReel:A012".
+# Hiero's metadata keys are all namespaced, so the key must contain a dot.
+_keyedSearchRegex = re.compile(r"^\s*(\w[\w\-]*(?:\.[\w\-]+)+)\s*:\s*(.*)$")
+
+_tokenRegex = re.compile(r"\w+")
+
+def tokenize(text):
+  '''Split @text into the lower case word tokens used as index keys.
+  '''
+  return _tokenRegex.findall(text.lower())
+
+def trigrams(text):
+  '''Return the set of three character substrings of @text
+  '''
+  return set([text[i:i+3] for i in range(len(text)-2)])
+
+def readNames(trackItem):
+  return [trackItem.name(), trackItem.source().name()]
+
+def metadataItems(metadata):
+  '''The (key, value) pairs of a Hiero metadata object
+  '''
+  return [(key, metadata.value(key)) for key in metadata.keys()]
+
+def readMetadataItems(trackItem):
+  return metadataItems(trackItem.metadata()) + metadataItems(trackItem.source().metadata())
+
+def readMetadata(trackItem):
+  '''The metadata values of a track item and its source. The keys are left
+     out so searching for text doesn't match every item that has a key
+     containing it, use a key scoped search for those.
+  '''
+  return [value for key, value in readMetadataItems(trackItem)]
+
+def readTagNotes(trackItem):
+  return [tag.note() for tag in trackItem.tags()]
+
+# How the text of each field is read from a track item
+kFieldReaders = { kNames : readNames,
+                  kMetadata : readMetadata,
+                  kTagNotes : readTagNotes }
+
+def tokenTrigrams(token):
+  '''The trigrams of an indexed token: its three character substrings
+     plus the ones marking where it starts and ends, which only fuzzy
+     searches look up.
+  '''
+  return trigrams("  " + token + " ")
+
+def approximateDistance(needle, text):
+  '''The fewest single character edits (insertions, deletions or
+     substitutions) turning @needle into a substring of @text.
+  '''
+  previous = [0] * (len(text) + 1)
+  for i, char in enumerate(needle, 1):
+    current = [i]
+    for j, textChar in enumerate(text, 1):
+      current.append(min(previous[j] + 1, current[j-1] + 1, previous[j-1] + (char != textChar)))
+    previous = current
+  return min(previous)
+
+def fuzzySimilarity(needle, text):
+  '''How closely @text contains @needle, from 0 to 1
+  '''
+  if not needle:
+    return 0.0
+  return 1.0 - float(approximateDistance(needle, text)) / len(needle)
+
+def fuzzyScore(needle, text):
+  '''The similarity of @text to @needle, with texts close to the length of
+     @needle ranked above longer ones containing it equally well.
+  '''
+  lengthRatio = float(min(len(needle), len(text))) / max(len(needle), len(text), 1)
+  return 0.9 * fuzzySimilarity(needle, text) + 0.1 * lengthRatio
+
+def searchableText(trackItem):
+  '''Read the searchable text of a track item from Hiero.
+     Returns a dictionary of field name to a list of strings.
+  '''
+  fields = { kNames : readNames(trackItem),
+             kTagNotes : readTagNotes(trackItem) }
+  fields[kMetadataItems] = readMetadataItems(trackItem)
+  fields[kMetadata] = [value for key, value in fields[kMetadataItems]]
+  return fields
+
+def parseKeyedSearch(searchText):
+  '''Split a "key:value" search into its metadata key and value.
+     Returns (None, @searchText) for any other search.
+  '''
+  match = _keyedSearchRegex.match(searchText)
+  if match is None:
+    return None, searchText
+  return match.group(1), match.group(2)
+
+def regexLiterals(pattern, flags=0):
+  '''Return the literal strings any match of the regular expression @pattern
+     must contain. These are used to narrow down the track items the regex
+     has to be run against. Raises re.error if the pattern is invalid.
+  '''
+  literals = []
+  toChar = unichr if isinstance(pattern, unicode) else chr
+  _collectLiterals(sre_parse.parse(pattern, flags), toChar, literals)
+  return literals
+
+def _collectLiterals(subpattern, toChar, literals):
+  run = []
+  for op, av in subpattern:
+    if op == sre_constants.LITERAL:
+      run.append(toChar(av))
+      continue
+
+    if run:
+      literals.append("".join(run))
+      run = []
+
+    if op == sre_constants.SUBPATTERN:
+      # Groups must match, so their literals are required too
+      _collectLiterals(av[-1], toChar, literals)
+    elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+      _collectLiterals(av[2], toChar, literals)
+
+  if run:
+    literals.append("".join(run))
+
+def uniqueTrackItems(sequence):
+  '''List the track items of @sequence, skipping items linked to one
+     already listed (e.g. the audio of a video track item).
+     Every track item is looked at once and its links recorded in a set,
+     rather than comparing it against the links of every item so far.
+  '''
+  trackItems = []
+  seen = set()
+  for track in sequence:
+    for ti in track:
+      if ti in seen:
+        continue
+      trackItems.append(ti)
+      seen.add(ti)
+      seen.update(ti.linkedItems())
+
+  return trackItems
+
+def fingerprint(trackItem):
+  '''A cheap summary of a track item, used to spot renamed shots, replaced
+     sources and added or removed tags without re-reading all of its text.
+  '''
+  return (trackItem.name(), trackItem.source().name(), len(trackItem.tags()))
+
+def readTrackItems(trackItems):
+  '''Read the searchable text and fingerprint of each of @trackItems.
+     This is the part of indexing that talks to Hiero, so it can be run on
+     the main thread while the rest of the indexing happens elsewhere.
+  '''
+  return [(searchableText(trackItem), fingerprint(trackItem)) for trackItem in trackItems]
+
+def snapshotEntries(snapshot, start, end):
+  '''What readTrackItems would return for the shots in rows @start to
+     @end of a HieroShotSnapshot.ShotSnapshot, without asking Hiero.
+  '''
+  entries = []
+  for row in range(start, end):
+    name = snapshot.value(row, "name")
+    sourceName = snapshot.value(row, "sourceName")
+    notes = snapshot.value(row, "notes")
+    items = snapshot.value(row, "metadata") + snapshot.value(row, "sourceMetadata")
+    fields = { kNames : [name, sourceName],
+               kTagNotes : notes,
+               kMetadataItems : items,
+               kMetadata : [value for key, value in items] }
+    entries.append((fields, (name, sourceName, len(snapshot.value(row, "tags")))))
+  return entries
+
+class Query(object):
+  '''A search compiled from the state of the Find dialog.
+     The search text is lowered or compiled into a regular expression once,
+     and the fields to look in are picked once, so checking a track item
+     involves no option handling.
+     A plain text metadata search for "key:value" only looks at the values
+     of that metadata key (matched exactly, or ignoring case). Regular
+     expressions and the other search options search for the text as it is.
+     Raises re.error for an invalid regular expression.
+  '''
+  def __init__(self, searchText, searchOption=kSearchAll, ignoreCase=False, useRegex=False):
+    self.searchText = searchText
+    self.searchOption = searchOption
+    self.ignoreCase = ignoreCase
+    self.useRegex = useRegex
+    self.fuzzy = searchOption == kSearchFuzzy
+    self.fields = kSearchFields.get(searchOption, kSearchFields[kSearchAll])
+    self.metadataKey = None
+    self.key = None
+    if searchOption == kSearchMetadata and not useRegex:
+      self.metadataKey, searchText = parseKeyedSearch(searchText)
+    if self.metadataKey is not None:
+      self.fields = (kMetadata,)
+      self.readers = []
+      key = self.key = self.metadataKey.lower() if ignoreCase else self.metadataKey
+      if ignoreCase:
+        self.matchesKey = lambda itemKey: itemKey.lower() == key
+      else:
+        self.matchesKey = lambda itemKey: itemKey == key
+    else:
+      self.readers = [kFieldReaders[field] for field in self.fields]
+
+    self.needle = None
+    if self.fuzzy:
+      # Fuzzy searches ignore case and compare word by word
+      self.needle = searchText.lower()
+      self.fragments = tokenize(searchText)
+      self.useRegex = False
+      def matchesTexts(texts):
+        return self.score(texts) >= kFuzzyThreshold
+    elif useRegex:
+      flags = re.IGNORECASE if ignoreCase else 0
+      search = re.compile(searchText, flags).search
+      self.fragments = []
+      for literal in regexLiterals(searchText, flags):
+        self.fragments += tokenize(literal)
+      def matchesTexts(texts):
+        for text in texts:
+          if search(text) is not None:
+            return True
+        return False
+    else:
+      # Plain text can't match across the strings of a field once they
+      # are joined with a character the search text doesn't contain
+      self.fragments = tokenize(searchText)
+      needle = self.needle = searchText.lower() if ignoreCase else searchText
+      separator = "\0" if "\0" not in needle else "\n"
+      if ignoreCase:
+        matchesTexts = lambda texts: needle in separator.join(texts).lower()
+      else:
+        matchesTexts = lambda texts: needle in separator.join(texts)
+    self.matchesTexts = matchesTexts
+
+  def score(self, texts):
+    '''The fuzzy score of the best matching of @texts, from 0 to 1.
+       Each word of the search text is matched against its closest word in
+       @texts, and the score is the average over the words searched for.
+    '''
+    tokens = []
+    for text in texts:
+      tokens += tokenize(text)
+    if not self.fragments or not tokens:
+      return 0.0
+    total = 0.0
+    for fragment in self.fragments:
+      total += max([fuzzyScore(fragment, token) for token in tokens])
+    return total / len(self.fragments)
+
+  def cacheKey(self):
+    '''What was searched for, for caching results
+    '''
+    return (self.searchText, self.searchOption, self.ignoreCase, self.useRegex)
+
+  def refines(self, previous):
+    '''Whether every match of this query is also a match of the @previous
+       one, so it can be answered by filtering the matches of @previous.
+       True when a plain text search extends the previous search text.
+    '''
+    if self.useRegex or previous.useRegex or self.fuzzy or previous.fuzzy:
+      return False
+    if self.ignoreCase != previous.ignoreCase or self.fields != previous.fields or self.key != previous.key:
+      return False
+    return previous.needle in self.needle
+
+  def matchesMetadataItems(self, items):
+    '''Whether the values of the searched key in the metadata @items match
+    '''
+    matchesKey = self.matchesKey
+    values = [value for key, value in items if matchesKey(key)]
+    return bool(values) and self.matchesTexts(values)
+
+  def matchesFields(self, fields):
+    '''Whether the text in @fields, as returned by searchableText, matches
+    '''
+    if self.metadataKey is not None:
+      return self.matchesMetadataItems(fields[kMetadataItems])
+    for field in self.fields:
+      if self.matchesTexts(fields[field]):
+        return True
+    return False
+
+  def matchesTrackItem(self, trackItem):
+    '''Whether @trackItem matches. Only the fields searched are read from
+       Hiero, and the rest are skipped once one of them matches.
+    '''
+    if self.metadataKey is not None:
+      return self.matchesMetadataItems(readMetadataItems(trackItem))
+    for reader in self.readers:
+      if self.matchesTexts(reader(trackItem)):
+        return True
+    return False
+
+def compileQuery(searchText, searchOption=kSearchAll, ignoreCase=False, useRegex=False):
+  return Query(searchText, searchOption, ignoreCase, useRegex)
+
+class TrackItemRecord(object):
+  '''The searchable text of one track item, as read when it was indexed.
+  '''
+  __slots__ = ("trackItem", "sequence", "position", "fields", "fingerprint")
+
+  def __init__(self, trackItem, sequence, position, fields, fingerprint):
+    self.trackItem = trackItem
+    self.sequence = sequence
+    self.position = position
+    self.fields = fields
+    self.fingerprint = fingerprint
+
+class TrackItemIndex(object):
+  '''Inverted index over the searchable text of the track items in a project.
+
+     Every field (names, metadata, tag notes) has its own index of word tokens
+     to track item ids. A plain text search splits the search text into tokens,
+     finds the indexed tokens containing them through a trigram index over the
+     token vocabulary, and then only checks the text of the track items those
+     tokens point at. Regular expressions are narrowed down the same way using
+     the literal text in the pattern.
+     Metadata values are also indexed by key, so a "key:value" search only
+     tests the distinct values of that key rather than every track item.
+     Hold the index's lock while using it from more than one thread.
+  '''
+  def __init__(self):
+    self.lock = threading.RLock()
+    # Incremented whenever the indexed contents change
+    self.generation = 0
+    self._nextId = 0
+    self._records = {}
+    self._ids = {}
+    self._sequences = {}
+    self._postings = {}
+    self._tokenGrams = {}
+    # metadata key -> value -> ids of the track items with that value
+    self._metadataValues = {}
+    for field in kSearchFields[kSearchAll]:
+      self._postings[field] = {}
+      self._tokenGrams[field] = {}
+
+  def __len__(self):
+    return len(self._records)
+
+  def hasSequence(self, sequence):
+    return sequence in self._sequences
+
+  def trackItemFields(self, trackItems):
+    '''The indexed text of those of @trackItems in this index, as a
+       dictionary of track item to the fields returned by searchableText.
+    '''
+    fields = {}
+    for trackItem in trackItems:
+      id = self._ids.get(trackItem)
+      if id is not None:
+        fields[trackItem] = self._records[id].fields
+    return fields
+
+  def sequenceTrackItems(self, sequence):
+    '''The indexed track items of @sequence in timeline order
+    '''
+    return [self._records[id].trackItem for id in self._sequences.get(sequence, [])]
+
+  def indexSequence(self, sequence, trackItems, entries=None):
+    '''(Re)index all @trackItems of @sequence.
+       @entries optionally holds what readTrackItems returned for them.
+    '''
+    self.removeSequence(sequence)
+    self._sequences[sequence] = []
+    for position, trackItem in enumerate(trackItems):
+      if entries is None:
+        self.indexTrackItem(trackItem, sequence, position)
+      else:
+        fields, itemFingerprint = entries[position]
+        self.indexTrackItem(trackItem, sequence, position, fields, itemFingerprint)
+
+  def updateSequence(self, sequence, trackItems):
+    '''Bring the index of @sequence up to date with its current @trackItems.
+       Track items that were added, or whose fingerprint changed, are read
+       again. Removed track items are dropped and the rest are only reordered.
+       Returns the number of track items that were (re)indexed or removed.
+    '''
+    if sequence not in self._sequences:
+      self.indexSequence(sequence, trackItems)
+      return len(self._sequences[sequence])
+
+    existing = {}
+    for id in self._sequences[sequence]:
+      existing[self._records[id].trackItem] = id
+
+    changed = 0
+    moved = False
+    self._sequences[sequence] = []
+    for position, trackItem in enumerate(trackItems):
+      id = existing.pop(trackItem, None)
+      if id is not None:
+        record = self._records[id]
+        if fingerprint(trackItem) == record.fingerprint:
+          moved = moved or record.position != position
+          record.position = position
+          self._sequences[sequence].append(id)
+          continue
+        self._removeRecord(id)
+      self.indexTrackItem(trackItem, sequence, position)
+      changed += 1
+
+    for id in existing.itervalues():
+      self._removeRecord(id)
+      changed += 1
+
+    if moved:
+      # Results are ordered by position, so reordering changes them too
+      self.generation += 1
+    return changed
+
+  def reindexTrackItem(self, trackItem):
+    '''Read the text of an already indexed @trackItem again. It is only
+       indexed again, and the generation only changes, if its text differs
+       from what was indexed. Returns whether it was indexed again.
+    '''
+    id = self._ids.get(trackItem)
+    if id is None:
+      return False
+    record = self._records[id]
+    fields = searchableText(trackItem)
+    itemFingerprint = fingerprint(trackItem)
+    if fields == record.fields and itemFingerprint == record.fingerprint:
+      return False
+    ids = self._sequences[record.sequence]
+    index = ids.index(id)
+    self._removeRecord(id)
+    self.indexTrackItem(trackItem, record.sequence, record.position, fields, itemFingerprint)
+    # indexTrackItem appends, put the new id where the old one was
+    ids[index] = ids.pop()
+    return True
+
+  def removeSequence(self, sequence):
+    for id in self._sequences.pop(sequence, []):
+      self._removeRecord(id)
+
+  def indexTrackItem(self, trackItem, sequence, position, fields=None, itemFingerprint=None):
+    '''Add a single track item to the index, replacing any existing entry.
+    '''
+    if trackItem in self._ids:
+      self.removeTrackItem(trackItem)
+
+    if fields is None:
+      fields = searchableText(trackItem)
+    if itemFingerprint is None:
+      itemFingerprint = fingerprint(trackItem)
+
+    id = self._nextId
+    self._nextId += 1
+    self.generation += 1
+    self._records[id] = TrackItemRecord(trackItem, sequence, position, fields, itemFingerprint)
+    self._ids[trackItem] = id
+    self._sequences.setdefault(sequence, []).append(id)
+
+    for key, value in fields[kMetadataItems]:
+      self._metadataValues.setdefault(key, {}).setdefault(value, set()).add(id)
+
+    for field, postings in self._postings.iteritems():
+      tokenGrams = self._tokenGrams[field]
+      for text in fields[field]:
+        for token in tokenize(text):
+          if token not in postings:
+            postings[token] = set()
+            for gram in tokenTrigrams(token):
+              tokenGrams.setdefault(gram, set()).add(token)
+          postings[token].add(id)
+
+    return id
+
+  def removeTrackItem(self, trackItem):
+    id = self._ids.get(trackItem)
+    if id is None:
+      return
+    record = self._records[id]
+    ids = self._sequences.get(record.sequence)
+    if ids and id in ids:
+      ids.remove(id)
+    self._removeRecord(id)
+
+  def _removeRecord(self, id):
+    self.generation += 1
+    record = self._records.pop(id)
+    if self._ids.get(record.trackItem) == id:
+      del self._ids[record.trackItem]
+
+    for key, value in record.fields[kMetadataItems]:
+      values = self._metadataValues.get(key)
+      if values is None or value not in values:
+        continue
+      values[value].discard(id)
+      if not values[value]:
+        del values[value]
+        if not values:
+          del self._metadataValues[key]
+
+    for field, postings in self._postings.iteritems():
+      tokenGrams = self._tokenGrams[field]
+      for text in record.fields[field]:
+        for token in tokenize(text):
+          ids = postings.get(token)
+          if ids is None:
+            continue
+          ids.discard(id)
+          if not ids:
+            # Nothing else uses this token, drop it from the vocabulary
+            del postings[token]
+            for gram in tokenTrigrams(token):
+              tokens = tokenGrams.get(gram)
+              if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                  del tokenGrams[gram]
+
+  def _containingTokens(self, field, fragment):
+    '''All indexed tokens of @field that contain @fragment
+    '''
+    postings = self._postings[field]
+    if len(fragment) < 3:
+      return [token for token in postings if fragment in token]
+
+    tokenGrams = self._tokenGrams[field]
+    gramSets = []
+    for gram in trigrams(fragment):
+      tokens = tokenGrams.get(gram)
+      if not tokens:
+        return []
+      gramSets.append(tokens)
+    gramSets.sort(key=len)
+    tokens = set(gramSets[0])
+    for other in gramSets[1:]:
+      tokens &= other
+    return [token for token in tokens if fragment in token]
+
+  def _metadataCandidates(self, query):
+    '''Ids of the track items with a value of the metadata key @query
+       searches for that matches it.
+    '''
+    ids = set()
+    for key, values in self._metadataValues.iteritems():
+      if not query.matchesKey(key):
+        continue
+      for value, valueIds in values.iteritems():
+        if query.matchesTexts([value]):
+          ids |= valueIds
+    return ids
+
+  def _similarTokens(self, field, fragment, limit=1000):
+    '''Indexed tokens of @field that share the most trigrams with @fragment,
+       the candidates for a fuzzy match. At most @limit are returned.
+       Trigrams found in most of the vocabulary (the common prefix of every
+       shot code, say) say little about how close a token is, so they are
+       only counted if nothing rarer is shared.
+    '''
+    postings = self._postings[field]
+    if len(fragment) < 3:
+      return [token for token in postings if fragment in token]
+
+    tokenGrams = self._tokenGrams[field]
+    gramTokens = [tokenGrams[gram] for gram in tokenTrigrams(fragment) if gram in tokenGrams]
+    common = len(postings) / 4
+    rare = [tokens for tokens in gramTokens if len(tokens) <= common]
+    shared = {}
+    for tokens in rare or gramTokens:
+      for token in tokens:
+        shared[token] = shared.get(token, 0) + 1
+    return heapq.nlargest(limit, shared, key=shared.get)
+
+  def rankQuery(self, sequences, query, limit=kFuzzyResults):
+    '''The best @limit fuzzy matches of @query in @sequences, as a list of
+       (score, scope order, position, track item) from best to worst.
+       Only tokens sharing trigrams with the search words are scored, not
+       every track item in scope.
+    '''
+    scope = {}
+    for order, sequence in enumerate(sequences):
+      if sequence in self._sequences:
+        scope.setdefault(sequence, order)
+
+    totals = {}
+    for fragment in query.fragments:
+      best = {}
+      for field in query.fields:
+        postings = self._postings[field]
+        for token in self._similarTokens(field, fragment):
+          score = fuzzyScore(fragment, token)
+          for id in postings[token]:
+            if score > best.get(id, 0.0):
+              best[id] = score
+      for id, score in best.iteritems():
+        totals[id] = totals.get(id, 0.0) + score
+
+    ranked = []
+    for id, total in totals.iteritems():
+      score = total / len(query.fragments)
+      record = self._records[id]
+      if score >= kFuzzyThreshold and record.sequence in scope:
+        ranked.append((score, scope[record.sequence], record.position, record.trackItem))
+    return heapq.nsmallest(limit, ranked, key=lambda match: (-match[0], match[1], match[2]))
+
+  def _candidates(self, field, fragments):
+    '''Ids of the track items whose @field text contains every fragment.
+       Returns None if the fragments can't narrow the search down.
+    '''
+    candidates = None
+    for fragment in set(fragments):
+      ids = set()
+      postings = self._postings[field]
+      for token in self._containingTokens(field, fragment):
+        ids |= postings[token]
+      candidates = ids if candidates is None else candidates & ids
+      if not candidates:
+        return candidates
+    return candidates
+
+  def search(self, sequences, searchText, searchOption=kSearchAll, ignoreCase=False, useRegex=False):
+    '''Find the track items in @sequences matching @searchText.
+       Raises re.error for an invalid regular expression.
+       Returns the matching track items in sequence and timeline order.
+    '''
+    return self.searchQuery(sequences, compileQuery(searchText, searchOption, ignoreCase, useRegex))
+
+  def searchQuery(self, sequences, query):
+    '''Find the track items in @sequences matching the compiled @query.
+       Fuzzy matches come best first, others in sequence and timeline order.
+    '''
+    if query.fuzzy:
+      return [match[3] for match in self.rankQuery(sequences, query)]
+
+    scope = {}
+    for order, sequence in enumerate(sequences):
+      if sequence in self._sequences:
+        scope.setdefault(sequence, order)
+
+    results = []
+    if query.metadataKey is not None:
+      # The value index has already checked the values of every candidate
+      for id in self._metadataCandidates(query):
+        record = self._records[id]
+        if record.sequence in scope:
+          results.append((scope[record.sequence], record.position, record.trackItem))
+    else:
+      candidates = set()
+      for field in query.fields:
+        ids = self._candidates(field, query.fragments) if query.fragments else None
+        if ids is None:
+          # Nothing to narrow down with, every track item in scope is a candidate
+          ids = set()
+          for sequence in scope:
+            ids.update(self._sequences[sequence])
+        candidates |= ids
+
+      for id in candidates:
+        record = self._records[id]
+        if record.sequence not in scope:
+          continue
+        if query.matchesFields(record.fields):
+          results.append((scope[record.sequence], record.position, record.trackItem))
+
+    results.sort(key=lambda result: result[:2])
+    return [result[2] for result in results]
+
+class TagIndex(object):
+  '''Posting lists of tag name to the ids of the track items carrying it,
+     so the tag filter can be answered with set intersections and
+     differences instead of comparing the tags of every track item.
+  '''
+  def __init__(self):
+    self._nextId = 0
+    self._ids = {}
+    self._tagNames = {}
+    self._sequences = {}
+    self._postings = {}
+    self._icons = {}
+
+  def hasSequence(self, sequence):
+    return sequence in self._sequences
+
+  def sequences(self):
+    return self._sequences.keys()
+
+  def updateSequence(self, sequence, trackItems):
+    '''Read the tags of @trackItems, replacing what was known about @sequence.
+    '''
+    self.removeSequence(sequence)
+    ids = []
+    for trackItem in trackItems:
+      tags = trackItem.tags()
+      if not tags:
+        continue
+
+      id = self._nextId
+      self._nextId += 1
+      names = []
+      for tag in tags:
+        name = tag.name()
+        names.append(name)
+        self._postings.setdefault(name, set()).add(id)
+        if name not in self._icons:
+          self._icons[name] = tag.icon()
+      self._ids[trackItem] = id
+      self._tagNames[id] = (trackItem, names)
+      ids.append(id)
+
+    self._sequences[sequence] = ids
+
+  def removeSequence(self, sequence):
+    for id in self._sequences.pop(sequence, []):
+      trackItem, names = self._tagNames.pop(id)
+      if self._ids.get(trackItem) == id:
+        del self._ids[trackItem]
+      for name in names:
+        ids = self._postings.get(name)
+        if ids is None:
+          continue
+        ids.discard(id)
+        if not ids:
+          del self._postings[name]
+          self._icons.pop(name, None)
+
+  def tagNames(self):
+    return self._postings.keys()
+
+  def count(self, tagName):
+    '''The number of track items tagged with @tagName
+    '''
+    return len(self._postings.get(tagName, ()))
+
+  def icon(self, tagName):
+    return self._icons.get(tagName)
+
+  def trackItemTags(self, trackItem):
+    id = self._ids.get(trackItem)
+    if id is None:
+      return []
+    return self._tagNames[id][1]
+
+  def matchingIds(self, include, exclude=(), matchAll=True):
+    '''Ids of the track items tagged with all (or with @matchAll False, any)
+       of the @include tag names and none of the @exclude tag names.
+    '''
+    if not include:
+      return set()
+
+    postings = [self._postings.get(name, set()) for name in set(include)]
+    if matchAll:
+      postings.sort(key=len)
+      ids = set(postings[0])
+      for other in postings[1:]:
+        ids &= other
+    else:
+      ids = set()
+      for other in postings:
+        ids |= other
+
+    for name in set(exclude):
+      if not ids:
+        break
+      ids -= self._postings.get(name, set())
+    return ids
+
+  def filter(self, trackItems, include, exclude=(), matchAll=True):
+    '''The items of @trackItems matching the tag filter, in the same order.
+    '''
+    ids = self.matchingIds(include, exclude, matchAll)
+    if not ids:
+      return []
+    return [trackItem for trackItem in trackItems if self._ids.get(trackItem) in ids]
+
+class SearchResultCache(object):
+  '''The matches of recent searches, least recently used dropped first.
+     Entries are stored with a stamp saying what state the project was in,
+     such as the generations of the indexes searched, and are only returned
+     while that stamp still holds. At most @maxEntries searches and
+     @maxMatches matches in all are kept.
+  '''
+  def __init__(self, maxEntries=20, maxMatches=100000):
+    self.maxEntries = maxEntries
+    self.maxMatches = maxMatches
+    self._entries = OrderedDict()
+    self._matchCount = 0
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._entries)
+
+  def get(self, key, stamp):
+    '''The matches cached for @key, or None if there aren't any for @stamp
+    '''
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is None:
+        return None
+      if entry[0] != stamp:
+        self._matchCount -= len(entry[1])
+        return None
+      self._entries[key] = entry
+      return list(entry[1])
+
+  def put(self, key, stamp, matches):
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is not None:
+        self._matchCount -= len(entry[1])
+      if len(matches) > self.maxMatches:
+        return
+      self._entries[key] = (stamp, tuple(matches))
+      self._matchCount += len(matches)
+      while len(self._entries) > self.maxEntries or self._matchCount > self.maxMatches:
+        oldKey, oldEntry = self._entries.popitem(last=False)
+        self._matchCount -= len(oldEntry[1])
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._matchCount = 0
+
+# Shared by the Find panel and the status bar Find
+resultCache = SearchResultCache()
+
+def indexStamp(indexes):
+  '''A result cache stamp that holds until any of @indexes change
+  '''
+  return tuple([(index, index.generation) for index in indexes])
+
+def rememberSearch(history, searchText, size=kSearchHistorySize):
+  '''Move @searchText to the end of @history, a list of recent searches
+     oldest first, dropping the oldest searches beyond @size.
+  '''
+  if searchText in history:
+    history.remove(searchText)
+  history.append(searchText)
+  del history[:-size]
+
+# One index per project, built the first time a project is searched.
+# Searches may run on worker threads: hold indexLock while looking indexes up
+# or discarding them, and the lock of an index while reading or changing it.
+# Never take indexLock while holding the lock of an index.
+_projectIndexes = {}
+indexLock = threading.RLock()
+
+def projectIndex(project):
+  '''Return the search index for @project, creating an empty one if needed.
+  '''
+  with indexLock:
+    if project not in _projectIndexes:
+      _projectIndexes[project] = TrackItemIndex()
+    return _projectIndexes[project]
+
+def discardProjectIndex(project):
+  with indexLock:
+    if _projectIndexes.pop(project, None) is not None:
+      # Cached results may hold track items of the discarded index
+      resultCache.clear()
+
+def indexedProjects():
+  with indexLock:
+    return _projectIndexes.keys()
+
+def sequenceIndexes(sequences):
+  '''The indexes of the projects of @sequences, each listed once
+  '''
+  indexes = []
+  for sequence in sequences:
+    index = projectIndex(sequence.project())
+    if index not in indexes:
+      indexes.append(index)
+  return indexes
+
+def searchSequence(index, sequence, query, trackItems=None, entries=None):
+  '''Search @sequence in its project's @index with the compiled @query.
+     A sequence that isn't indexed yet is first indexed from @trackItems and
+     the @entries readTrackItems returned for them, if given. With no @query
+     the sequence is only indexed.
+     Safe to call from any thread, it only uses the data it is given.
+  '''
+  with index.lock:
+    if trackItems is not None and not index.hasSequence(sequence):
+      index.indexSequence(sequence, trackItems, entries)
+    if query is None:
+      return []
+    return index.searchQuery([sequence], query)
+
+def rankSequences(shards, query, limit=kFuzzyResults):
+  '''The best @limit fuzzy matches of @query across @shards, a list of
+     (sequence, index) pairs, from best to worst. Every sequence must
+     already be indexed.
+  '''
+  sequences = [sequence for sequence, index in shards]
+  indexes = []
+  for sequence, index in shards:
+    if index not in indexes:
+      indexes.append(index)
+  ranked = []
+  for index in indexes:
+    with index.lock:
+      ranked += index.rankQuery(sequences, query, limit)
+  best = heapq.nsmallest(limit, ranked, key=lambda match: (-match[0], match[1], match[2]))
+  return [match[3] for match in best]
+
+def refineTrackItems(trackItems, query, indexes):
+  '''The @trackItems found by an earlier search of @indexes that also match
+     @query, in the same order. Their text is checked as it was indexed, so
+     nothing is read from Hiero. Track items no longer indexed are dropped.
+  '''
+  fields = {}
+  for index in indexes:
+    with index.lock:
+      fields.update(index.trackItemFields(trackItems))
+  return [trackItem for trackItem in trackItems if trackItem in fields and query.matchesFields(fields[trackItem])]
+
+def findTrackItems(sequences, searchText, searchOption, ignoreCase, useRegex, collect):
+  '''Search the track items of @sequences using the per project indexes.
+     Sequences that have not been indexed yet are indexed first using
+     @collect(sequence) to list their track items.
+  '''
+  query = compileQuery(searchText, searchOption, ignoreCase, useRegex)
+  matches = []
+  for sequence in sequences:
+    index = projectIndex(sequence.project())
+    with index.lock:
+      if not index.hasSequence(sequence):
+        index.indexSequence(sequence, collect(sequence))
+      matches += index.searchQuery([sequence], query)
+  return matches
@@ -0,0 +1,243 @@
+# HieroFindNavigation.py
+# Keeps track of the open Viewers and Timeline Editors and the sequences they
+# show, so the Find tools (HieroFindWidget.py and HieroStatusBarFind.py) can
+# go to a shot without scanning every widget in the application, focusing each
+# Viewer in turn to ask it what it is showing, or cycling through the panes
+# until a Timeline Editor comes up.
+
+import hiero.core
+import hiero.ui
+
+class SequenceViews(object):
+  '''Views of one kind (Viewers or Timeline Editors) and the sequence each
+     one shows. @sequenceOf(view) returns the sequence a view is showing.
+     A sequence can be shown in more than one view, the view that showed it
+     most recently is used. Entries are checked when they are looked up, and
+     dropped if the view has been closed or has moved on to another sequence.
+  '''
+  def __init__(self, sequenceOf):
+    self._sequenceOf = sequenceOf
+    self._sequences = {}
+    # Sequence to the views showing it, the most recently shown last
+    self._views = {}
+
+  def viewShown(self, view):
+    '''Record what @view is showing. Call whenever it is shown or its
+       sequence changes.
+    '''
+    try:
+      sequence = self._sequenceOf(view)
+    except:
+      # The view has been closed
+      sequence = None
+
+    self.removeView(view)
+    if isinstance(sequence, hiero.core.Sequence):
+      self._sequences[view] = sequence
+      self._views.setdefault(sequence, []).append(view)
+
+  def removeView(self, view):
+    sequence = self._sequences.pop(view, None)
+    views = self._views.get(sequence)
+    if views is not None and view in views:
+      views.remove(view)
+      if not views:
+        del self._views[sequence]
+
+  def isShowing(self, view, sequence):
+    try:
+      return self._sequenceOf(view) == sequence
+    except:
+      return False
+
+  def viewForSequence(self, sequence):
+    '''The view that most recently showed @sequence and still does, or None
+    '''
+    for view in reversed(self._views.get(sequence, [])):
+      if self.isShowing(view, sequence):
+        return view
+      # Closed or showing something else now
+      self.viewShown(view)
+    return None
+
+  def views(self):
+    '''All views showing a sequence
+    '''
+    for view, sequence in self._sequences.items():
+      if not self.isShowing(view, sequence):
+        self.viewShown(view)
+    return self._sequences.keys()
+
+  def sequences(self):
+    '''The sequences shown, each listed once
+    '''
+    sequences = []
+    for view in self.views():
+      if self._sequences[view] not in sequences:
+        sequences.append(self._sequences[view])
+    return sequences
+
+class ViewerRegistry(object):
+  '''The open Viewers and Timeline Editors and the sequence each one shows.
+
+     Viewers report the sequence they show through the kPlaybackClipChanged
+     event and Timeline Editors through kSelectionChanged. The current Viewer
+     and the active view are also recorded again whenever the registry is
+     asked, so the view the user last worked in is the one used for its
+     sequence. Views are forgotten when their window is destroyed, and a
+     Timeline Editor that can't be found is asked for from Hiero directly.
+  '''
+  def __init__(self):
+    self._viewers = SequenceViews(lambda viewer: viewer.player().sequence())
+    self._timelineEditors = SequenceViews(lambda editor: editor.sequence())
+    self._watchedViews = set()
+    self._findPanel = None
+
+    hiero.core.events.registerInterest(hiero.core.events.EventType.kPlaybackClipChanged, self.viewerChanged)
+    hiero.core.events.registerInterest(hiero.core.events.EventType.kSelectionChanged, self.selectionChanged)
+
+  def _viewShown(self, views, view):
+    views.viewShown(view)
+    if view in self._watchedViews:
+      return
+    self._watchedViews.add(view)
+    def viewClosed(*args):
+      views.removeView(view)
+      self._watchedViews.discard(view)
+    try:
+      view.window().destroyed.connect(viewClosed)
+    except:
+      # Not a widget we can watch, closed views are dropped when looked up
+      pass
+
+  def viewerChanged(self, event):
+    viewer = event.sender
+    if isinstance(viewer, hiero.ui.Viewer):
+      self._viewShown(self._viewers, viewer)
+
+  def selectionChanged(self, event):
+    view = event.sender
+    if isinstance(view, hiero.ui.TimelineEditor):
+      self._viewShown(self._timelineEditors, view)
+
+  def viewerShown(self, viewer):
+    '''Record what @viewer is showing. Call after changing its sequence.
+    '''
+    self._viewShown(self._viewers, viewer)
+
+  def timelineEditorClosed(self, editor):
+    '''Forget @editor, e.g. after finding it can't be used any more
+    '''
+    self._timelineEditors.removeView(editor)
+
+  def _addCurrentViews(self):
+    viewer = hiero.ui.currentViewer()
+    if viewer is not None:
+      self._viewShown(self._viewers, viewer)
+    activeView = hiero.ui.activeView()
+    if isinstance(activeView, hiero.ui.TimelineEditor):
+      self._viewShown(self._timelineEditors, activeView)
+
+  def viewerForSequence(self, sequence):
+    '''The Viewer showing @sequence, or None
+    '''
+    self._addCurrentViews()
+    return self._viewers.viewForSequence(sequence)
+
+  def timelineEditorForSequence(self, sequence):
+    '''The Timeline Editor showing @sequence, or None
+    '''
+    self._addCurrentViews()
+    editor = self._timelineEditors.viewForSequence(sequence)
+    if editor is None and hasattr(hiero.ui, "getTimelineEditor"):
+      # Newer versions of Hiero can tell us directly
+      editor = hiero.ui.getTimelineEditor(sequence)
+      if editor is not None:
+        self._viewShown(self._timelineEditors, editor)
+    return editor
+
+  def searchTimelineEditor(self, sequence):
+    '''Look through the active view and the windows of the window manager
+       for a Timeline Editor showing @sequence, e.g. one that was just
+       opened and hasn't reported a selection yet. Returns it or None.
+    '''
+    views = [hiero.ui.activeView()]
+    try:
+      views += hiero.ui.windowManager().windows()
+    except:
+      pass
+    for view in views:
+      if isinstance(view, hiero.ui.TimelineEditor) and self._timelineEditors.isShowing(view, sequence):
+        self._viewShown(self._timelineEditors, view)
+        return view
+    return None
+
+  def openViewers(self):
+    '''All Viewers showing a sequence
+    '''
+    self._addCurrentViews()
+    return self._viewers.views()
+
+  def openSequences(self):
+    '''The sequences shown in a Viewer, each listed once
+    '''
+    self._addCurrentViews()
+    return self._viewers.sequences()
+
+  def registerFindPanel(self, panel):
+    self._findPanel = panel
+
+  def findPanel(self):
+    '''The Find panel, if it has been created
+    '''
+    return self._findPanel
+
+viewerRegistry = ViewerRegistry()
+
+def viewerForSequence(sequence):
+  return viewerRegistry.viewerForSequence(sequence)
+
+def timelineEditorForSequence(sequence):
+  return viewerRegistry.timelineEditorForSequence(sequence)
+
+def openViewers():
+  return viewerRegistry.openViewers()
+
+def openSequences():
+  return viewerRegistry.openSequences()
+
+def goToShot(trackItem):
+  '''Show @trackItem: load its sequence in a Viewer if none is showing it,
+     move the playhead to its start and select it and its linked items in
+     the Timeline Editor for its sequence.
+     The Timeline Editor is looked up rather than found by cycling through
+     the panes, and nothing is edited, so the sequence is not refreshed.
+     One opened for it is searched for in the active view and the windows
+     of the window manager if it hasn't been seen yet.
+  '''
+  sequence = trackItem.parentSequence()
+
+  viewer = viewerForSequence(sequence)
+  if viewer is None:
+    viewer = hiero.ui.currentViewer()
+    viewer.player().setSequence(sequence)
+    viewerRegistry.viewerShown(viewer)
+  viewer.setTime(trackItem.timelineIn())
+
+  editor = timelineEditorForSequence(sequence)
+  if editor is None:
+    # No Timeline Editor is showing this sequence, so open one
+    hiero.ui.findMenuAction("Show Timeline Editor").trigger()
+    editor = timelineEditorForSequence(sequence) or viewerRegistry.searchTimelineEditor(sequence)
+
+  # Look again if the editor turns out to have been closed since it was checked
+  for attempt in range(2):
+    if editor is None:
+      return False
+    try:
+      editor.setSelection(trackItem.linkedItems())
+      return True
+    except:
+      viewerRegistry.timelineEditorClosed(editor)
+      editor = timelineEditorForSequence(sequence) or viewerRegistry.searchTimelineEditor(sequence)
+  return False
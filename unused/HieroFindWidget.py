@@ -15,6 +15,13 @@ from hiero.ui.nuke_bridge.send_to_nuke import *
 from hiero.ui.nuke_bridge.hiero_state import *
 import re
 import ast
+import traceback
+from multiprocessing.pool import ThreadPool
+import HieroFindIndex
+import HieroProjectTracker
+import HieroFindNavigation
+import HieroTagPresets
+import HieroTrackOccupancy
 
 class FindAction(QAction):
   def __init__(self):
@@ -32,21 +39,16 @@ class FindAction(QAction):
           if sub.text() == "Find":
             sub.trigger()
 
-    for widget in QApplication.allWidgets():
-      try:
-        if widget.windowTitle() == "Find":
-          widget.setFocus()
-          for child in widget.findChildren(QWidget):
-            if child.objectName() == "tagfilterbox":
-              child.populateFromTags()
-          for child in widget.findChildren(QLineEdit):
-            if child.objectName() == "searchTextField":
-              child.setFocus()
-          break
-      except:
-        pass
+    findPanel = HieroFindNavigation.viewerRegistry.findPanel()
+    if findPanel is not None:
+      findPanel.setFocus()
+      findPanel.tagbox.populateFromTags()
+      findPanel.searchTextField.setFocus()
 
   class FindDialog(QWidget):
+    # Milliseconds to wait after a key press before searching
+    kSearchDelay = 250
+
     def __init__(self):
       QWidget.__init__( self )
 
@@ -66,18 +68,21 @@ class FindAction(QAction):
 
       self.searchTextField = SearchTextField()
       self.searchTextField.setObjectName("searchTextField")
-      self.searchTextField.setToolTip("Enter Text to Search For")
+      self.searchTextField.setToolTip("Enter Text to Search For.\
+                                      \nWith Search Metadata, use key:value to search one metadata key, e.g. foundry.edl.sourceReel:A012")
       self.horizontalSearchFieldLayout.addWidget(self.searchTextField)
       self.searchTextField.returnPressed.connect(self.findMatches)
       self.searchTextList = []
 
       self.searchOptionsComboBox = QComboBox(self)
       self.searchOptionsComboBox.setObjectName("searchOptionsComboBox")
-      self.searchOptionsComboBox.setToolTip("Search for Text in Shot Names, Metadata, Tag Notes, or All")
+      self.searchOptionsComboBox.setToolTip("Search for Text in Shot Names, Metadata, Tag Notes, or All.\
+                                            \nFuzzy Search Names finds the closest shot and source names, best first, even if misspelled.")
       self.searchOptionsComboBox.addItem("Search All")
       self.searchOptionsComboBox.addItem("Search Names")
       self.searchOptionsComboBox.addItem("Search Metadata")
       self.searchOptionsComboBox.addItem("Search Tag Notes")
+      self.searchOptionsComboBox.addItem("Fuzzy Search Names")
 
       self.horizontalSearchFieldLayout.addWidget(self.searchOptionsComboBox)
       self.gridLayout.addLayout(self.horizontalSearchFieldLayout, 0, 0, 1, 1)
@@ -183,31 +188,42 @@ class FindAction(QAction):
       self.horizontalStatus = QHBoxLayout()
       self.horizontalStatus.setObjectName("horizontalStatus")
 
-      self.tableWidget = QTableWidget(self)
-      self.tableWidget.setObjectName("tableWidget")
-      self.tableWidget.setToolTip("Double click a result or press Return/Enter to jump to the shot in the Timeline.\
+      # Results are kept in a model and only the rows on screen are drawn
+      self.resultsModel = FindResultsModel(self)
+      self.resultsProxyModel = QSortFilterProxyModel(self)
+      self.resultsProxyModel.setSourceModel(self.resultsModel)
+      self.resultsProxyModel.setDynamicSortFilter(True)
+
+      self.resultsView = QTableView(self)
+      self.resultsView.setObjectName("resultsView")
+      self.resultsView.setModel(self.resultsProxyModel)
+      self.resultsView.setToolTip("Double click a result or press Return/Enter to jump to the shot in the Timeline.\
                                   \nSelect one or more clips and right click to:\
                                   \n   -Open in Nuke\
                                   \n   -Build Track\
                                   \n   -Create New Sequence from Selection")
-      self.tableWidget.setSelectionBehavior(QAbstractItemView.SelectRows)
-      self.tableWidget.setAlternatingRowColors(True)
-      self.tableWidget.setSortingEnabled(True)
-      self.tableWidget.doubleClicked.connect(self.goToResult)
-      #self.tableWidget.itemSelectionChanged.connect(self.resultSelectionChanged)
-      self.tableWidget.clicked.connect(self.resultSelectionChanged)
-      self.tableWidget.verticalHeader().hide()
-      self.tableWidget.horizontalHeader().sectionClicked.connect(self.sortResultColumn)
-      self.tableWidget.setContextMenuPolicy(Qt.CustomContextMenu)
-      self.tableWidget.connect(self.tableWidget, SIGNAL("customContextMenuRequested(QPoint)"), self.resultsListContextMenu)
-      self.tableHeader = self.tableWidget.horizontalHeader()
+      self.resultsView.setSelectionBehavior(QAbstractItemView.SelectRows)
+      self.resultsView.setAlternatingRowColors(True)
+      self.resultsView.doubleClicked.connect(self.goToResult)
+      self.resultsView.clicked.connect(self.resultSelectionChanged)
+      self.resultsView.verticalHeader().hide()
+      self.resultsView.verticalHeader().setDefaultSectionSize(16)
+      self.resultsView.setContextMenuPolicy(Qt.CustomContextMenu)
+      self.resultsView.connect(self.resultsView, SIGNAL("customContextMenuRequested(QPoint)"), self.resultsListContextMenu)
+      self.tableHeader = self.resultsView.horizontalHeader()
+      self.tableHeader.setStretchLastSection(True)
+      self.tableHeader.setMinimumSectionSize(20)
+      self.tableHeader.setSortIndicator(0, Qt.AscendingOrder)
+      self.tableHeader.setSortIndicatorShown(True)
+      self.tableHeader.sectionClicked.connect(self.sortResultColumn)
+      self.resultsView.setSortingEnabled(True)
 
       keyPressRedirect = FindResultsKeyPressRedirect(self)
-      self.tableWidget.installEventFilter(keyPressRedirect)
+      self.resultsView.installEventFilter(keyPressRedirect)
 
       self.horizontalTableLayout = QHBoxLayout()
       self.horizontalTableLayout.setObjectName("horizontalTableLayout")
-      self.horizontalTableLayout.addWidget(self.tableWidget)
+      self.horizontalTableLayout.addWidget(self.resultsView)
 
       self.statusbar = QLabel()
       self.statusbar.setText("Ready")
@@ -222,6 +238,28 @@ class FindAction(QAction):
 
       self.currentMatchNumber = 0
       self.matchList = []
+      self.findWorker = None
+      self.findWorkers = []
+      self.goToFirstMatch = True
+      self.rawMatches = []
+      # (query, sequences, indexes, index generations) of the last finished search
+      self.lastSearch = None
+
+      # Search as you type, once typing has paused
+      self.searchTimer = QTimer(self)
+      self.searchTimer.setSingleShot(True)
+      self.searchTimer.setInterval(self.kSearchDelay)
+      self.searchTimer.timeout.connect(self.liveSearch)
+
+      # Changing what to search for stops the search in progress
+      self.searchTextField.textEdited.connect(self.cancelSearch)
+      self.searchTextField.textEdited.connect(self.searchTextEdited)
+      self.searchOptionsComboBox.currentIndexChanged.connect(self.cancelSearch)
+      self.ignoreCase.toggled.connect(self.cancelSearch)
+      self.useRegex.toggled.connect(self.cancelSearch)
+      self.searchCurrent.clicked.connect(self.cancelSearch)
+      self.searchAllOpen.clicked.connect(self.cancelSearch)
+      self.searchAllInProject.clicked.connect(self.cancelSearch)
 
       self.retranslateUI()
       self.nextTabAction = hiero.ui.findMenuAction("Next Tab")
@@ -239,6 +277,8 @@ class FindAction(QAction):
       self.findNextAction.setEnabled(False)
       self.findPreviousAction.setEnabled(False)
 
+      HieroFindNavigation.viewerRegistry.registerFindPanel(self)
+
     def retranslateUI(self):
       '''Populate the UI from saved settings.
          Must be done outside of the init to set focus correctly.
@@ -301,7 +341,7 @@ class FindAction(QAction):
       menu = QMenu("Menu", self)
       menu.addAction(openInNuke, title="Open in Nuke...")
       submenu = menu.addMenu("Build Track")
-      if not len(self.tableWidget.selectedIndexes()):
+      if not self.hasSelectedResults():
         submenu.setEnabled(False)
 
       submenu.addAction(buildFromStructure, title="From Export Structure")
@@ -314,7 +354,8 @@ class FindAction(QAction):
       '''Save some recent searches like Google
       '''
       searchmodel = QStandardItemModel()
-      for i, word in enumerate(set(self.searchTextList)):
+      # Most recent first
+      for i, word in enumerate(reversed(self.searchTextList)):
         item = QStandardItem(word)
         searchmodel.setItem(i, 0, item)
 
@@ -364,32 +405,11 @@ class FindAction(QAction):
       if not self.useTagFilter.isChecked() and isinstance(self.sender(), QCheckBox):
         if self.sender().objectName() != "useTagFilter":
           return
-      self.updateStatusBar("Searching...")
-      self.matchList = []
-      self.currentMatchNumber = 0
-
-      if self.searchCurrent.isChecked():
-        trackItemList = []
-        cv = hiero.ui.currentViewer()
-        player = cv.player()
-        sequence = player.sequence()
-        if isinstance(sequence, hiero.core.Sequence):
-          trackItemList = self.trackItems(sequence)
-
-      if self.searchAllOpen.isChecked():
-        trackItemList = self.allTrackItems(onlyOpen=True)
-      if self.searchAllInProject.isChecked():
-        trackItemList = self.allTrackItems()
+      self.searchTimer.stop()
 
       searchText = self.searchTextField.text().encode("utf-8")
       if searchText:
-        if len(self.searchTextList) == 10:
-          self.searchTextList.pop(0)
-        if searchText not in self.searchTextList:
-          self.searchTextList.append(searchText)
-        else:
-          self.searchTextList.pop(self.searchTextList.index(searchText))
-          self.searchTextList.append(searchText)
+        HieroFindIndex.rememberSearch(self.searchTextList, searchText)
         self.loadAutocompleter()
 
       settings = hiero.core.ApplicationSettings()
@@ -401,256 +421,213 @@ class FindAction(QAction):
       except:
         pass
 
-      for trackItem in trackItemList:
-        matchName = trackItem.name()
-        matchSourceName = trackItem.source().name()
-        matchMetadata = trackItem.metadata()
-        matchSourceMetadata = trackItem.source().metadata()
-        tagText = [item.note() for item in trackItem.tags()]
-
-        if self.ignoreCase.isChecked() and self.useRegex.isChecked():
-          try:
-            regex = re.compile(searchText, re.IGNORECASE)
-          except Exception as e:
-            self.updateStatusBar("Invalid regex: %s" % str(e))
-            regex = None
-
-        if not self.ignoreCase.isChecked() and self.useRegex.isChecked():
-          try:
-            regex = re.compile(searchText)
-          except Exception as e:
-            self.updateStatusBar("Invalid regex: %s" % str(e))
-            regex = None
-
-        if self.searchOptionsComboBox.currentText() == "Search Names":
-          if self.ignoreCase.checkState() == Qt.Checked:
-            if self.useRegex.isChecked():
-              if regex:
-                nameMatch = regex.search(trackItem.name().lower())
-                sourceNameMatch = regex.search(trackItem.source().name().lower())
-                if nameMatch or sourceNameMatch:
-                  self.matchList.append(trackItem)
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-              for ref in [matchName, matchSourceName]:
-                if searchText.lower() in ref.lower():
-                  self.matchList.append(trackItem)
-                  break
-          else:
-            if self.useRegex.isChecked():
-              if regex:
-                nameMatch = regex.search(trackItem.name())
-                sourceNameMatch = regex.search(trackItem.source().name())
-                if nameMatch or sourceNameMatch:
-                  self.matchList.append(trackItem)
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-              for ref in [matchName, matchSourceName]:
-                if searchText in ref:
-                  self.matchList.append(trackItem)
-                  break
-
-        if self.searchOptionsComboBox.currentText() == "Search Metadata":
-          if self.ignoreCase.isChecked():
-            if self.useRegex.isChecked():
-              if regex:
-                metaMatch = regex.search(str(matchMetadata).lower())
-                sourcemetaMatch = regex.search(str(matchSourceMetadata).lower())
-                if metaMatch or sourcemetaMatch:
-                  self.matchList.append(trackItem)
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-              for ref in [str(matchMetadata), str(matchSourceMetadata)]:
-                if searchText.lower() in ref.lower():
-                  self.matchList.append(trackItem)
-                  break
-          else:
-            if self.useRegex.isChecked():
-              if regex:
-                metaMatch = regex.search(str(matchMetadata))
-                sourcemetaMatch = regex.search(str(matchSourceMetadata))
-                if metaMatch or sourcemetaMatch:
-                  self.matchList.append(trackItem)
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-              for ref in [str(matchMetadata), str(matchSourceMetadata)]:
-                if searchText in ref:
-                  self.matchList.append(trackItem)
-                  break
-
-        if self.searchOptionsComboBox.currentText() == "Search All":
-          if self.ignoreCase.isChecked():
-            if self.useRegex.isChecked():
-              if regex:
-                nameMatch = regex.search(trackItem.name().lower())
-                sourceNameMatch = regex.search(trackItem.source().name().lower())
-                metaMatch = regex.search(str(matchMetadata).lower())
-                sourcemetaMatch = regex.search(str(matchSourceMetadata).lower())
-                tagMatch = None
-                for tag in trackItem.tags():
-                  tagMatch = regex.search(tag.note().lower())
-                  if tagMatch:
-                    break
-                if nameMatch or sourceNameMatch or metaMatch or sourcemetaMatch or tagMatch:
-                  self.matchList.append(trackItem)
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-              for ref in [matchName, matchSourceName, str(matchMetadata), str(matchSourceMetadata)]:
-                if searchText.lower() in ref.lower():
-                  self.matchList.append(trackItem)
-                  matchFound = True
-                  break
-                else:
-                  matchFound = False
-              if not matchFound:
-                for tag in trackItem.tags():
-                  if searchText.lower() in tag.note().lower():
-                    self.matchList.append(trackItem)
-                    break
-          else:
-            if self.useRegex.isChecked():
-              if regex:
-                nameMatch = regex.search(trackItem.name())
-                sourceNameMatch = regex.search(trackItem.source().name())
-                metaMatch = regex.search(str(matchMetadata))
-                sourcemetaMatch = regex.search(str(matchSourceMetadata))
-                tagMatch = None
-                for tag in trackItem.tags():
-                  tagMatch = regex.search(tag.note())
-                  if tagMatch:
-                    break
-                if nameMatch or sourceNameMatch or metaMatch or sourcemetaMatch or tagMatch:
-                  self.matchList.append(trackItem)
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-              for ref in [matchName, matchSourceName, str(matchMetadata), str(matchSourceMetadata)]:
-                if searchText in ref:
-                  self.matchList.append(trackItem)
-                  matchFound = True
-                  break
-                else:
-                  matchFound = False
-              if not matchFound:
-                for tag in trackItem.tags():
-                  if searchText in tag.note():
-                    self.matchList.append(trackItem)
-                    break
-
-        if self.searchOptionsComboBox.currentText() == "Search Tag Notes":
-          if self.ignoreCase.isChecked():
-            if self.useRegex.isChecked():
-              if regex:
-                for tag in trackItem.tags():
-                  tagMatch = regex.search(tag.note().lower())
-                  if tagMatch:
-                    self.matchList.append(trackItem)
-                    break
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-                for tag in trackItem.tags():
-                  if searchText in tag.note().lower():
-                    self.matchList.append(trackItem)
-                    break
-          else:
-            if self.useRegex.isChecked():
-              if regex:
-                for tag in trackItem.tags():
-                  tagMatch = regex.search(tag.note())
-                  if tagMatch:
-                    self.matchList.append(trackItem)
-                    break
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-              for tag in trackItem.tags():
-                if searchText in tag.note():
-                  self.matchList.append(trackItem)
-                  break
+      query = self.compileQuery(searchText)
+      if query is None:
+        self.searchTextField.setFocus()
+        return
+
+      HieroProjectTracker.projectTracker.updateIndexes()
+      self.runSearch(query, self.searchScope(), goToFirstMatch=True)
+
+    def searchTextEdited(self, text):
+      '''Search as you type, once typing has paused
+      '''
+      self.searchTimer.start()
+
+    def liveSearch(self):
+      '''Search for the text typed so far. If it extends the text of the last
+         finished search, the matches of that search are narrowed down rather
+         than searching everything again. The Viewer is left where it is
+         until Return is pressed.
+      '''
+      searchText = self.searchTextField.text().encode("utf-8")
+      if not searchText:
+        self.cancelSearch()
+        self.lastSearch = None
+        self.matchList = []
+        self.clearResults()
+        self.updateStatusBar("Ready")
+        return
+
+      query = self.compileQuery(searchText)
+      if query is None:
+        return
+
+      sequences = self.searchScope()
+      HieroProjectTracker.projectTracker.updateIndexes()
+      if self.lastSearch is not None:
+        lastQuery, lastSequences, indexes, generations = self.lastSearch
+        if (query.refines(lastQuery) and sequences == lastSequences and
+            [index.generation for index in indexes] == generations):
+          self.refineResults(query)
+          return
 
+      self.runSearch(query, sequences, goToFirstMatch=False)
+
+    def refineResults(self, query):
+      '''Narrow the current results down to the ones matching @query
+      '''
+      lastQuery, sequences, indexes, generations = self.lastSearch
+      self.lastSearch = (query, sequences, indexes, generations)
+      self.matchList = HieroFindIndex.refineTrackItems(self.matchList, query, indexes)
+      self.currentMatchNumber = 0
+      self.clearResults()
+      self.appendResultRows(self.matchList)
       if self.matchList:
-        if self.useTagFilter.isChecked():
-          self.matchList = self.tagbox.filterSelection(self.matchList)
-          if not self.matchList:
-            for row in sorted(range(self.tableWidget.rowCount()+1), reverse=True):
-              self.tableWidget.removeRow(row)
-            for column in sorted(range(self.tableWidget.columnCount()+1), reverse=True):
-              self.tableWidget.removeColumn(column)
-            self.updateStatusBar("No matches found")
-            self.searchTextField.setFocus()
-            return
+        self.resultsView.selectRow(0)
+        self.updateStatusBar("%i matches" % len(self.matchList))
+      else:
+        self.updateStatusBar("No matches found")
 
+    def compileQuery(self, searchText):
+      '''Compile @searchText with the current search options.
+         Returns None, and says why in the status bar, for an invalid regex.
+      '''
+      try:
+        return HieroFindIndex.compileQuery(searchText, self.searchOptionsComboBox.currentText(),
+                                           self.ignoreCase.isChecked(), self.useRegex.isChecked())
+      except re.error as e:
+        self.updateStatusBar("Invalid regex: %s" % str(e))
+        return None
+
+    def searchScope(self):
+      '''The sequences to search, in search order
+      '''
+      sequences = []
+      if self.searchCurrent.isChecked():
+        cv = hiero.ui.currentViewer()
+        player = cv.player()
+        sequence = player.sequence()
+        if isinstance(sequence, hiero.core.Sequence):
+          sequences = [sequence]
+
+      if self.searchAllOpen.isChecked():
+        sequences = self.allSequences(onlyOpen=True)
+      if self.searchAllInProject.isChecked():
+        sequences = self.allSequences()
+      return sequences
+
+    def runSearch(self, query, sequences, goToFirstMatch):
+      '''Search @sequences with the compiled @query.
+         With @goToFirstMatch the first match is shown as soon as it is found.
+      '''
+      self.cancelSearch()
+      self.updateStatusBar("Searching...")
+      self.matchList = []
+      self.currentMatchNumber = 0
+      self.clearResults()
+      self.lastSearch = None
+      self.goToFirstMatch = goToFirstMatch
+      self.rawMatches = []
+
+      # Answer repeated searches from the cache while nothing has changed
+      indexes = HieroFindIndex.sequenceIndexes(sequences)
+      cached = HieroFindIndex.resultCache.get((query.cacheKey(), tuple(sequences)), HieroFindIndex.indexStamp(indexes))
+      if cached is not None:
+        self.rawMatches = cached
+        self.showMatches(cached)
+        self.searchComplete(query, sequences, indexes)
+        return
+
+      # Search on a worker thread, matches are added to the results as they arrive
+      self.findWorker = FindWorker(sequences, query, self)
+      self.findWorker.matchesFound.connect(self.addMatches)
+      self.findWorker.searchDone.connect(self.searchFinished)
+      self.findWorker.searchFailed.connect(self.searchFailed)
+      self.findWorkers.append(self.findWorker)
+      self.findWorker.start()
+
+    def cancelSearch(self):
+      '''Stop the search in progress, if any. Matches it finds from now on are ignored.
+      '''
+      if self.findWorker is not None:
+        self.findWorker.cancel()
+        self.findWorker = None
+        self.updateStatusBar("Search cancelled")
+
+      # Keep hold of cancelled workers until their threads have stopped
+      self.findWorkers = [worker for worker in self.findWorkers if not worker.isFinished()]
+
+    def addMatches(self, worker, matches):
+      '''Add a batch of matches from the running search to the results
+      '''
+      if worker is not self.findWorker:
+        return
+      self.rawMatches += matches
+      self.showMatches(matches)
+
+    def showMatches(self, matches):
+      '''Add @matches that pass the tag filter to the results
+      '''
+      if self.useTagFilter.isChecked():
+        matches = self.tagbox.filterSelection(matches)
+        if not matches:
+          return
+
+      firstMatches = not self.matchList
+      self.matchList += matches
+      self.appendResultRows(matches)
+
+      if firstMatches:
         self.findNextAction.setEnabled(True)
         self.findPreviousAction.setEnabled(True)
+        self.resultsView.selectRow(0)
+        if self.goToFirstMatch:
+          self.goToShot(self.matchList[0])
 
-        self.tableWidget.setColumnCount(7)
-        self.tableWidget.setHorizontalHeaderLabels(["#", "Name", "Track", "Sequence", "Project", "In", "Out"])
-        # Set a reasonable default width based on the current size of the widget
-        defaultWidth = (self.width()-145 + len(str(len(self.matchList)))*1 ) / 4
-        self.tableHeader.setDefaultSectionSize( defaultWidth )# (self.width()-125) / 4)
-        self.tableHeader.setStretchLastSection(True)
-        self.tableHeader.setMinimumSectionSize(20)
-        self.tableHeader.resizeSection(0, 30)
-        self.tableHeader.resizeSection(5, 30)
-        self.tableHeader.resizeSection(6, 30)
-        self.tableHeader.setSortIndicatorShown(True)
-        self.tableWidget.setRowCount(len(self.matchList))
-
-        self.matchDict = {}
-        for item in self.matchList:
-          self.matchDict[self.matchList.index(item)] = item
-
-        for i in self.matchDict:
-          matchNumber = QTableWidgetItem()
-          matchNumber.setData(Qt.DisplayRole, i+1)
-          trackItem = self.matchList[i]
-          trackItemName = QTableWidgetItem("%s (%s)" % (trackItem.name(), trackItem.source().name()))
-          trackItemName.setData(Qt.UserRole, trackItem)
-          trackItemName.setFlags(Qt.ItemIsSelectable|Qt.ItemIsEnabled)
-
-          trackItemSourceName = QTableWidgetItem(trackItem.source().name())
-          trackItemSourceName.setFlags(Qt.ItemIsSelectable|Qt.ItemIsEnabled)
-
-          trackItemParentTrack = QTableWidgetItem(trackItem.parentTrack().name())
-          trackItemParentTrack.setFlags(Qt.ItemIsSelectable|Qt.ItemIsEnabled)
-          trackItemSequence = QTableWidgetItem(trackItem.sequence().name())
-          trackItemSequence.setFlags(Qt.ItemIsSelectable|Qt.ItemIsEnabled)
-          trackItemProject = QTableWidgetItem(trackItem.project().name())
-          trackItemProject.setFlags(Qt.ItemIsSelectable|Qt.ItemIsEnabled)
-
-          timelineIn = QTableWidgetItem(str(trackItem.timelineIn()))
-          timelineOut = QTableWidgetItem(str(trackItem.timelineOut()))
-          self.tableWidget.setRowHeight(i, 16)
-          self.tableWidget.setItem(i, 0, matchNumber)
-          self.tableWidget.setItem(i, 1, trackItemName)
-          self.tableWidget.setItem(i, 2, trackItemParentTrack)
-          self.tableWidget.setItem(i, 3, trackItemSequence)
-          self.tableWidget.setItem(i, 4, trackItemProject)
-          self.tableWidget.setItem(i, 5, timelineIn)
-          self.tableWidget.setItem(i, 6, timelineOut)
-          self.update()
-
-          trackRange = QTableWidgetSelectionRange(0, 0, 0, 6)
-          self.tableWidget.setRangeSelected(trackRange, True)
+      self.updateStatusBar("Searching... %i matches so far" % len(self.matchList))
+
+    def searchFinished(self, worker):
+      '''The running search has looked at every sequence in scope
+      '''
+      if worker is not self.findWorker:
+        return
+      self.findWorker = None
+      HieroFindIndex.resultCache.put((worker.query.cacheKey(), tuple(worker.sequences())),
+                                     HieroFindIndex.indexStamp(worker.indexes()), self.rawMatches)
+      self.searchComplete(worker.query, worker.sequences(), worker.indexes())
+
+    def searchFailed(self, worker, message):
+      '''The running search stopped on an error. Its partial results are
+         kept on show but not cached or refined.
+      '''
+      if worker is not self.findWorker:
+        return
+      self.findWorker = None
+      self.lastSearch = None
+      self.updateStatusBar("Search failed: %s" % message)
+      self.searchTextField.setFocus()
+
+    def searchComplete(self, query, sequences, indexes):
+      '''Show how the search of @sequences for @query went
+      '''
+      self.lastSearch = (query, sequences, indexes, [index.generation for index in indexes])
 
+      if self.matchList:
         currentTrackItem = self.matchList[0]
-        self.goToShot(currentTrackItem)
         self.updateStatusBar("%i of %i matches:\n%s / %s / %s" % (1, len(self.matchList), currentTrackItem.name(), currentTrackItem.parentTrack().name(), currentTrackItem.sequence().name()))
       else:
-        for row in sorted(range(self.tableWidget.rowCount()+1), reverse=True):
-          self.tableWidget.removeRow(row)
-        for column in sorted(range(self.tableWidget.columnCount()+1), reverse=True):
-          self.tableWidget.removeColumn(column)
-
+        self.clearResults()
         self.updateStatusBar("No matches found")
         self.searchTextField.setFocus()
 
+    def clearResults(self):
+      self.resultsModel.clear()
+
+    def appendResultRows(self, trackItems):
+      '''Add rows for @trackItems to the end of the results table
+      '''
+      if not self.resultsModel.rowCount():
+        # Set a reasonable default width based on the current size of the widget
+        defaultWidth = (self.width()-145 + len(str(len(self.matchList)))*1 ) / 4
+        self.tableHeader.setDefaultSectionSize( defaultWidth )
+        self.resultsModel.appendMatches(trackItems)
+        self.tableHeader.resizeSection(0, 30)
+        self.tableHeader.resizeSection(5, 30)
+        self.tableHeader.resizeSection(6, 30)
+      else:
+        self.resultsModel.appendMatches(trackItems)
+
     def findNext(self):
       '''Go to the Next match
       '''
@@ -666,7 +643,7 @@ class FindAction(QAction):
         trackItem = self.updateCurrentResult()
         self.goToShot(trackItem)
 
-      else:
+      elif self.findWorker is None:
         self.findMatches()
 
     def findPrevious(self):
@@ -684,7 +661,7 @@ class FindAction(QAction):
         trackItem = self.updateCurrentResult()
         self.goToShot(trackItem)
 
-      else:
+      elif self.findWorker is None:
         self.findMatches()
 
     def updateCurrentResult(self):
@@ -693,9 +670,7 @@ class FindAction(QAction):
       if self.currentMatchNumber == -1:
         self.currentMatchNumber = 0
 
-      originalRowNumber = self.tableWidget.item(self.currentMatchNumber, 0).data(Qt.DisplayRole)
-      currentItem = self.tableWidget.item(self.currentMatchNumber, 1)
-      trackItem = currentItem.data(Qt.UserRole)
+      originalRowNumber, trackItem = self.resultAtRow(self.currentMatchNumber)
       activeView = hiero.ui.activeView()
 
       # Make sure the trackItem exists on a track before we try to select it
@@ -712,105 +687,37 @@ class FindAction(QAction):
       if isinstance(activeView, hiero.ui.TimelineEditor):
         activeView.selectNone()
 
-      maxVal = len(self.matchList)
-      trackRange = QTableWidgetSelectionRange(self.currentMatchNumber, 0, self.currentMatchNumber, 6)
-      for selectedRange in self.tableWidget.selectedRanges():
-        self.tableWidget.setRangeSelected(selectedRange, False)
-      self.tableWidget.setRangeSelected(trackRange, True)
-      self.tableWidget.scrollToItem(currentItem)
+      self.resultsView.selectRow(self.currentMatchNumber)
+      self.resultsView.scrollTo(self.resultsProxyModel.index(self.currentMatchNumber, 0))
 
       return trackItem
 
-    def findAllItems(self, rootbin, clips, sequences):
-      '''Recursively find all clips and sequences in a bin.
-         If started from the root bin of a project it will return
-         all clips and sequences in the entire project.
-      '''
-      for s in rootbin:
-        if isinstance(s, hiero.core.Bin):
-          for item in s.items():
-            if isinstance(item, hiero.core.BinItem) and hasattr(item, "activeItem"):
-              if isinstance(item.activeItem(), hiero.core.Clip):
-                clips.append(item.activeItem())
-              if isinstance(item.activeItem(), hiero.core.Sequence):
-                sequences.append(item.activeItem())
-            elif isinstance(item, hiero.core.Bin):
-                self.findAllItems([item], clips, sequences)
-        elif isinstance(s, hiero.core.BinItem) and hasattr(s, "activeItem"):
-          if isinstance(s.activeItem(), hiero.core.Clip):
-            clips.append(s.activeItem())
-          if isinstance(s.activeItem(), hiero.core.Sequence):
-            sequences.append(s.activeItem())
-
-      return clips, sequences
-
     def openViewers(self):
       '''Find all open Viewers
       '''
-      allViewers = []
-      for widget in QApplication.allWidgets():
-        if "viewer" in widget.objectName():
-          widget.setFocus()
-          view = hiero.ui.activeView()
-          allViewers.append(view)
-
-      return allViewers
+      return HieroFindNavigation.openViewers()
 
     def findViewer(self, sequence, start=None):
       '''Find a specific Viewer
       '''
-      for widget in QApplication.allWidgets():
-        try:
-          if widget.windowTitle() == sequence.name() and "viewer" in widget.objectName():
-            widget.setFocus()
-            if hiero.ui.activeView().player().sequence() == sequence:
-              return hiero.ui.activeView()
-            else:
-              continue
-        except:
-          pass
-
-      return None
+      return HieroFindNavigation.viewerForSequence(sequence)
 
-    def allTrackItems(self, onlyOpen=False):
-      '''Search projects for all track items in all sequences.
-         Optionally, only search sequences that are opened in a Viewer.
+    def allSequences(self, onlyOpen=False):
+      '''Find all sequences in all open projects.
+         Optionally, only return sequences that are opened in a Viewer.
       '''
-      trackItems = []
+      allSequences = []
       if not onlyOpen:
-        for project in hiero.core.projects():
-          bin = project.clipsBin()
-          clips, sequences = self.findAllItems(bin.items(), [], [])
-          for sequence in sequences:
-            items = self.trackItems(sequence)
-            trackItems += items
+        allSequences = HieroProjectTracker.allSequences()
       else:
-        openViewers = self.openViewers()
-        for viewer in openViewers:
-          sequence = viewer.player().sequence()
-          if isinstance(sequence, hiero.core.Sequence):
-            items = self.trackItems(sequence)
-            trackItems += items
+        allSequences = HieroFindNavigation.openSequences()
 
-      return trackItems
+      return allSequences
 
     def trackItems(self, sequence):
       '''Get all track items from a sequence
       '''
-      trackItems = []
-      for track in sequence:
-        for ti in track:
-          link = False
-          if ti not in trackItems:
-            for item in trackItems:
-              if ti in item.linkedItems():
-                link = True
-            if not link:
-              trackItems.append(ti)
-            else:
-              pass
-
-      return trackItems
+      return HieroProjectTracker.trackItems(sequence)
 
     def FindOrCreateTrack(self, sequence, trackName):
       track = None
@@ -829,55 +736,44 @@ class FindAction(QAction):
 
       return track, isNewTrack
 
-    def selectedResults(self):
-      '''Return a list of the currently selected TrackItems in the Results Spreadsheet
+    def resultAtRow(self, row):
+      '''Return the result number and TrackItem shown in @row of the Results Spreadsheet
       '''
-      selectedRows = []
-      selectedResults = []
+      sourceRow = self.resultsProxyModel.mapToSource(self.resultsProxyModel.index(row, 0)).row()
+      return sourceRow+1, self.resultsModel.trackItem(sourceRow)
 
-      for selectedRange in self.tableWidget.selectedRanges():
-        topRow = selectedRange.topRow()
-        bottomRow = selectedRange.bottomRow()
-        selectedRows = sorted(selectedRows + range(topRow, bottomRow+1))
+    def selectedRows(self):
+      '''Return the sorted rows of the Results Spreadsheet that are selected
+      '''
+      return sorted(index.row() for index in self.resultsView.selectionModel().selectedRows())
 
-      for i in selectedRows:
-        trackItem = self.tableWidget.item(i, 1).data(Qt.UserRole)
-        selectedResults.append(trackItem)
+    def hasSelectedResults(self):
+      return self.resultsView.selectionModel().hasSelection()
 
-      return selectedResults
+    def selectedResults(self):
+      '''Return a list of the currently selected TrackItems in the Results Spreadsheet
+      '''
+      return [self.resultAtRow(row)[1] for row in self.selectedRows()]
 
     def sortResultColumn(self, column):
-      '''Sort the search results based on column clicked
+      '''Keep the current result when the results are sorted by another column
       '''
-      try:
-        currentItem = self.tableWidget.selectedItems()[0]
-      except:
-        currentItem = None
-
-      currentOrder = self.tableHeader.sortIndicatorOrder()
-
-      self.tableWidget.sortItems(column)
-      self.tableHeader.setSortIndicator(column, currentOrder)
-
-      if currentItem:
-        currentRow = self.tableWidget.currentRow()
+      currentRow = self.resultsView.currentIndex().row()
+      if currentRow != -1:
         self.currentMatchNumber = currentRow
 
     def resultSelectionChanged(self):
       '''Handle change in the result selection
       '''
-      currentRow = self.tableWidget.currentRow()
+      currentRow = self.resultsView.currentIndex().row()
       if currentRow != -1:
-        originalRowNumber = self.tableWidget.item(currentRow, 0).data(Qt.DisplayRole)
-        currentTrackItem = self.tableWidget.item(currentRow, 1).data(Qt.UserRole)
         self.currentMatchNumber = currentRow
       else:
         try:
-          self.currentMatchNumber = self.tableWidget.selectedRanges()[0].topRow()
+          self.currentMatchNumber = self.selectedRows()[0]
         except:
           self.currentMatchNumber = 0
-        originalRowNumber = self.tableWidget.item(self.currentMatchNumber, 0).data(Qt.DisplayRole)
-        currentTrackItem = self.tableWidget.item(self.currentMatchNumber, 1).data(Qt.UserRole)
+      originalRowNumber, currentTrackItem = self.resultAtRow(self.currentMatchNumber)
 
       # Make sure the trackItem exists on a track before we try to select it
       itemExists = False
@@ -902,38 +798,129 @@ class FindAction(QAction):
       '''
       if not trackItem:
         return
-      sequence = trackItem.parentSequence()
-
-      cv = self.findViewer(sequence)
-      if not cv:
-        cv = hiero.ui.currentViewer()
-        p = cv.player()
-        p.setSequence(sequence)
-      tIn = trackItem.timelineIn()
-      cv.setTime(tIn)
-      tl = hiero.ui.findMenuAction("Show Timeline Editor")
-      settings = hiero.core.ApplicationSettings()
-      tl.trigger()
-
-      startView = hiero.ui.activeView()
-      np = hiero.ui.findMenuAction("Next Pane")
-      while not isinstance(hiero.ui.activeView(), hiero.ui.TimelineEditor):
-        np.trigger()
-        if hiero.ui.activeView() == startView:
-          return None
-
-      activeView = hiero.ui.activeView()
-      if isinstance(activeView, hiero.ui.TimelineEditor):
-        activeView.selectNone()
-      if isinstance(activeView, hiero.ui.TimelineEditor) and activeView.sequence() == trackItem.sequence():
-        activeView.setSelection(trackItem.linkedItems())
-      QApplication.processEvents()
-      sequence.editFinished()
+      HieroFindNavigation.goToShot(trackItem)
 
       # Return focus to the search text field
       # Comment this out if you want focus to stay on the track item
       self.searchTextField.setFocus()
 
+class FindWorker(QThread):
+  '''Runs a Find panel search away from the main thread.
+
+     The search is split into one shard per sequence, each indexed and
+     searched in its project's index on a pool of search threads. Sequences
+     that have already been indexed are handed to the pool straight away.
+     The others have their track items read from Hiero on the main thread,
+     in batches, through hiero.core.executeInMainThreadWithResult, and are
+     handed over once they have been read, so reading one sequence overlaps
+     with searching the ones before it.
+     Matches are sent back one sequence at a time, in the order of the search
+     scope, with matchesFound so they can be shown while the rest of the
+     scope is searched. A search that stops on an error (a track item
+     deleted while it was read, say) sends searchFailed with the error
+     message instead of searchDone.
+  '''
+  matchesFound = Signal(object, object)
+  searchDone = Signal(object)
+  searchFailed = Signal(object, object)
+
+  # Number of track items read from Hiero per trip to the main thread
+  kBatchSize = 250
+
+  # Most threads indexing and searching shards at once
+  kSearchThreads = 4
+
+  def __init__(self, sequences, query, parent=None):
+    QThread.__init__(self, parent)
+    self._cancelled = False
+    self.query = query
+    # Look up the index of each sequence's project here, on the main thread
+    self._shards = [(sequence, HieroFindIndex.projectIndex(sequence.project())) for sequence in sequences]
+
+  def cancel(self):
+    self._cancelled = True
+
+  def isCancelled(self):
+    return self._cancelled
+
+  def sequences(self):
+    return [sequence for sequence, index in self._shards]
+
+  def indexes(self):
+    '''The project indexes searched, each listed once
+    '''
+    return HieroFindIndex.sequenceIndexes(self.sequences())
+
+  def run(self):
+    pool = ThreadPool(max(1, min(self.kSearchThreads, len(self._shards))))
+    try:
+      if self.searchShards(pool) and not self._cancelled:
+        self.searchDone.emit(self)
+    except Exception as e:
+      traceback.print_exc()
+      if not self._cancelled:
+        self.searchFailed.emit(self, str(e))
+    finally:
+      pool.terminate()
+
+  def searchShards(self, pool):
+    '''Search every shard. Returns False if the search was cancelled.
+    '''
+    pending = []
+    for sequence, index in self._shards:
+      if self._cancelled:
+        return False
+
+      with index.lock:
+        indexed = index.hasSequence(sequence)
+      if indexed:
+        trackItems, entries = None, None
+      else:
+        snapshot = self.readSequence(sequence)
+        if snapshot is None:
+          return False
+        trackItems, entries = snapshot
+
+      # Fuzzy matches are ranked across the whole scope once it is indexed
+      shardQuery = None if self.query.fuzzy else self.query
+      pending.append(pool.apply_async(HieroFindIndex.searchSequence, (index, sequence, shardQuery, trackItems, entries)))
+      # Send on the matches of the leading shards that are done
+      while pending and pending[0].ready():
+        self.sendMatches(pending.pop(0).get())
+
+    for result in pending:
+      if self._cancelled:
+        return False
+      self.sendMatches(result.get())
+
+    if self.query.fuzzy and not self._cancelled:
+      self.sendMatches(HieroFindIndex.rankSequences(self._shards, self.query))
+    return True
+
+  def sendMatches(self, matches):
+    if matches and not self._cancelled:
+      self.matchesFound.emit(self, matches)
+
+  def readSequence(self, sequence):
+    '''Read the track items of @sequence and their searchable text. The
+       text is taken from the shot snapshot of the project's last save if
+       the sequence hasn't been edited since, otherwise it is read from Hiero.
+       Returns None if the search was cancelled before it was done.
+    '''
+    saved = hiero.core.executeInMainThreadWithResult(HieroProjectTracker.savedRows, sequence)
+    if saved is not None:
+      trackItems, snapshot, start, end = saved
+      return trackItems, HieroFindIndex.snapshotEntries(snapshot, start, end)
+
+    trackItems = hiero.core.executeInMainThreadWithResult(HieroProjectTracker.trackItems, sequence)
+    entries = []
+    for start in range(0, len(trackItems), self.kBatchSize):
+      if self._cancelled:
+        return None
+      batch = trackItems[start:start+self.kBatchSize]
+      entries += hiero.core.executeInMainThreadWithResult(HieroFindIndex.readTrackItems, batch)
+    return trackItems, entries
+
 class SearchTextField(QLineEdit):
   def __init__(self, parent=None):
     super(SearchTextField, self).__init__(parent)
@@ -962,6 +949,75 @@ class SearchTextField(QLineEdit):
   def index(self):
     return self.currentIndex()
 
+class FindResultsModel(QAbstractTableModel):
+  '''The Find results. Only the matched track items are stored, the text
+     of a row is read from its track item the first time the row is drawn.
+  '''
+  kHeaders = ["#", "Name", "Track", "Sequence", "Project", "In", "Out"]
+
+  def __init__(self, parent=None):
+    QAbstractTableModel.__init__(self, parent)
+    self._matches = []
+    self._rows = {}
+
+  def rowCount(self, parent=QModelIndex()):
+    if parent.isValid():
+      return 0
+    return len(self._matches)
+
+  def columnCount(self, parent=QModelIndex()):
+    if parent.isValid():
+      return 0
+    return len(self.kHeaders)
+
+  def headerData(self, section, orientation, role=Qt.DisplayRole):
+    if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+      return self.kHeaders[section]
+    return None
+
+  def flags(self, index):
+    return Qt.ItemIsSelectable|Qt.ItemIsEnabled
+
+  def data(self, index, role=Qt.DisplayRole):
+    if not index.isValid():
+      return None
+    if role == Qt.DisplayRole:
+      return self.rowData(index.row())[index.column()]
+    if role == Qt.UserRole:
+      return self._matches[index.row()]
+    return None
+
+  def rowData(self, row):
+    '''The values shown in @row, read once and then kept
+    '''
+    if row not in self._rows:
+      trackItem = self._matches[row]
+      try:
+        self._rows[row] = (row+1, "%s (%s)" % (trackItem.name(), trackItem.source().name()),
+                           trackItem.parentTrack().name(), trackItem.sequence().name(),
+                           trackItem.project().name(), trackItem.timelineIn(), trackItem.timelineOut())
+      except:
+        # The track item has been deleted since it was found
+        return (row+1, "", "", "", "", 0, 0)
+    return self._rows[row]
+
+  def trackItem(self, row):
+    return self._matches[row]
+
+  def appendMatches(self, trackItems):
+    if not trackItems:
+      return
+    firstRow = len(self._matches)
+    self.beginInsertRows(QModelIndex(), firstRow, firstRow + len(trackItems) - 1)
+    self._matches += trackItems
+    self.endInsertRows()
+
+  def clear(self):
+    self.beginResetModel()
+    self._matches = []
+    self._rows = {}
+    self.endResetModel()
+
 class FindResultsKeyPressRedirect(QObject):
   '''Redirects key presses inside the Find Results Spreadsheet
   '''
@@ -995,6 +1051,147 @@ class FindPreviousAction(QAction):
   def findPreviousAction(self):
     self.parent.findPrevious()
 
+class TagFilterModel(QAbstractListModel):
+  '''The tags that can be used to filter the Find results, one checkable
+     row per tag name, sorted by name. The names come from a TagIndex, the
+     icon and number of shots of a tag are only read when its row is drawn.
+
+     Tags have three states: PartiallyChecked marks a tag [+] (shots must
+     have it) and Checked marks it [-] (shots must not have it). The item
+     view only toggles between Unchecked and Checked when a box is clicked,
+     so the model moves each click on to the next state itself:
+     unmarked, then [+], then [-], then unmarked again.
+  '''
+  tagStatesChanged = Signal()
+
+  kNextState = { Qt.Unchecked : Qt.PartiallyChecked,
+                 Qt.PartiallyChecked : Qt.Checked,
+                 Qt.Checked : Qt.Unchecked }
+
+  def __init__(self, parent=None):
+    QAbstractListModel.__init__(self, parent)
+    self._tagIndex = None
+    self._names = []
+    self._states = {}
+    self._icons = {}
+    self._counts = {}
+
+  @staticmethod
+  def isFilterable(tagName):
+    '''Whether @tagName is offered in the filter. Tags added by exports are left out.
+    '''
+    return "Transcode" not in tagName and "Nuke Project" not in tagName
+
+  def rowCount(self, parent=QModelIndex()):
+    if parent.isValid():
+      return 0
+    return len(self._names)
+
+  def flags(self, index):
+    return Qt.ItemIsEnabled|Qt.ItemIsUserCheckable
+
+  def data(self, index, role=Qt.DisplayRole):
+    if not index.isValid():
+      return None
+    name = self._names[index.row()]
+    if role == Qt.DisplayRole:
+      return "%s (%i)" % (name, self.count(name))
+    if role == Qt.CheckStateRole:
+      return self._states.get(name, Qt.Unchecked)
+    if role == Qt.DecorationRole:
+      if name not in self._icons:
+        self._icons[name] = QIcon(self._tagIndex.icon(name))
+      return self._icons[name]
+    if role == Qt.ToolTipRole:
+      return "%i shots tagged %s" % (self.count(name), name)
+    if role == Qt.UserRole:
+      return name
+    return None
+
+  def setData(self, index, value, role=Qt.EditRole):
+    if not index.isValid() or role != Qt.CheckStateRole:
+      return False
+    # Only clicks set the check state, so move on to the next state
+    # whatever the view asks for
+    name = self._names[index.row()]
+    state = self.kNextState[self._states.get(name, Qt.Unchecked)]
+    if state == Qt.Unchecked:
+      self._states.pop(name, None)
+    else:
+      self._states[name] = state
+    self.dataChanged.emit(index, index)
+    self.tagStatesChanged.emit()
+    return True
+
+  def count(self, tagName):
+    if tagName not in self._counts:
+      self._counts[tagName] = self._tagIndex.count(tagName)
+    return self._counts[tagName]
+
+  def tagName(self, row):
+    return self._names[row]
+
+  def updateTags(self, tagIndex):
+    '''Show the tags of @tagIndex. Rows are only added and removed for
+       tags that have appeared or gone since the last update, the states of
+       the tags that are still there are kept.
+    '''
+    self._tagIndex = tagIndex
+    names = sorted([name for name in tagIndex.tagNames() if self.isFilterable(name)])
+    old = list(self._names)
+    row = i = j = 0
+    while i < len(old) or j < len(names):
+      if j == len(names) or (i < len(old) and old[i] < names[j]):
+        # A run of tags that have gone
+        start = i
+        while i < len(old) and (j == len(names) or old[i] < names[j]):
+          self._states.pop(old[i], None)
+          self._icons.pop(old[i], None)
+          i += 1
+        self.beginRemoveRows(QModelIndex(), row, row + i - start - 1)
+        del self._names[row:row + i - start]
+        self.endRemoveRows()
+      elif i == len(old) or names[j] < old[i]:
+        # A run of new tags
+        start = j
+        while j < len(names) and (i == len(old) or names[j] < old[i]):
+          j += 1
+        self.beginInsertRows(QModelIndex(), row, row + j - start - 1)
+        self._names[row:row] = names[start:j]
+        self.endInsertRows()
+        row += j - start
+      else:
+        i += 1
+        j += 1
+        row += 1
+
+    # Shot counts may have changed for any tag
+    self._counts = {}
+    if self._names:
+      self.dataChanged.emit(self.index(0), self.index(len(self._names) - 1))
+
+  def includedTags(self):
+    '''The tags marked [+]
+    '''
+    return [name for name in self._names if self._states.get(name) == Qt.PartiallyChecked]
+
+  def excludedTags(self):
+    '''The tags marked [-]
+    '''
+    return [name for name in self._names if self._states.get(name) == Qt.Checked]
+
+  def setTagStates(self, included, excluded):
+    '''Mark the tags in @included [+], those in @excluded [-] and clear the rest
+    '''
+    self._states = {}
+    for name in excluded:
+      self._states[name] = Qt.Checked
+    for name in included:
+      self._states[name] = Qt.PartiallyChecked
+    if self._names:
+      self.dataChanged.emit(self.index(0), self.index(len(self._names) - 1))
+    self.tagStatesChanged.emit()
+
 # Tag filter widget to optionally search by tag combination presets
 class TagSplitterWidget(QWidget):
   def __init__(self, mainLayout, parent):
@@ -1007,37 +1204,24 @@ class TagSplitterWidget(QWidget):
     self.tagBoxVertical.setContentsMargins(0, 0, 0, 0)
     self.tagBoxVertical.setObjectName("tagBoxVertical")
 
-    self.tagScrollArea = QScrollArea(self)
-    self.tagScrollArea.setEnabled(True)
+    self.tagModel = TagFilterModel(self)
+    self.tagModel.tagStatesChanged.connect(self.tagStatesChanged)
+
+    self.tagListView = QListView(self)
     sizePolicy = QSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.MinimumExpanding)
     sizePolicy.setHorizontalStretch(0)
     sizePolicy.setVerticalStretch(0)
-    sizePolicy.setHeightForWidth(self.tagScrollArea.sizePolicy().hasHeightForWidth())
-    self.tagScrollArea.setSizePolicy(sizePolicy)
-    self.tagScrollArea.setMinimumSize(QSize(150, 40))
-    self.tagScrollArea.setAutoFillBackground(True)
-    self.tagScrollArea.setWidgetResizable(True)
-    self.tagScrollArea.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-    self.tagScrollArea.setObjectName("tagScrollArea")
-
-    self.tagListBox = QFrame()
-    self.tagListBox.setGeometry(QRect(0, 0, 150, 200))
-    sizePolicy = QSizePolicy(QSizePolicy.Minimum, QSizePolicy.Minimum)
-    sizePolicy.setHorizontalStretch(0)
-    sizePolicy.setVerticalStretch(0)
-    sizePolicy.setHeightForWidth(self.tagListBox.sizePolicy().hasHeightForWidth())
-    self.tagListBox.setSizePolicy(sizePolicy)
-    self.tagListBox.setMinimumSize(QSize(150, 200))
-    # The background color doesn't get set to the color we want by default so we set it here
-    self.tagListBox.setBackgroundRole(QPalette.Base)
-    self.tagListBox.setAcceptDrops(True)
-    self.tagListBox.setObjectName("tagListBox")
-
-    self.verticalLayoutWidget = QWidget(self.tagListBox)
-    self.verticalLayoutWidget.setGeometry(QRect(-1, -1, 150, 200))
-    self.verticalLayoutWidget.setObjectName("verticalLayoutWidget")
-
-    self.tagBoxVertical.addWidget(self.tagScrollArea)
+    self.tagListView.setSizePolicy(sizePolicy)
+    self.tagListView.setMinimumSize(QSize(150, 40))
+    self.tagListView.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+    self.tagListView.setSelectionMode(QAbstractItemView.NoSelection)
+    self.tagListView.setUniformItemSizes(True)
+    self.tagListView.setIconSize(QSize(12, 12))
+    self.tagListView.setStyleSheet("QListView::indicator {width:12px; height:12px;} QListView::indicator:indeterminate {image: url(icons:Checkbox_plus.png);} QListView::indicator:checked { image: url(icons:Checkbox_minus.png); }")
+    self.tagListView.setModel(self.tagModel)
+    self.tagListView.setObjectName("tagListView")
+
+    self.tagBoxVertical.addWidget(self.tagListView)
 
     ########## Horizontal Layout for tag box filter and presets ##########
     self.tagButtonHorizontal = QHBoxLayout()
@@ -1045,7 +1229,7 @@ class TagSplitterWidget(QWidget):
 
     self.tagPresetComboBox = QComboBox(self.mainLayout)
     self.tagPresetComboBox.setObjectName("tagPresetComboBox")
-    self.tagPresetComboBox.setParent(self.tagListBox)
+    self.tagPresetComboBox.setParent(self)
     self.tagPresetComboBox.setSizeAdjustPolicy(QComboBox.AdjustToContents)
     self.tagPresetComboBox.setToolTip("Choose a Tag Combination Preset or Save the Currently Selected Combination.\
                                       \nTo Delete a Preset select it and then right click and choose Delete.")
@@ -1079,13 +1263,6 @@ class TagSplitterWidget(QWidget):
     self.emptyFrame.setMinimumHeight(2)
     self.tagBoxVertical.addWidget(self.emptyFrame)
 
-    self.tagScrollArea.setWidget(self.tagListBox)
-
-    self.tagVBoxLayout = QVBoxLayout(self.verticalLayoutWidget)
-
-    self.tagVBoxLayout.setSizeConstraint(QLayout.SetMinAndMaxSize)
-    self.tagVBoxLayout.setObjectName("tagVBoxLayout")
-
     self.populateFromTags()
 
     # We have to put the Checkbox here because otherwise it won't appear.
@@ -1112,237 +1289,81 @@ class TagSplitterWidget(QWidget):
     # Show the context menu.
     menu.exec_(QCursor.pos())
 
-  def findAllItems(self, rootbin, clips, sequences):
-    '''Recursively find all clips and sequences in a bin.
-       If started from the root bin of a project it will return
-       all clips and sequences in the entire project.
-    '''
-    for s in rootbin:
-      if isinstance(s, hiero.core.Bin):
-        for item in s.items():
-          if isinstance(item, hiero.core.BinItem) and hasattr(item, "activeItem"):
-            if isinstance(item.activeItem(), hiero.core.Clip):
-              clips.append(item)
-            if isinstance(item.activeItem(), hiero.core.Sequence):
-              sequences.append(item)
-          elif isinstance(item, hiero.core.Bin):
-              self.findAllItems([item], clips, sequences)
-      elif isinstance(s, hiero.core.BinItem) and hasattr(s, "activeItem"):
-        if isinstance(s.activeItem(), hiero.core.Clip):
-          clips.append(s)
-        if isinstance(s.activeItem(), hiero.core.Sequence):
-          sequences.append(s)
-
-    return clips, sequences
-
-  def getUsedTagNames(self):
-    '''Search the project for all track item tags.
-    '''
-    # Only track item tags are searched for. Tags
-    # on bin items, sequences, or tracks are ignored
-    tagsUsed = {}
-    projectList = hiero.core.projects()
-
-    for project in projectList:
-      bin = project.clipsBin()
-      clips, sequences = self.findAllItems(bin.items(), [], [])
-      for sequence in sequences:
-        for track in sequence.activeItem():
-          for ti in track:
-            if ti.tags():
-              tagsUsed[ti] = []
-              for tag in ti.tags():
-                tagsUsed[ti].append(tag)
-
-    return tagsUsed
-
   def filterSelection(self, selection):
-    '''Filter the selection based on checked and partially checked tags
+    '''Filter the selection based on the tags marked [+] and [-]
     '''
-    checkedTags = []
-    ignoredTags = []
-    excludedTags = []
-    tagnames = {}
-
-    filteredTrackItems = []
-    ignoredTrackItems = []
-
     if not self.mainLayout.useTagFilter.isChecked():
       return selection
 
-    usedTags = self.getUsedTagNames()
-    anyChecked = False
-
-    for box in self.tagListBox.findChildren(QCheckBox):
-      # We reverse the use of Checked and PartiallyChecked because it's annoying that the first click
-      # of a tristate checkbox gives you the PartiallyChecked state.
-      if box.checkState() == Qt.PartiallyChecked: # We really mean Fully Checked
-        checkedTags.append(box.text())
-        anyChecked = True
-
-      if box.checkState() == Qt.Checked: # We really mean Partially Checked
-        ignoredTags.append(box.text())
-        anyChecked = True
-
-      if box.checkState() == Qt.Unchecked:
-        excludedTags.append(box.text())
-
-    if anyChecked:
-      if self.tagFilter.checkState() == Qt.Checked:
-        if checkedTags:
-          for trackItem in usedTags:
-            checkedMatch = False
-            ignoredMatch = False
-            currentTagList = [tag.name() for tag in usedTags[trackItem]]
-
-            # Look at the list of trackitems and their tags
-            # If a tag is checked we have a match
-            if set(checkedTags).issubset(set(currentTagList)):
-              checkedMatch = True
-
-            # We have a match so make sure the tag isn't checked [-] to be ignored
-            if checkedMatch:
-              for ignored in ignoredTags:
-                if ignored in currentTagList:
-                  ignoredMatch = True
-                  break
-
-            if checkedMatch and not ignoredMatch:
-              if trackItem in selection:
-                if not trackItem in filteredTrackItems:
-                  filteredTrackItems.append(trackItem)
-
-      if self.tagFilter.checkState() == Qt.Unchecked:
-        for trackItem in usedTags:
-          currentTagList = [tag.name() for tag in usedTags[trackItem]]
-
-          for checked in checkedTags:
-            if checked in currentTagList:
-              if trackItem in selection:
-                if not trackItem in filteredTrackItems:
-                  filteredTrackItems.append(trackItem)
+    checkedTags = self.tagModel.includedTags()
+    if not checkedTags:
+      return []
 
+    tagIndex = HieroProjectTracker.tagIndex()
+    if self.tagFilter.checkState() == Qt.Checked:
+      # Shots must have every tag marked [+] and none of those marked [-]
+      return tagIndex.filter(selection, checkedTags, self.tagModel.excludedTags(), matchAll=True)
     else:
-      return []
+      # Shots with any of the tags marked [+]
+      return tagIndex.filter(selection, checkedTags, matchAll=False)
 
-    return filteredTrackItems
+  def tagStatesChanged(self):
+    '''Search again when a tag is marked, if the tag filter is in use
+    '''
+    if self.mainLayout.useTagFilter.isChecked():
+      self.mainLayout.findMatches()
 
   def populateFromTags(self):
-
-    for index in range(self.tagVBoxLayout.count()):
-      self.tagVBoxLayout.takeAt(index)
-
-    for tag in self.tagListBox.findChildren(QCheckBox):
-      tag.deleteLater()
-
-    tagnames = {}
-    usedTags = self.getUsedTagNames()
-    for trackItem in usedTags:
-      for tag in usedTags[trackItem]:
-
-        if tag.name() not in tagnames:
-          tagnames[tag.name()] = [trackItem]
-        else:
-          tagnames[tag.name()].append(trackItem)
-
-    tagCount = []
-    for tname in sorted(tagnames, reverse=True):
-      transcodematch = re.search("(Transcode)", tname)
-      nukematch = re.search("(Nuke Project)", tname)
-      if not nukematch and not transcodematch:
-        tagCount.append(tname)
-
-        tag = [t for t in tagnames[tname][0].tags() if t.name() == tname][0]
-        iconPath = QIcon(tag.icon())
-
-        tagBox = QCheckBox(tname)
-        tagBox.setStyleSheet("::indicator {width:12px; height:12px;} ::indicator:indeterminate {image: url(icons:Checkbox_plus.png);} ::indicator:checked { image: url(icons:Checkbox_minus.png); }")
-        tagBox.setTristate(True)
-        tagBox.setIcon(iconPath)
-        #tagBox.stateChanged.connect(self.filterSelection)
-        tagBox.stateChanged.connect(self.mainLayout.findMatches)
-        tagBox.setParent(self.tagListBox)
-        self.tagVBoxLayout.insertWidget(0, tagBox)
-
-
-    self.tagListBox.updateGeometry()
-    self.tagListBox.adjustSize()
-
-    count = self.tagVBoxLayout.count()
-    newY = (18 * len(tagCount)) + 10 # Height of each checkbox * number of boxes plus total top/bottom padding
-    self.tagListBox.setMinimumSize(QSize(self.tagListBox.x(), newY))
+    '''Bring the tag list up to date with the tags in the open projects
+    '''
+    self.tagModel.updateTags(HieroProjectTracker.tagIndex())
 
   def loadTagPresets(self):
-    '''Load tag presets from the user's uistate.ini and populate
-       the tag preset combo box.
+    '''Populate the tag preset combo box from the preset store. Presets
+       saved in the user's uistate.ini by earlier versions are moved into it.
     '''
-    settings = hiero.core.ApplicationSettings()
-
-    self.kTagCombinationPreset = "tagCombinationPresets"
-    presets = settings.value(self.kTagCombinationPreset, "")
-    if presets:
-      presets = ast.literal_eval(presets)
-      for presetName in sorted(presets, key=lambda s: s.lower()):
-        self.tagPresetComboBox.addItem(presetName)
-        for index in range(self.tagPresetComboBox.count()):
-          if self.tagPresetComboBox.itemText(index) == presetName:
-            self.tagPresetComboBox.setItemData(index, presets[presetName])
+    self.presetStore = HieroTagPresets.presetStore()
+    try:
+      self.presetStore.migrateSettings(hiero.core.ApplicationSettings())
+    except (IOError, OSError) as e:
+      print "Unable to move the tag presets to %s: %s" % (self.presetStore.path, str(e))
+    for presetName in self.presetStore.names():
+      self.tagPresetComboBox.addItem(presetName, self.presetStore.preset(presetName))
 
   def deleteTagPreset(self, index):
     '''Delete a tag combination preset
     '''
-    settings = hiero.core.ApplicationSettings()
-    self.kTagCombinationPreset = "tagCombinationPresets"
-
-    savedPresets = settings.value(self.kTagCombinationPreset, "")
-    if savedPresets:
-      savedPresets = ast.literal_eval(savedPresets)
-    else:
-      savedPresets = {}
-
     currentPreset = self.tagPresetComboBox.itemText(index)
     if currentPreset == "Save Preset..." or currentPreset == "None":
-      pass
+      return
+
+    if self.presetStore.removePreset(currentPreset) is None:
+      # Shared presets can't be deleted
+      return
+    sharedPreset = self.presetStore.preset(currentPreset)
+    if sharedPreset is not None:
+      # The user preset replaced a shared one, which is shown again
+      self.tagPresetComboBox.setItemData(index, sharedPreset)
     else:
-      del savedPresets[currentPreset]
       self.tagPresetComboBox.removeItem(index)
-      settings.setValue(self.kTagCombinationPreset, savedPresets)
 
   def saveTagPreset(self):
     '''Save a tag combination preset.
     '''
     currentState = self.currentTagSelectionState()
-    settings = hiero.core.ApplicationSettings()
-
-    self.kTagCombinationPreset = "tagCombinationPresets"
-
-    savedPresets = settings.value(self.kTagCombinationPreset, "")
-    if savedPresets:
-      savedPresets = ast.literal_eval(savedPresets)
-    else:
-      savedPresets = {}
 
     dialog = PresetDialog()
     if dialog.exec_():
       text = dialog.lineEdit.text()
       if text:
-        newPreset = {text: currentState}
-
-        savedPresets.update(newPreset)
-        settings.setValue(self.kTagCombinationPreset, savedPresets)
-
-        loadedPresets = list(savedPresets.keys())
-        sortedPresets = list(loadedPresets)
-        sortedPresets.append(text)
-        sortedIndex = sorted(sortedPresets, key=lambda s: s.lower()).index(text)
-
-        # Add 2 to the sort index because we skip over "Save Preset..." and "None"
-        self.tagPresetComboBox.insertItem(sortedIndex+2, text)
-
-        for index in range(self.tagPresetComboBox.count()):
-          if self.tagPresetComboBox.itemText(index) == text:
-            self.tagPresetComboBox.setCurrentIndex(index)
-            self.tagPresetComboBox.setItemData(index, currentState)
+        position, isNew = self.presetStore.setPreset(text, currentState)
+
+        # Add 2 to the position because we skip over "Save Preset..." and "None"
+        index = position + 2
+        if isNew:
+          self.tagPresetComboBox.insertItem(index, text)
+        self.tagPresetComboBox.setItemData(index, currentState)
+        self.tagPresetComboBox.setCurrentIndex(index)
       else:
         dialog.close()
 
@@ -1355,24 +1376,13 @@ class TagSplitterWidget(QWidget):
       self.clearTagSelection()
 
     if currentTagPreset == "Save Preset...":
-      currentState = self.currentTagSelectionState()
       self.saveTagPreset()
 
     else:
-      for index in range(self.tagPresetComboBox.count()):
-        if self.tagPresetComboBox.itemText(index) == currentTagPreset:
-          itemdata = self.tagPresetComboBox.itemData(index)
+      itemdata = self.tagPresetComboBox.itemData(self.tagPresetComboBox.currentIndex())
 
       if itemdata:
-        checked = itemdata['checked']
-        ignored = itemdata['ignored']
-        for box in self.tagListBox.findChildren(QCheckBox):
-          if box.text() in checked:
-            box.setCheckState(Qt.PartiallyChecked)
-          elif box.text() in ignored:
-            box.setCheckState(Qt.Checked)
-          else:
-            box.setCheckState(Qt.Unchecked)
+        self.tagModel.setTagStates(itemdata['checked'], itemdata['ignored'])
 
   def tagSelectionStateChanged(self):
 
@@ -1383,26 +1393,10 @@ class TagSplitterWidget(QWidget):
       self.tagPresetComboBox.setCurrentIndex(1)
 
   def currentTagSelectionState(self):
-    checkedTags = []
-    ignoredTags = []
-
-    for box in self.tagListBox.findChildren(QCheckBox):
-      if box.checkState() == Qt.PartiallyChecked: # We really mean Fully Checked
-        checkedTags.append(box.text())
-
-      if box.checkState() == Qt.Checked: # We really mean Partially Checked
-        ignoredTags.append(box.text())
-
-    return {'checked': checkedTags, 'ignored': ignoredTags}
+    return {'checked': self.tagModel.includedTags(), 'ignored': self.tagModel.excludedTags()}
 
   def clearTagSelection(self):
-    currentTagBox = self.sender().parent()
-
-    for box in self.tagListBox.findChildren(QCheckBox):
-      if box.checkState() == Qt.PartiallyChecked: # We really mean Fully Checked
-        box.setCheckState(Qt.Unchecked)
-      if box.checkState() == Qt.Checked: # We really mean Partially Checked
-        box.setCheckState(Qt.Unchecked)
+    self.tagModel.setTagStates([], [])
 
   class DeleteTagPreset(QAction):
     def __init__(self, sender, title="Delete"):
@@ -1437,63 +1431,81 @@ class PresetDialog(QDialog):
     self.setLayout(layout)
     self.setSizePolicy( QSizePolicy.Expanding, QSizePolicy.Fixed )
 
-class BuildTrackCustom(BuildExternalMediaTrackAction):
-  def __init__(self, selection):
-    super(BuildExternalMediaTrackAction, self).__init__("From Export Structure")
-    self.selection = selection
-    if not len(self.selection.tableWidget.selectedIndexes()):
-      self.setEnabled(False)
-
-  def configure(self, project, selection):
-    dialog = self.BuildExternalMediaTrack(selection)
-    if dialog.exec_():
-      self._trackName = dialog.trackName()
-
-      # Determine the exported file paths
-      self._exportTemplate = dialog._exportTemplate
-      structureElement = dialog._exportTemplateViewer.selection()
-      self._processorPreset = dialog._preset
-      if structureElement is not None:
-        # Grab the elements relative path
-        self._elementPath = structureElement.path()
-        self._elementPreset = structureElement.preset()
-
-        resolver = hiero.core.ResolveTable()
-        resolver.merge(dialog._resolver)
-        resolver.merge(self._elementPreset.createResolver())
-        self._resolver = resolver
-        self._project = project
-
-        return True
-
-    return False
-
-  def doit(self):
-    selection = {}
-
-    for trackItem in self.selection.selectedResults():
+class BatchTrackBuilder(object):
+  '''Builds tracks from Find results spread over many sequences. Mixed into
+     the Build Track actions ahead of the Hiero action, it replaces their
+     doit and _buildTrack.
+
+     The results are grouped by project and sequence before anything is
+     built and each project is configured once. The tracks of all the
+     sequences of a project are built in a single undo group, so one undo
+     takes the whole build back. The external files of a source clip are
+     resolved once per shot name, track and sequence, and their latest
+     versions looked up once however many shots use them. The viewers are
+     only told about the edits once every project has been built, and the
+     project tracker once per project.
+     Cancelling a collision dialog stops the build, and what was already
+     built in that project is undone. Projects finished before it are kept.
+  '''
+  def groupTrackItems(self, trackItems):
+    '''@trackItems grouped by project and then by sequence, each in the order
+       first seen: a list of (project, [(sequence, [trackItems])]).
+    '''
+    projects = []
+    projectSequences = {}
+    sequenceItems = {}
+    seen = set()
+    for trackItem in trackItems:
+      if trackItem in seen:
+        continue
+      seen.add(trackItem)
       sequence = trackItem.parentSequence()
-      project = sequence.project()
-      try:
-        selection[project]
-      except:
-        selection[project] = {}
-        selection[project]['sequences'] = {}
-
-      if not sequence in selection[project]['sequences']:
-        selection[project]['sequences'][sequence] = []
-
-      if not trackItem in selection[project]['sequences'][sequence]:
-        selection[project]['sequences'][sequence].append(trackItem)
-
-    for key,value in selection.iteritems():
-      for sequence, items in selection[key]['sequences'].iteritems():
+      if sequence not in sequenceItems:
         project = sequence.project()
+        if project not in projectSequences:
+          projectSequences[project] = []
+          projects.append((project, projectSequences[project]))
+        sequenceItems[sequence] = []
+        projectSequences[project].append((sequence, sequenceItems[sequence]))
+      sequenceItems[sequence].append(trackItem)
+    return projects
 
-        if not self.configure(project, items):
+  def doit(self):
+    self._externalFiles = {}
+    self._latestFiles = {}
+    editedSequences = []
+    try:
+      for project, sequences in self.groupTrackItems(self.selection.selectedResults()):
+        if not self.configure(project, [trackItem for sequence, trackItems in sequences for trackItem in trackItems]):
           return
+        # The files resolved depend on how the project was configured
+        self._externalFiles = {}
 
-        self._buildTrack(items, sequence, project)
+        self._editsMade = False
+        cancelled = False
+        project.beginUndo("Build external media track")
+        try:
+          for sequence, trackItems in sequences:
+            if not self._buildTrack(trackItems, sequence, project):
+              cancelled = True
+              break
+        # Ensure the undo gets closed even if there's an exception
+        finally:
+          # End undo group (this does the actual editing, hence BEFORE sequence.editFinished())
+          project.endUndo()
+          if cancelled and self._editsMade:
+            # Take back the tracks already built for this project
+            project.undo()
+          if self._editsMade:
+            # New tracks, shots and bins: the Find indexes must look again
+            for sequence, trackItems in sequences:
+              HieroProjectTracker.projectTracker.sequenceChanged(sequence, [])
+              editedSequences.append(sequence)
+            HieroProjectTracker.projectTracker.projectEdited(project)
+
+        if cancelled:
+          self._errors = []
+          return
 
         if self._errors:
           msgBox = QMessageBox(hiero.ui.mainWindow())
@@ -1502,80 +1514,127 @@ class BuildTrackCustom(BuildExternalMediaTrackAction):
           msgBox.setDetailedText( '\n'.join(self._errors) )
           msgBox.exec_()
           self._errors = []
+    finally:
+      # Send signal to update viewers (TimelineEditor, SpreadsheetView, Viewer)
+      for sequence in editedSequences:
+        sequence.editFinished()
+
+  def externalFiles(self, trackItem):
+    '''The external files of @trackItem, resolved once per source clip and
+       the shot, track and sequence names the export paths can use
+    '''
+    key = (trackItem.source(), trackItem.name(), trackItem.parentTrack().name(), trackItem.parentSequence().name())
+    if key not in self._externalFiles:
+      self._externalFiles[key] = self.getExternalFilePaths(trackItem)
+    return self._externalFiles[key]
+
+  def latestFiles(self, files):
+    '''The latest versions of @files, looked up once per build
+    '''
+    key = tuple(files)
+    if key not in self._latestFiles:
+      self._latestFiles[key] = BuildTrackActionBase.findFiles( files )
+    return self._latestFiles[key]
 
   def _buildTrack(self, selection, sequence, project):
-    # Begin undo group
-    project.beginUndo("Build external media track")
+    '''Build the track for @selection in @sequence. Must be called inside an
+       undo group of @project, and sequence.editFinished() called after it.
+       Returns False if the user cancelled, sets _editsMade if anything
+       was added to the sequence.
+    '''
+    #Loop waiting for either a collision handling option or a blank track
+    readyToBuild = 0
+    trackName = self.trackName()
+    while readyToBuild == 0 :
+      #Get the destination track
+      track, isNewTrack = BuildTrack.FindOrCreateTrack(sequence, trackName)
+
+      if not isNewTrack :
+
+        #Look for collisions
+        newSelection, returnedTrack = self.checkTrackItemCollisions(selection, track)
+
+        #Check if the user cancelled
+        if returnedTrack == None:
+          return False
+
+        #If user choose to deal with collisions then we do build
+        if newSelection != None :
+          selection = newSelection
+          track = returnedTrack
+          readyToBuild = 1
 
-    try:
-      #Loop waiting for either a collision handling option or a blank track
-      readyToBuild = 0
-      trackName = self.trackName()
-      while readyToBuild == 0 :
-        #Get the destination track
-        track, isNewTrack = BuildTrack.FindOrCreateTrack(sequence, trackName)
+        #Else user wants to make a new track
+        else :
+          trackName = returnedTrack
+          readyToBuild = 0
 
-        if not isNewTrack :
+      else :
+        self._editsMade = True
+        readyToBuild = 1
 
-          #Look for collisions
-          newSelection, returnedTrack = self.checkTrackItemCollisions(selection, track)
+    #If there's nothing to do, stop doing things.
+    if len(selection) == 0 :
+      return True
 
-          #Check if the user cancelled
-          if returnedTrack == None:
-            return False
+    self._editsMade = True
+    # TODO: Allow the user to choose a destination in the bin
+    bin = BuildTrack.FindOrCreateBin(project, track.name())
 
-          #If user choose to deal with collisions then we do build
-          if newSelection != None :
-            selection = newSelection
-            track = returnedTrack
-            readyToBuild = 1
+    # Collision handling: store collided items in sets, to be removed at the end (preventing from removing the same item twice)
+    collidedTransitions = set()
 
-          #Else user wants to make a new track
-          else :
-            trackName = returnedTrack
-            readyToBuild = 0
+    for originalTrackItem in selection:
+      # TrackItems
+      if isinstance(originalTrackItem, hiero.core.TrackItem):
+        if isinstance(originalTrackItem.source(), hiero.core.Clip):
 
-        else :
-          readyToBuild = 1
+          files = self.externalFiles(originalTrackItem)
+          if self._useMaxVersions:
+            files = self.latestFiles( files )
+          start, duration, handles, offset = self.getExpectedRange( originalTrackItem )
+          self.buildShotFromFiles(files, originalTrackItem.name(), sequence, track, bin, originalTrackItem, start, duration, handles, offset)
+      elif isinstance(originalTrackItem, hiero.core.Transition):
+        # Check for colliding transitions
+        BuildTrack.CheckForTransitionCollisions(originalTrackItem, track, isNewTrack, collidedTransitions)
+        track.addTransition(originalTrackItem.clone())
 
-      #If there's nothing to do, stop doing things.
-      if len(selection) == 0 :
-        project.endUndo()
-        return True
+    # Remove collided transitions
+    for item in collidedTransitions:
+      track.removeTransition(item)
 
-      # TODO: Allow the user to choose a destination in the bin
-      bin = BuildTrack.FindOrCreateBin(project, track.name())
+    return True
 
-      # Collision handling: store collided items in sets, to be removed at the end (preventing from removing the same item twice)
-      collidedTransitions = set()
+class BuildTrackCustom(BatchTrackBuilder, BuildExternalMediaTrackAction):
+  def __init__(self, selection):
+    super(BuildExternalMediaTrackAction, self).__init__("From Export Structure")
+    self.selection = selection
+    if not self.selection.hasSelectedResults():
+      self.setEnabled(False)
 
-      for originalTrackItem in selection:
-        # TrackItems
-        if isinstance(originalTrackItem, hiero.core.TrackItem):
-          if isinstance(originalTrackItem.source(), hiero.core.Clip):
+  def configure(self, project, selection):
+    dialog = self.BuildExternalMediaTrack(selection)
+    if dialog.exec_():
+      self._trackName = dialog.trackName()
 
-            files = self.getExternalFilePaths(originalTrackItem)
-            if self._useMaxVersions:
-              files = BuildTrackActionBase.findFiles( files )
-            start, duration, handles, offset = self.getExpectedRange( originalTrackItem )
-            self.buildShotFromFiles(files, originalTrackItem.name(), sequence, track, bin, originalTrackItem, start, duration, handles, offset)
-        elif isinstance(originalTrackItem, hiero.core.Transition):
-          # Check for colliding transitions
-          BuildTrack.CheckForTransitionCollisions(originalTrackItem, track, isNewTrack, collidedTransitions)
-          track.addTransition(originalTrackItem.clone())
+      # Determine the exported file paths
+      self._exportTemplate = dialog._exportTemplate
+      structureElement = dialog._exportTemplateViewer.selection()
+      self._processorPreset = dialog._preset
+      if structureElement is not None:
+        # Grab the elements relative path
+        self._elementPath = structureElement.path()
+        self._elementPreset = structureElement.preset()
 
-      # Remove collided transitions
-      for item in collidedTransitions:
-        track.removeTransition(item)
+        resolver = hiero.core.ResolveTable()
+        resolver.merge(dialog._resolver)
+        resolver.merge(self._elementPreset.createResolver())
+        self._resolver = resolver
+        self._project = project
 
-      return True
-    # Ensure the undo gets closed even if there's an exception
-    finally:
-      # End undo group (this does the actual editing, hence BEFORE sequence.editFinished())
-      project.endUndo()
-      # Send signal to update viewers (TimelineEditor, SpreadsheetView, Viewer)
-      sequence.editFinished()
+        return True
 
+    return False
 
   class BuildExternalMediaTrack(QDialog):
     def __init__(self,  selection,  parent=None):
@@ -1666,50 +1725,14 @@ class BuildTrackCustom(BuildExternalMediaTrackAction):
     def trackName(self):
       return str(self._tracknameField.text())
 
-class BuildTrackFromExportTag(BuildTrackFromExportTagAction):
+class BuildTrackFromExportTag(BatchTrackBuilder, BuildTrackFromExportTagAction):
   def __init__(self, selection):
     super(BuildTrackFromExportTagAction, self).__init__("From Export Tag")
     self.selection = selection
 
-    if not len(self.selection.tableWidget.selectedIndexes()):
+    if not self.selection.hasSelectedResults():
       self.setEnabled(False)
 
-  def doit(self):
-    selection = {}
-
-    for trackItem in self.selection.selectedResults():
-      sequence = trackItem.parentSequence()
-      project = sequence.project()
-      try:
-        selection[project]
-      except:
-        selection[project] = {}
-        selection[project]['sequences'] = {}
-
-      if not sequence in selection[project]['sequences']:
-        selection[project]['sequences'][sequence] = []
-
-      if not trackItem in selection[project]['sequences'][sequence]:
-        selection[project]['sequences'][sequence].append(trackItem)
-
-
-    for key,value in selection.iteritems():
-      for sequence, items in selection[key]['sequences'].iteritems():
-        project = sequence.project()
-
-        if not self.configure(project, items):
-          return
-
-        self._buildTrack(items, sequence, project)
-
-        if self._errors:
-          msgBox = QMessageBox(hiero.ui.mainWindow())
-          msgBox.setWindowTitle("Build Media Track")
-          msgBox.setText("There were problems building the track.")
-          msgBox.setDetailedText( '\n'.join(self._errors) )
-          msgBox.exec_()
-          self._errors = []
-
 class OpenInNukeAction(OpenTrackItemsInNuke):
   def __init__(self, selection, hieroState, title="Open in Nuke..."):
     BuildTrackFromExportTagAction.__init__(self)
@@ -1744,7 +1767,7 @@ class CreateNewSequence(QAction):
     self.selection = selection
     self.triggered.connect(self.createNewSequence)
 
-    if not len(self.selection.tableWidget.selectedIndexes()):
+    if not self.selection.hasSelectedResults():
       self.setEnabled(False)
 
   def createNewSequence(self):
@@ -1764,16 +1787,17 @@ class CreateNewSequence(QAction):
 
       bin = project.clipsBin()
       sequence = hiero.core.Sequence("TaggedShots")
+      # Items that overlap one already placed go on the next free track
+      occupancy = HieroTrackOccupancy.SequenceOccupancy()
+      tracks = {}
       for item in trackItemList:
-        itemrange = range(item.timelineIn(), item.timelineOut()+1)
-        track, isNewTrack = self.selection.FindOrCreateTrack(sequence, item.parentTrack().name())
-        for clip in track.items():
-          cliprange = range(clip.timelineIn(), clip.timelineOut()+1)
-          if list(set(cliprange) & set(itemrange)):
-            # clips overlap so try to add the clip to the next track
-            track, isNewTrack = self.selection.FindOrCreateTrack(sequence, item.parentTrack().name() + "_1")
-        track.addTrackItem(item.clone())
+        trackName = occupancy.place(item.parentTrack().name(), item.timelineIn(), item.timelineOut())
+        if trackName not in tracks:
+          tracks[trackName], isNewTrack = self.selection.FindOrCreateTrack(sequence, trackName)
+        tracks[trackName].addTrackItem(item.clone())
       bin.addItem(hiero.core.BinItem(sequence))
+      # The bins have changed, Find and the tag filter must walk them again
+      HieroProjectTracker.projectTracker.projectEdited(project)
 
 
 # Create the widget and add to the Window menu
@@ -0,0 +1,399 @@
+# HieroProjectTracker.py
+# Follows project and edit events in Hiero so the search indexes used by the
+# Find panel (see HieroFindIndex.py) only re-read what changed since the last
+# search, instead of being rebuilt from hiero.core.projects() every time.
+# Also provides a cached walk of the clips, sequences and track items in each
+# project, shared by the Find panel, its tag filter and the status bar Find.
+
+import hiero.core
+import hiero.ui
+import HieroFindIndex
+import HieroShotSnapshot
+import HieroBinWalk
+
+class ProjectContents(object):
+  '''The clips, sequences and track items of a project, found with a single
+     walk of its bins and kept until the project is edited.
+  '''
+  def __init__(self, project):
+    self.project = project
+    self.clipBinItems = []
+    self.sequenceBinItems = []
+    self.clips = []
+    self.sequences = []
+    for binItem in HieroBinWalk.walkBin(project.clipsBin()):
+      activeItem = binItem.activeItem()
+      if isinstance(activeItem, hiero.core.Clip):
+        self.clipBinItems.append(binItem)
+        self.clips.append(activeItem)
+      if isinstance(activeItem, hiero.core.Sequence):
+        self.sequenceBinItems.append(binItem)
+        self.sequences.append(activeItem)
+
+    self._trackItems = {}
+    self._allTrackItems = {}
+
+  def trackItems(self, sequence):
+    '''The track items of @sequence, without linked duplicates.
+    '''
+    if sequence not in self._trackItems:
+      self._trackItems[sequence] = HieroFindIndex.uniqueTrackItems(sequence)
+    return self._trackItems[sequence]
+
+  def allTrackItems(self, sequence):
+    '''Every track item of @sequence, on all video and audio tracks.
+    '''
+    if sequence not in self._allTrackItems:
+      self._allTrackItems[sequence] = [ti for track in sequence for ti in track]
+    return self._allTrackItems[sequence]
+
+  def sequenceEdited(self, sequence):
+    self._trackItems.pop(sequence, None)
+    self._allTrackItems.pop(sequence, None)
+
+class ProjectChangeTracker(object):
+  '''Keeps the per project search indexes and contents in step with edits.
+
+     Projects are dropped from the index when they are closed or reloaded,
+     and the bin contents are walked again after the bin view is used.
+     Timeline and spreadsheet views report their selection while an editor is
+     working in them, so the sequences shown in those views are checked for
+     added, removed, renamed or retagged shots before each search, and the
+     selected track items (the ones tags and metadata are being changed on)
+     are read again in full. Sequences nobody has touched are left alone.
+     Each edit is applied once: the sequences and track items waiting to be
+     checked are forgotten once the indexes have been brought up to date.
+     Shots can be edited while they stay selected, without a new selection
+     event, so the views that are still open are also checked each time the
+     indexes are used: if the number of items on the tracks of a view's
+     sequence, or the text or tags of its selected shots, differ from the
+     last check, the sequence and its selection are pending again.
+
+     generation goes up whenever an edit has been found (or, in sequences
+     that aren't indexed, may have been made), so results computed from the
+     contents can be kept until it changes.
+
+     Sequences shown in those views are also remembered as edited until
+     their project is saved, as is a whole project edited by a script. The
+     first search of a saved project with no edits caches a shot snapshot
+     (see HieroShotSnapshot.py) of that save, and from then on, including
+     when it is opened again, the searchable text of the sequences nobody
+     has edited is read from the snapshot instead of Hiero.
+  '''
+  def __init__(self):
+    self._contents = {}
+    self._tagIndex = HieroFindIndex.TagIndex()
+    # Sequences edited since the last search, to the track items selected in them
+    self._editedSequences = {}
+    # Sequences whose tags may have changed, and whether projects, bins or
+    # sequences may have come or gone, since the tag index was last updated
+    self._retaggedSequences = set()
+    self._tagIndexStale = True
+    # Timeline and spreadsheet views that have reported a selection, and
+    # what their sequences and selections looked like when last checked
+    self._openViews = set()
+    self._openViewStates = {}
+    # Sequences edited since each project was opened or saved, and the
+    # projects whose bins or shots were edited by a script
+    self._unsavedSequences = {}
+    self._editedProjects = set()
+    # The snapshot of each project's last save and its rows by sequence
+    # name, or None if there isn't one cached
+    self._savedSnapshots = {}
+    self.generation = 0
+
+    hiero.core.events.registerInterest(hiero.core.events.EventType.kAfterProjectLoad, self.projectOpened)
+    hiero.core.events.registerInterest(hiero.core.events.EventType.kAfterNewProjectCreated, self.projectOpened)
+    hiero.core.events.registerInterest(hiero.core.events.EventType.kAfterProjectSave, self.projectSaved)
+    hiero.core.events.registerInterest(hiero.core.events.EventType.kBeforeProjectClose, self.projectClosed)
+    hiero.core.events.registerInterest(hiero.core.events.EventType.kSelectionChanged, self.selectionChanged)
+
+  def contents(self, project):
+    '''The cached ProjectContents of @project
+    '''
+    if project not in self._contents:
+      self._contents[project] = ProjectContents(project)
+    return self._contents[project]
+
+  def tagIndex(self):
+    '''The TagIndex of every track item in all open projects. It is kept
+       until a view being edited reports a selection or the projects change,
+       and then only sequences that are new or were edited are read again.
+    '''
+    self.checkOpenViews()
+    editedSequences = self._retaggedSequences
+    self._retaggedSequences = set()
+    if not self._tagIndexStale:
+      # Nothing has come or gone, only the edited sequences need reading
+      for sequence in editedSequences:
+        try:
+          self._tagIndex.updateSequence(sequence, self.contents(sequence.project()).allTrackItems(sequence))
+        except:
+          # The sequence has been deleted
+          self._tagIndex.removeSequence(sequence)
+      return self._tagIndex
+
+    self._tagIndexStale = False
+    sequences = set()
+    for project in hiero.core.projects():
+      contents = self.contents(project)
+      for sequence in contents.sequences:
+        sequences.add(sequence)
+        if sequence in editedSequences or not self._tagIndex.hasSequence(sequence):
+          self._tagIndex.updateSequence(sequence, contents.allTrackItems(sequence))
+
+    for sequence in self._tagIndex.sequences():
+      if sequence not in sequences:
+        self._tagIndex.removeSequence(sequence)
+
+    return self._tagIndex
+
+  def hasUnsavedEdits(self, project):
+    '''Whether @project has been edited since it was opened or saved
+    '''
+    return project in self._editedProjects or bool(self._unsavedSequences.get(project))
+
+  def snapshot(self, project):
+    '''A HieroShotSnapshot.ShotSnapshot of the shots in @project.
+       Saved projects are snapshotted once per save: the snapshot is loaded
+       from the cache if it was taken since the project file was last saved,
+       otherwise it is taken from the open project. It is only cached if the
+       project hasn't been edited since it was saved, so the cache never
+       holds edits the project file doesn't have.
+    '''
+    path = project.path()
+    snapshot = HieroShotSnapshot.loadCachedSnapshot(path)
+    if snapshot is not None:
+      return snapshot
+
+    contents = self.contents(project)
+    trackItems = []
+    for sequence in contents.sequences:
+      trackItems += contents.trackItems(sequence)
+    state = HieroShotSnapshot.projectFileState(path)
+    modified, size = state or (0.0, 0)
+    snapshot = HieroShotSnapshot.snapshotTrackItems(trackItems, path, modified, size)
+    if state is not None and not self.hasUnsavedEdits(project):
+      try:
+        HieroShotSnapshot.saveCachedSnapshot(snapshot)
+      except (IOError, OSError) as e:
+        print "Unable to cache the shot snapshot of %s: %s" % (path, str(e))
+    return snapshot
+
+  def savedRows(self, sequence):
+    '''Where to read the searchable text of @sequence in the snapshot of
+       its project's last save, if it hasn't been edited since: its track
+       items, the snapshot and the first and end rows of its shots.
+       Returns None if there is no snapshot or it doesn't match the sequence.
+       If the saved project hasn't been edited and has no cached snapshot,
+       one is taken the first time, so later searches can use it.
+       Only the fingerprints and timings of the track items are read from
+       Hiero, to check the rows are theirs. Edits to tag notes or metadata
+       made by scripts that don't call projectEdited() can't be seen.
+    '''
+    project = sequence.project()
+    if project in self._editedProjects or sequence in self._unsavedSequences.get(project, ()):
+      return None
+    if project not in self._savedSnapshots:
+      path = project.path()
+      snapshot = HieroShotSnapshot.loadCachedSnapshot(path)
+      if snapshot is None and not self.hasUnsavedEdits(project) and HieroShotSnapshot.projectFileState(path) is not None:
+        snapshot = self.snapshot(project)
+      self._savedSnapshots[project] = (snapshot, snapshot.sequenceRows()) if snapshot is not None else None
+    if self._savedSnapshots[project] is None:
+      return None
+
+    snapshot, sequenceRows = self._savedSnapshots[project]
+    trackItems = self.contents(project).trackItems(sequence)
+    for start, end in sequenceRows.get(sequence.name(), []):
+      if end - start != len(trackItems):
+        continue
+      for row, trackItem in enumerate(trackItems, start):
+        saved = (snapshot.value(row, "name"), snapshot.value(row, "sourceName"), len(snapshot.value(row, "tags")))
+        if (HieroFindIndex.fingerprint(trackItem) != saved or
+            trackItem.timelineIn() != snapshot.value(row, "timelineIn") or
+            trackItem.timelineOut() != snapshot.value(row, "timelineOut")):
+          break
+      else:
+        return trackItems, snapshot, start, end
+    return None
+
+  def projectOpened(self, event):
+    project = event.sender
+    if isinstance(project, hiero.core.Project):
+      self.forgetProject(project)
+
+  def projectSaved(self, event):
+    project = event.sender
+    if isinstance(project, hiero.core.Project):
+      self._unsavedSequences.pop(project, None)
+      self._editedProjects.discard(project)
+      self._savedSnapshots.pop(project, None)
+
+  def projectClosed(self, event):
+    project = event.sender
+    if isinstance(project, hiero.core.Project):
+      self.forgetProject(project)
+
+  def projectEdited(self, project):
+    '''Call after adding or removing clips, sequences or bins in @project,
+       or editing its shots from a script.
+    '''
+    self._editedProjects.add(project)
+    self._savedSnapshots.pop(project, None)
+    self._contents.pop(project, None)
+    self._tagIndexStale = True
+    self.generation += 1
+
+  def forgetProject(self, project):
+    '''Drop everything known about @project.
+    '''
+    self._contents.pop(project, None)
+    self._tagIndexStale = True
+    self.generation += 1
+    self._unsavedSequences.pop(project, None)
+    self._editedProjects.discard(project)
+    self._savedSnapshots.pop(project, None)
+    HieroFindIndex.discardProjectIndex(project)
+    for sequence in self._editedSequences.keys():
+      try:
+        if sequence.project() == project:
+          del self._editedSequences[sequence]
+      except:
+        # The sequence has already been deleted
+        del self._editedSequences[sequence]
+
+  def selectionChanged(self, event):
+    view = event.sender
+    if isinstance(view, hiero.ui.BinView):
+      # Clips, sequences and bins are added and removed in the bin view
+      self._contents.clear()
+      self._tagIndexStale = True
+      self.generation += 1
+      return
+    if not isinstance(view, (hiero.ui.TimelineEditor, hiero.ui.SpreadsheetView)):
+      return
+    sequence = view.sequence()
+    if not isinstance(sequence, hiero.core.Sequence):
+      return
+
+    self._openViews.add(view)
+    self.sequenceChanged(sequence, [item for item in view.selection() if isinstance(item, hiero.core.TrackItem)])
+
+    contents = self._contents.get(sequence.project())
+    if contents is not None:
+      if sequence in contents.sequences:
+        contents.sequenceEdited(sequence)
+      else:
+        # A sequence we haven't seen, so the bins have changed too
+        self.projectEdited(sequence.project())
+
+  def sequenceChanged(self, sequence, selection):
+    '''Mark @sequence, and the track items in @selection, as edited
+    '''
+    # Keep the items selected before too, they may have been edited since
+    self._editedSequences.setdefault(sequence, set()).update(selection)
+    self._retaggedSequences.add(sequence)
+    self._unsavedSequences.setdefault(sequence.project(), set()).add(sequence)
+
+  def checkOpenViews(self):
+    '''Mark the sequences of the open Timeline Editors and Spreadsheet
+       Views edited if they or their selected shots changed since the last
+       check. Views that have been closed are forgotten.
+    '''
+    views = set(self._openViews)
+    activeView = hiero.ui.activeView()
+    if isinstance(activeView, (hiero.ui.TimelineEditor, hiero.ui.SpreadsheetView)):
+      views.add(activeView)
+
+    states = {}
+    for view in views:
+      try:
+        sequence = view.sequence()
+        if not isinstance(sequence, hiero.core.Sequence):
+          continue
+        selection = [item for item in view.selection() if isinstance(item, hiero.core.TrackItem)]
+        trackSizes = tuple([len(list(track)) for track in sequence])
+        shots = dict([(item, (HieroFindIndex.searchableText(item), [tag.name() for tag in item.tags()])) for item in selection])
+      except:
+        # The view has been closed, or the shots deleted from under it
+        self._openViews.discard(view)
+        continue
+
+      self._openViews.add(view)
+      state = states.setdefault(sequence, (trackSizes, {}))
+      state[1].update(shots)
+      previous = self._openViewStates.get(sequence)
+      if previous is None:
+        continue
+      if previous[0] != trackSizes:
+        self.sequenceChanged(sequence, selection)
+        continue
+      edited = [item for item in selection if item in previous[1] and previous[1][item] != shots[item]]
+      if edited:
+        self.sequenceChanged(sequence, edited)
+
+    # Shots that are no longer selected are compared again once they are
+    self._openViewStates = states
+
+  def updateIndexes(self):
+    '''Apply the edits made since the last search to the indexes, then
+       forget them. generation only goes up if an edit was found.
+    '''
+    self.checkOpenViews()
+    editedSequences = self._editedSequences
+    self._editedSequences = {}
+    indexedProjects = HieroFindIndex.indexedProjects()
+    changed = False
+    for sequence, selectedTrackItems in editedSequences.iteritems():
+      try:
+        project = sequence.project()
+      except:
+        # The sequence has been deleted
+        changed = True
+        continue
+
+      index = HieroFindIndex.projectIndex(project) if project in indexedProjects else None
+      if index is None or not index.hasSequence(sequence):
+        # Nothing to compare against, so assume it was edited
+        changed = True
+        continue
+
+      with index.lock:
+        generation = index.generation
+        contents = self.contents(project)
+        contents.sequenceEdited(sequence)
+        index.updateSequence(sequence, contents.trackItems(sequence))
+        for trackItem in selectedTrackItems:
+          index.reindexTrackItem(trackItem)
+        changed = changed or index.generation != generation
+
+    if changed:
+      self.generation += 1
+
+projectTracker = ProjectChangeTracker()
+
+def projectContents(project):
+  return projectTracker.contents(project)
+
+def allSequences():
+  '''All sequences in all open projects
+  '''
+  sequences = []
+  for project in hiero.core.projects():
+    sequences += projectContents(project).sequences
+  return sequences
+
+def trackItems(sequence):
+  '''The track items of @sequence without linked duplicates, from the cache.
+  '''
+  return projectContents(sequence.project()).trackItems(sequence)
+
+def tagIndex():
+  return projectTracker.tagIndex()
+
+def snapshot(project):
+  return projectTracker.snapshot(project)
+
+def savedRows(sequence):
+  return projectTracker.savedRows(sequence)
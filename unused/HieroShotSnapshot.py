@@ -0,0 +1,326 @@
+# HieroShotSnapshot.py
+# Snapshots of the shot data of a project (names, tracks, timings, reels, tags
+# and metadata) stored column by column in a compact cache file, so the tools
+# in this directory can load a project's searchable state without going back
+# to the Hiero object model. Snapshots are keyed by the project file and its
+# modification time and size, a snapshot of another save of the project is
+# not used.
+#
+# File layout: a magic line, the length of a JSON header, the header, then
+# one block of packed arrays per column. Text columns are dictionary encoded:
+# each distinct string is stored once and rows hold indices into that table.
+# This module does not import hiero itself, it only calls methods on the
+# objects it is given, so snapshots can be read outside Hiero.
+
+import os
+import sys
+import json
+import struct
+import hashlib
+import tempfile
+from array import array
+
+kMagic = "HIEROSNAPSHOT3\n"
+
+# Kinds of column
+kInt = "int"
+kFloat = "float"
+kString = "string"
+kStrings = "strings"
+kPairs = "pairs"
+
+# The columns of a snapshot, in file order
+kColumns = [ ("name", kString),
+             ("sourceName", kString),
+             ("track", kString),
+             ("sequence", kString),
+             ("project", kString),
+             ("timelineIn", kInt),
+             ("timelineOut", kInt),
+             ("sourceIn", kFloat),
+             ("sourceOut", kFloat),
+             ("reel", kString),
+             ("tags", kStrings),
+             ("notes", kStrings),
+             ("metadata", kPairs),
+             ("sourceMetadata", kPairs) ]
+
+# Where snapshots are cached unless told otherwise
+kDefaultCacheDirectory = os.path.join(os.path.expanduser("~"), ".hiero", "snapshots")
+
+def readShot(trackItem):
+  '''Read the snapshot fields of @trackItem from Hiero.
+     Returns a dictionary of column name to value.
+  '''
+  metadata = trackItem.metadata()
+  items = [(key, metadata.value(key)) for key in metadata.keys()]
+  sourceMetadata = trackItem.source().metadata()
+  reel = ""
+  if metadata.hasKey("foundry.edl.sourceReel"):
+    reel = metadata.value("foundry.edl.sourceReel")
+  tags = trackItem.tags()
+  return { "name" : trackItem.name(),
+           "sourceName" : trackItem.source().name(),
+           "track" : trackItem.parentTrack().name(),
+           "sequence" : trackItem.parentSequence().name(),
+           "project" : trackItem.project().name(),
+           "timelineIn" : trackItem.timelineIn(),
+           "timelineOut" : trackItem.timelineOut(),
+           "sourceIn" : trackItem.sourceIn(),
+           "sourceOut" : trackItem.sourceOut(),
+           "reel" : reel,
+           "tags" : [tag.name() for tag in tags],
+           "notes" : [tag.note() for tag in tags],
+           "metadata" : items,
+           "sourceMetadata" : [(key, sourceMetadata.value(key)) for key in sourceMetadata.keys()] }
+
+class StringTable(object):
+  '''Each distinct string once, with the index of every string kept for
+     encoding. Strings are stored as UTF-8 and may not contain NUL.
+  '''
+  def __init__(self, strings=None):
+    self.strings = strings if strings is not None else []
+    self._codes = None
+
+  def code(self, text):
+    if self._codes is None:
+      self._codes = dict([(string, i) for i, string in enumerate(self.strings)])
+    if isinstance(text, unicode):
+      text = text.encode("utf-8")
+    else:
+      text = str(text)
+    code = self._codes.get(text)
+    if code is None:
+      code = self._codes[text] = len(self.strings)
+      self.strings.append(text.replace("\0", ""))
+    return code
+
+  def tostring(self):
+    return "\0".join(self.strings)
+
+  @staticmethod
+  def fromstring(data, count):
+    return StringTable(data.split("\0") if count else [])
+
+class ShotSnapshot(object):
+  '''The shot data of a project stored by column.
+     @projectPath, @modified and @size identify the save of the project it
+     was taken from.
+  '''
+  def __init__(self, projectPath="", modified=0.0, size=0):
+    self.projectPath = os.path.abspath(projectPath) if projectPath else ""
+    self.modified = modified
+    self.size = size
+    self.rows = 0
+    self.strings = StringTable()
+    self.columns = {}
+    for name, kind in kColumns:
+      if kind == kInt:
+        self.columns[name] = array("i")
+      elif kind == kFloat:
+        self.columns[name] = array("d")
+      elif kind == kString:
+        self.columns[name] = array("i")
+      elif kind == kStrings:
+        self.columns[name] = (array("i", [0]), array("i"))
+      elif kind == kPairs:
+        self.columns[name] = (array("i", [0]), array("i"), array("i"))
+
+  def __len__(self):
+    return self.rows
+
+  def addShot(self, shot):
+    '''Add a row for @shot, a dictionary as returned by readShot.
+    '''
+    code = self.strings.code
+    for name, kind in kColumns:
+      column = self.columns[name]
+      value = shot[name]
+      if kind in (kInt, kFloat):
+        column.append(value)
+      elif kind == kString:
+        column.append(code(value))
+      elif kind == kStrings:
+        offsets, codes = column
+        codes.extend([code(text) for text in value])
+        offsets.append(len(codes))
+      elif kind == kPairs:
+        offsets, keys, values = column
+        keys.extend([code(key) for key, item in value])
+        values.extend([code(item) for key, item in value])
+        offsets.append(len(keys))
+    self.rows += 1
+
+  def value(self, row, name):
+    '''The value of column @name in @row
+    '''
+    kind = dict(kColumns)[name]
+    column = self.columns[name]
+    strings = self.strings.strings
+    if kind in (kInt, kFloat):
+      return column[row]
+    if kind == kString:
+      return strings[column[row]]
+    if kind == kStrings:
+      offsets, codes = column
+      return [strings[code] for code in codes[offsets[row]:offsets[row+1]]]
+    offsets, keys, values = column
+    start, end = offsets[row], offsets[row+1]
+    return [(strings[key], strings[item]) for key, item in zip(keys[start:end], values[start:end])]
+
+  def row(self, row):
+    '''All the values of @row, as returned by readShot
+    '''
+    return dict([(name, self.value(row, name)) for name, kind in kColumns])
+
+  def sequenceRows(self):
+    '''The rows of each sequence, a dictionary of sequence name to a list
+       of (first row, end row) ranges. The shots of a sequence are added
+       together, so a sequence has one range unless another has its name.
+    '''
+    ranges = {}
+    sequences = self.columns["sequence"]
+    start = 0
+    for row in range(1, self.rows + 1):
+      if row == self.rows or sequences[row] != sequences[start]:
+        ranges.setdefault(self.strings.strings[sequences[start]], []).append((start, row))
+        start = row
+    return ranges
+
+  def column(self, name):
+    '''Every value of column @name, in row order
+    '''
+    kind = dict(kColumns)[name]
+    if kind in (kInt, kFloat):
+      return self.columns[name].tolist()
+    if kind == kString:
+      strings = self.strings.strings
+      return [strings[code] for code in self.columns[name]]
+    return [self.value(row, name) for row in range(self.rows)]
+
+  def write(self, path):
+    '''Write the snapshot to @path. The file is written next to @path and
+       then renamed over it, so readers never see a partly written file.
+    '''
+    blocks = []
+    layout = []
+    for name, kind in kColumns:
+      column = self.columns[name]
+      arrays = column if isinstance(column, tuple) else (column,)
+      layout.append([name, kind, [(item.typecode, len(item)) for item in arrays]])
+      blocks += [item.tostring() for item in arrays]
+    strings = self.strings.tostring()
+    header = json.dumps({ "projectPath" : self.projectPath,
+                          "modified" : self.modified,
+                          "size" : self.size,
+                          "rows" : self.rows,
+                          "byteorder" : sys.byteorder,
+                          "strings" : [len(self.strings.strings), len(strings)],
+                          "columns" : layout })
+
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    handle, temporaryPath = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+      with os.fdopen(handle, "wb") as f:
+        f.write(kMagic)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(strings)
+        for block in blocks:
+          f.write(block)
+      if os.path.exists(path) and sys.platform.startswith("win"):
+        os.remove(path)
+      os.rename(temporaryPath, path)
+    except:
+      if os.path.exists(temporaryPath):
+        os.remove(temporaryPath)
+      raise
+
+  @staticmethod
+  def readHeader(f):
+    '''Read the header of an open snapshot file. Raises ValueError if it
+       isn't a snapshot.
+    '''
+    if f.read(len(kMagic)) != kMagic:
+      raise ValueError("Not a shot snapshot")
+    length, = struct.unpack("<I", f.read(4))
+    return json.loads(f.read(length))
+
+  @staticmethod
+  def read(path):
+    '''Load a snapshot written by write. Raises ValueError if @path isn't one.
+    '''
+    with open(path, "rb") as f:
+      header = ShotSnapshot.readHeader(f)
+      data = f.read()
+
+    snapshot = ShotSnapshot(header["projectPath"], header["modified"], header["size"])
+    snapshot.rows = header["rows"]
+    stringCount, stringBytes = header["strings"]
+    snapshot.strings = StringTable.fromstring(data[:stringBytes], stringCount)
+    offset = stringBytes
+    swap = header["byteorder"] != sys.byteorder
+    for name, kind, arrays in header["columns"]:
+      if name not in snapshot.columns:
+        raise ValueError("Unknown snapshot column %s" % name)
+      loaded = []
+      for typecode, length in arrays:
+        item = array(str(typecode))
+        size = item.itemsize * length
+        item.fromstring(data[offset:offset+size])
+        if swap:
+          item.byteswap()
+        offset += size
+        loaded.append(item)
+      snapshot.columns[name] = tuple(loaded) if len(loaded) > 1 else loaded[0]
+    return snapshot
+
+def snapshotTrackItems(trackItems, projectPath="", modified=0.0, size=0):
+  '''Take a snapshot of @trackItems
+  '''
+  snapshot = ShotSnapshot(projectPath, modified, size)
+  for trackItem in trackItems:
+    snapshot.addShot(readShot(trackItem))
+  return snapshot
+
+def projectFileState(projectPath):
+  '''The modification time and size of the project file at @projectPath,
+     or None if it hasn't been saved.
+  '''
+  if not projectPath or not os.path.exists(projectPath):
+    return None
+  info = os.stat(projectPath)
+  return info.st_mtime, info.st_size
+
+def cachePath(projectPath, cacheDirectory=None):
+  '''The snapshot cache file of the project file at @projectPath
+  '''
+  directory = cacheDirectory or kDefaultCacheDirectory
+  key = hashlib.sha1(os.path.abspath(projectPath)).hexdigest()
+  return os.path.join(directory, key + ".snapshot")
+
+def loadCachedSnapshot(projectPath, cacheDirectory=None):
+  '''The cached snapshot of the project file at @projectPath, or None if
+     there isn't one taken from its current save.
+  '''
+  state = projectFileState(projectPath)
+  path = cachePath(projectPath, cacheDirectory)
+  if state is None or not os.path.exists(path):
+    return None
+  try:
+    with open(path, "rb") as f:
+      header = ShotSnapshot.readHeader(f)
+    if header["projectPath"] != os.path.abspath(projectPath) or (header["modified"], header["size"]) != state:
+      return None
+    return ShotSnapshot.read(path)
+  except (IOError, ValueError, KeyError, struct.error):
+    return None
+
+def saveCachedSnapshot(snapshot, cacheDirectory=None):
+  '''Cache @snapshot for its project file. Returns the cache file path.
+  '''
+  path = cachePath(snapshot.projectPath, cacheDirectory)
+  snapshot.write(path)
+  return path
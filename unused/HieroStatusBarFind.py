@@ -15,6 +15,9 @@ from hiero.ui.nuke_bridge.send_to_nuke import *
 from hiero.ui.nuke_bridge.hiero_state import *
 import re
 import ast
+import HieroFindIndex
+import HieroProjectTracker
+import HieroFindNavigation
 
 class FindAction(QAction):
   def __init__(self):
@@ -32,19 +35,11 @@ class FindAction(QAction):
           if sub.text() == "Find":
             sub.trigger()
 
-    for widget in QApplication.allWidgets():
-      try:
-        if widget.windowTitle() == "Find":
-          widget.setFocus()
-          for child in widget.findChildren(QWidget):
-            if child.objectName() == "tagfilterbox":
-              child.populateFromTags()
-          for child in widget.findChildren(QLineEdit):
-            if child.objectName() == "searchTextField":
-              child.setFocus()
-          break
-      except:
-        pass
+    findPanel = HieroFindNavigation.viewerRegistry.findPanel()
+    if findPanel is not None:
+      findPanel.setFocus()
+      findPanel.tagbox.populateFromTags()
+      findPanel.searchTextField.setFocus()
 
   class FindBar(QWidget):
     def __init__(self):
@@ -146,7 +141,8 @@ class FindAction(QAction):
       '''Save some recent searches like Google
       '''
       searchmodel = QStandardItemModel()
-      for i, word in enumerate(set(self.searchTextList)):
+      # Most recent first
+      for i, word in enumerate(reversed(self.searchTextList)):
         item = QStandardItem(word)
         searchmodel.setItem(i, 0, item)
 
@@ -172,13 +168,7 @@ class FindAction(QAction):
 
       searchText = self.searchTextField.text().encode("utf-8")
       if searchText:
-        if len(self.searchTextList) == 10:
-          self.searchTextList.pop(0)
-        if searchText not in self.searchTextList:
-          self.searchTextList.append(searchText)
-        else:
-          self.searchTextList.pop(self.searchTextList.index(searchText))
-          self.searchTextList.append(searchText)
+        HieroFindIndex.rememberSearch(self.searchTextList, searchText)
         self.loadAutocompleter()
 
       settings = hiero.core.ApplicationSettings()
@@ -190,178 +180,21 @@ class FindAction(QAction):
       except:
         pass
 
-      for trackItem in trackItemList:
-        matchName = trackItem.name()
-        matchSourceName = trackItem.source().name()
-        matchMetadata = trackItem.metadata()
-        matchSourceMetadata = trackItem.source().metadata()
-        tagText = [item.note() for item in trackItem.tags()]
-
-        if self.ignoreCase.isChecked() and self.useRegex.isChecked():
-          try:
-            regex = re.compile(searchText, re.IGNORECASE)
-          except Exception as e:
-            self.updateStatusBar("Invalid regex: %s" % str(e))
-            regex = None
-
-        if not self.ignoreCase.isChecked() and self.useRegex.isChecked():
-          try:
-            regex = re.compile(searchText)
-          except Exception as e:
-            self.updateStatusBar("Invalid regex: %s" % str(e))
-            regex = None
-
-        if self.searchOptionsComboBox.currentText() == "Search Names":
-          if self.ignoreCase.checkState() == Qt.Checked:
-            if self.useRegex.isChecked():
-              if regex:
-                nameMatch = regex.search(trackItem.name().lower())
-                sourceNameMatch = regex.search(trackItem.source().name().lower())
-                if nameMatch or sourceNameMatch:
-                  self.matchList.append(trackItem)
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-              for ref in [matchName, matchSourceName]:
-                if searchText.lower() in ref.lower():
-                  self.matchList.append(trackItem)
-                  break
-          else:
-            if self.useRegex.isChecked():
-              if regex:
-                nameMatch = regex.search(trackItem.name())
-                sourceNameMatch = regex.search(trackItem.source().name())
-                if nameMatch or sourceNameMatch:
-                  self.matchList.append(trackItem)
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-              for ref in [matchName, matchSourceName]:
-                if searchText in ref:
-                  self.matchList.append(trackItem)
-                  break
-
-        if self.searchOptionsComboBox.currentText() == "Search Metadata":
-          if self.ignoreCase.isChecked():
-            if self.useRegex.isChecked():
-              if regex:
-                metaMatch = regex.search(str(matchMetadata).lower())
-                sourcemetaMatch = regex.search(str(matchSourceMetadata).lower())
-                if metaMatch or sourcemetaMatch:
-                  self.matchList.append(trackItem)
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-              for ref in [str(matchMetadata), str(matchSourceMetadata)]:
-                if searchText.lower() in ref.lower():
-                  self.matchList.append(trackItem)
-                  break
-          else:
-            if self.useRegex.isChecked():
-              if regex:
-                metaMatch = regex.search(str(matchMetadata))
-                sourcemetaMatch = regex.search(str(matchSourceMetadata))
-                if metaMatch or sourcemetaMatch:
-                  self.matchList.append(trackItem)
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-              for ref in [str(matchMetadata), str(matchSourceMetadata)]:
-                if searchText in ref:
-                  self.matchList.append(trackItem)
-                  break
-
-        if self.searchOptionsComboBox.currentText() == "Search All":
-          if self.ignoreCase.isChecked():
-            if self.useRegex.isChecked():
-              if regex:
-                nameMatch = regex.search(trackItem.name().lower())
-                sourceNameMatch = regex.search(trackItem.source().name().lower())
-                metaMatch = regex.search(str(matchMetadata).lower())
-                sourcemetaMatch = regex.search(str(matchSourceMetadata).lower())
-                tagMatch = None
-                for tag in trackItem.tags():
-                  tagMatch = regex.search(tag.note().lower())
-                  if tagMatch:
-                    break
-                if nameMatch or sourceNameMatch or metaMatch or sourcemetaMatch or tagMatch:
-                  self.matchList.append(trackItem)
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-              for ref in [matchName, matchSourceName, str(matchMetadata), str(matchSourceMetadata)]:
-                if searchText.lower() in ref.lower():
-                  self.matchList.append(trackItem)
-                  matchFound = True
-                  break
-                else:
-                  matchFound = False
-              if not matchFound:
-                for tag in trackItem.tags():
-                  if searchText.lower() in tag.note().lower():
-                    self.matchList.append(trackItem)
-                    break
-          else:
-            if self.useRegex.isChecked():
-              if regex:
-                nameMatch = regex.search(trackItem.name())
-                sourceNameMatch = regex.search(trackItem.source().name())
-                metaMatch = regex.search(str(matchMetadata))
-                sourcemetaMatch = regex.search(str(matchSourceMetadata))
-                tagMatch = None
-                for tag in trackItem.tags():
-                  tagMatch = regex.search(tag.note())
-                  if tagMatch:
-                    break
-                if nameMatch or sourceNameMatch or metaMatch or sourcemetaMatch or tagMatch:
-                  self.matchList.append(trackItem)
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-              for ref in [matchName, matchSourceName, str(matchMetadata), str(matchSourceMetadata)]:
-                if searchText in ref:
-                  self.matchList.append(trackItem)
-                  matchFound = True
-                  break
-                else:
-                  matchFound = False
-              if not matchFound:
-                for tag in trackItem.tags():
-                  if searchText in tag.note():
-                    self.matchList.append(trackItem)
-                    break
-
-        if self.searchOptionsComboBox.currentText() == "Search Tag Notes":
-          if self.ignoreCase.isChecked():
-            if self.useRegex.isChecked():
-              if regex:
-                for tag in trackItem.tags():
-                  tagMatch = regex.search(tag.note().lower())
-                  if tagMatch:
-                    self.matchList.append(trackItem)
-                    break
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-                for tag in trackItem.tags():
-                  if searchText in tag.note().lower():
-                    self.matchList.append(trackItem)
-                    break
-          else:
-            if self.useRegex.isChecked():
-              if regex:
-                for tag in trackItem.tags():
-                  tagMatch = regex.search(tag.note())
-                  if tagMatch:
-                    self.matchList.append(trackItem)
-                    break
-              else:
-                self.updateStatusBar("Invalid regex")
-            else:
-              for tag in trackItem.tags():
-                if searchText in tag.note():
-                  self.matchList.append(trackItem)
-                  break
+      try:
+        query = HieroFindIndex.compileQuery(searchText, self.searchOptionsComboBox.currentText(),
+                                            self.ignoreCase.isChecked(), self.useRegex.isChecked())
+      except re.error as e:
+        self.updateStatusBar("Invalid regex: %s" % str(e))
+        return
+
+      # Repeated searches are answered from the cache until a project is edited
+      cacheKey = ("statusBar", query.cacheKey(), tuple(HieroFindNavigation.openSequences()))
+      HieroProjectTracker.projectTracker.updateIndexes()
+      stamp = HieroProjectTracker.projectTracker.generation
+      self.matchList = HieroFindIndex.resultCache.get(cacheKey, stamp)
+      if self.matchList is None:
+        self.matchList = [trackItem for trackItem in trackItemList if query.matchesTrackItem(trackItem)]
+        HieroFindIndex.resultCache.put(cacheKey, stamp, self.matchList)
 
       if self.matchList:
 
@@ -500,56 +333,15 @@ class FindAction(QAction):
 
       return trackItem
 
-    def findAllItems(self, rootbin, clips, sequences):
-      '''Recursively find all clips and sequences in a bin.
-         If started from the root bin of a project it will return
-         all clips and sequences in the entire project.
-      '''
-      for s in rootbin:
-        if isinstance(s, hiero.core.Bin):
-          for item in s.items():
-            if isinstance(item, hiero.core.BinItem) and hasattr(item, "activeItem"):
-              if isinstance(item.activeItem(), hiero.core.Clip):
-                clips.append(item.activeItem())
-              if isinstance(item.activeItem(), hiero.core.Sequence):
-                sequences.append(item.activeItem())
-            elif isinstance(item, hiero.core.Bin):
-                self.findAllItems([item], clips, sequences)
-        elif isinstance(s, hiero.core.BinItem) and hasattr(s, "activeItem"):
-          if isinstance(s.activeItem(), hiero.core.Clip):
-            clips.append(s.activeItem())
-          if isinstance(s.activeItem(), hiero.core.Sequence):
-            sequences.append(s.activeItem())
-
-      return clips, sequences
-
     def openViewers(self):
       '''Find all open Viewers
       '''
-      allViewers = []
-      for widget in QApplication.allWidgets():
-        if "viewer" in widget.objectName():
-          widget.setFocus()
-          view = hiero.ui.activeView()
-          allViewers.append(view)
-
-      return allViewers
+      return HieroFindNavigation.openViewers()
 
     def findViewer(self, sequence, start=None):
       '''Find a specific Viewer
       '''
-      for widget in QApplication.allWidgets():
-        try:
-          if widget.windowTitle() == sequence.name() and "viewer" in widget.objectName():
-            widget.setFocus()
-            if hiero.ui.activeView().player().sequence() == sequence:
-              return hiero.ui.activeView()
-            else:
-              continue
-        except:
-          pass
-
-      return None
+      return HieroFindNavigation.viewerForSequence(sequence)
 
     def allTrackItems(self, onlyOpen=False):
       '''Search projects for all track items in all sequences.
@@ -557,39 +349,20 @@ class FindAction(QAction):
       '''
       trackItems = []
       if not onlyOpen:
-        for project in hiero.core.projects():
-          bin = project.clipsBin()
-          clips, sequences = self.findAllItems(bin.items(), [], [])
-          for sequence in sequences:
-            items = self.trackItems(sequence)
-            trackItems += items
+        for sequence in HieroProjectTracker.allSequences():
+          items = self.trackItems(sequence)
+          trackItems += items
       else:
-        openViewers = self.openViewers()
-        for viewer in openViewers:
-          sequence = viewer.player().sequence()
-          if isinstance(sequence, hiero.core.Sequence):
-            items = self.trackItems(sequence)
-            trackItems += items
+        for sequence in HieroFindNavigation.openSequences():
+          items = self.trackItems(sequence)
+          trackItems += items
 
       return trackItems
 
     def trackItems(self, sequence):
       '''Get all track items from a sequence
       '''
-      trackItems = []
-      for track in sequence:
-        for ti in track:
-          link = False
-          if ti not in trackItems:
-            for item in trackItems:
-              if ti in item.linkedItems():
-                link = True
-            if not link:
-              trackItems.append(ti)
-            else:
-              pass
-
-      return trackItems
+      return HieroProjectTracker.trackItems(sequence)
 
     def FindOrCreateTrack(self, sequence, trackName):
       track = None
@@ -681,33 +454,7 @@ class FindAction(QAction):
       '''
       if not trackItem:
         return
-      sequence = trackItem.parentSequence()
-
-      cv = self.findViewer(sequence)
-      if not cv:
-        cv = hiero.ui.currentViewer()
-        p = cv.player()
-        p.setSequence(sequence)
-      tIn = trackItem.timelineIn()
-      cv.setTime(tIn)
-      tl = hiero.ui.findMenuAction("Show Timeline Editor")
-      settings = hiero.core.ApplicationSettings()
-      tl.trigger()
-
-      startView = hiero.ui.activeView()
-      np = hiero.ui.findMenuAction("Next Pane")
-      while not isinstance(hiero.ui.activeView(), hiero.ui.TimelineEditor):
-        np.trigger()
-        if hiero.ui.activeView() == startView:
-          return None
-
-      activeView = hiero.ui.activeView()
-      if isinstance(activeView, hiero.ui.TimelineEditor):
-        activeView.selectNone()
-      if isinstance(activeView, hiero.ui.TimelineEditor) and activeView.sequence() == trackItem.sequence():
-        activeView.setSelection(trackItem.linkedItems())
-      QApplication.processEvents()
-      sequence.editFinished()
+      HieroFindNavigation.goToShot(trackItem)
 
       # Return focus to the search text field
       # Comment this out if you want focus to stay on the track item
@@ -775,28 +522,5 @@ class FindPreviousAction(QAction):
     self.parent.findPrevious()
 
 
-  def findAllItems(self, rootbin, clips, sequences):
-    '''Recursively find all clips and sequences in a bin.
-       If started from the root bin of a project it will return
-       all clips and sequences in the entire project.
-    '''
-    for s in rootbin:
-      if isinstance(s, hiero.core.Bin):
-        for item in s.items():
-          if isinstance(item, hiero.core.BinItem) and hasattr(item, "activeItem"):
-            if isinstance(item.activeItem(), hiero.core.Clip):
-              clips.append(item)
-            if isinstance(item.activeItem(), hiero.core.Sequence):
-              sequences.append(item)
-          elif isinstance(item, hiero.core.Bin):
-              self.findAllItems([item], clips, sequences)
-      elif isinstance(s, hiero.core.BinItem) and hasattr(s, "activeItem"):
-        if isinstance(s.activeItem(), hiero.core.Clip):
-          clips.append(s)
-        if isinstance(s.activeItem(), hiero.core.Sequence):
-          sequences.append(s)
-
-    return clips, sequences
-
 findBar = FindAction.FindBar()
 hiero.ui.mainWindow().statusBar().addWidget(findBar)
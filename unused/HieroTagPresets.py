@@ -0,0 +1,207 @@
+# HieroTagPresets.py
+# Storage for the tag combination presets of the Find panel tag filter
+# (see HieroFindWidget.py). Presets are kept in memory, sorted by name, and
+# written to a JSON file in ~/.hiero whenever one is saved or deleted. The file
+# is written next to its final location and renamed over it, so a crash while
+# saving can't lose the presets that were already there.
+#
+# A studio can share presets by listing JSON files of the same format in the
+# HIERO_TAG_PRESETS environment variable, separated by os.pathsep. Shared
+# presets are read only, a user preset with the same name takes their place.
+#
+# Presets used to be stored in ApplicationSettings as a Python literal, they
+# are moved into the preset file the first time it is created.
+
+import os
+import sys
+import ast
+import json
+import stat
+import bisect
+import tempfile
+
+kPresetFileVersion = 1
+
+# Where the user's presets are kept unless told otherwise
+kDefaultPresetPath = os.path.join(os.path.expanduser("~"), ".hiero", "tagPresets.json")
+
+# Environment variable listing shared preset files
+kSharedPresetsVariable = "HIERO_TAG_PRESETS"
+
+# The ApplicationSettings key presets were stored under before
+kTagCombinationPreset = "tagCombinationPresets"
+
+def readPresetFile(path):
+  '''The presets in the file at @path, a dictionary of preset name to
+     {'checked': [tag names], 'ignored': [tag names]}. Unreadable files,
+     and files that don't hold a dictionary of presets, have no presets.
+  '''
+  try:
+    with open(path, "rb") as f:
+      data = json.load(f)
+  except (IOError, OSError, ValueError) as e:
+    if os.path.exists(path):
+      print "Unable to read tag presets from %s: %s" % (path, str(e))
+    return {}
+
+  if not isinstance(data, dict) or not isinstance(data.get("presets"), dict):
+    print "Unable to read tag presets from %s: not a preset file" % path
+    return {}
+
+  presets = {}
+  for name, state in data["presets"].iteritems():
+    if not isinstance(state, dict):
+      continue
+    presets[name] = { 'checked' : list(state.get('checked', [])),
+                      'ignored' : list(state.get('ignored', [])) }
+  return presets
+
+def writePresetFile(path, presets):
+  '''Write @presets to @path. The file is written next to @path and then
+     renamed over it, so readers never see a partly written file. The file
+     keeps the permissions it had, a new one gets the usual ones.
+  '''
+  data = json.dumps({ "version" : kPresetFileVersion, "presets" : presets }, indent=1, sort_keys=True)
+  directory = os.path.dirname(os.path.abspath(path))
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+  if os.path.exists(path):
+    mode = stat.S_IMODE(os.stat(path).st_mode)
+  else:
+    umask = os.umask(0)
+    os.umask(umask)
+    mode = 0666 & ~umask
+  handle, temporaryPath = tempfile.mkstemp(dir=directory, suffix=".tmp")
+  try:
+    with os.fdopen(handle, "wb") as f:
+      f.write(data)
+    # mkstemp makes files only the user can read
+    os.chmod(temporaryPath, mode)
+    if os.path.exists(path) and sys.platform.startswith("win"):
+      os.remove(path)
+    os.rename(temporaryPath, path)
+  except:
+    if os.path.exists(temporaryPath):
+      os.remove(temporaryPath)
+    raise
+
+def sharedPresetPaths():
+  '''The shared preset files listed in the HIERO_TAG_PRESETS environment variable
+  '''
+  return [path for path in os.environ.get(kSharedPresetsVariable, "").split(os.pathsep) if path]
+
+class TagPresetStore(object):
+  '''The tag combination presets of the user at @path, and those shared
+     in @sharedPaths. Files are read once, when the presets are first
+     asked for, after that only changes are written.
+     Preset names are kept sorted case insensitively, so the position a
+     preset is shown at can be found without searching.
+  '''
+  def __init__(self, path=kDefaultPresetPath, sharedPaths=None):
+    self.path = path
+    self.sharedPaths = sharedPaths if sharedPaths is not None else sharedPresetPaths()
+    self._userPresets = None
+    self._sharedPresets = {}
+    self._sortKeys = []
+
+  def _load(self):
+    if self._userPresets is not None:
+      return
+    self._sharedPresets = {}
+    for path in self.sharedPaths:
+      self._sharedPresets.update(readPresetFile(path))
+    self._userPresets = readPresetFile(self.path)
+    self._sortKeys = sorted([(name.lower(), name) for name in self._allNames()])
+
+  def _allNames(self):
+    return set(self._sharedPresets) | set(self._userPresets)
+
+  def exists(self):
+    '''Whether the user's preset file has been written
+    '''
+    return os.path.exists(self.path)
+
+  def names(self):
+    '''The names of all presets, sorted case insensitively
+    '''
+    self._load()
+    return [name for key, name in self._sortKeys]
+
+  def position(self, name):
+    '''Where @name is in names(), or None if there is no such preset
+    '''
+    self._load()
+    position = bisect.bisect_left(self._sortKeys, (name.lower(), name))
+    if position < len(self._sortKeys) and self._sortKeys[position][1] == name:
+      return position
+    return None
+
+  def preset(self, name):
+    '''The preset called @name, or None
+    '''
+    self._load()
+    if name in self._userPresets:
+      return self._userPresets[name]
+    return self._sharedPresets.get(name)
+
+  def setPreset(self, name, state, save=True):
+    '''Add or replace the user preset @name with @state, a dictionary of
+       'checked' and 'ignored' tag names. Returns the position of the preset
+       in names() and whether it is new.
+    '''
+    self._load()
+    self._userPresets[name] = { 'checked' : list(state['checked']),
+                                'ignored' : list(state['ignored']) }
+    position = self.position(name)
+    isNew = position is None
+    if isNew:
+      position = bisect.bisect_left(self._sortKeys, (name.lower(), name))
+      self._sortKeys.insert(position, (name.lower(), name))
+    if save:
+      self.save()
+    return position, isNew
+
+  def removePreset(self, name):
+    '''Delete the user preset @name. Returns the position it had in names(),
+       or None if it wasn't a user preset. Shared presets can't be deleted,
+       a user preset replacing one is deleted and the shared one shown again.
+    '''
+    self._load()
+    if name not in self._userPresets:
+      return None
+    position = self.position(name)
+    del self._userPresets[name]
+    if name not in self._sharedPresets:
+      del self._sortKeys[position]
+    self.save()
+    return position
+
+  def save(self):
+    self._load()
+    writePresetFile(self.path, self._userPresets)
+
+  def migrateSettings(self, settings):
+    '''Move the presets stored in @settings, a hiero.core.ApplicationSettings,
+       into the preset file if it hasn't been created yet. The settings are
+       left as they were, so older versions of the Find panel still see them.
+    '''
+    if self.exists():
+      return
+    presets = settings.value(kTagCombinationPreset, "")
+    try:
+      presets = ast.literal_eval(presets) if presets else {}
+    except (ValueError, SyntaxError):
+      presets = {}
+    for name, state in presets.iteritems():
+      self.setPreset(name, state, save=False)
+    self.save()
+
+_presetStore = None
+
+def presetStore():
+  '''The tag preset store of the user
+  '''
+  global _presetStore
+  if _presetStore is None:
+    _presetStore = TagPresetStore()
+  return _presetStore
@@ -0,0 +1,63 @@
+# HieroTrackOccupancy.py
+# Keeps track of the frames used on the tracks of a sequence being built, so
+# track items can be placed on the first track they fit on without comparing
+# their frame ranges against every item already on each track.
+# Track items on one track never overlap, so the used frames of a track are
+# kept as sorted, non-overlapping intervals and an overlap test is a binary
+# search. This module does not import hiero, it only deals in frame numbers.
+
+import bisect
+
+class TrackOccupancy(object):
+  '''The frames used on one track, as sorted, non-overlapping intervals.
+     Intervals are inclusive of both ends, like timelineIn and timelineOut.
+  '''
+  def __init__(self):
+    self._starts = []
+    self._ends = []
+
+  def __len__(self):
+    return len(self._starts)
+
+  def overlaps(self, first, last):
+    '''Whether any frame from @first to @last is used
+    '''
+    # The last interval starting at or before @last is the only one that
+    # can reach @first, the intervals before it end before it starts
+    i = bisect.bisect_right(self._starts, last)
+    return i > 0 and self._ends[i-1] >= first
+
+  def add(self, first, last):
+    '''Mark the frames from @first to @last used. They must not overlap
+       frames already used.
+    '''
+    i = bisect.bisect_right(self._starts, first)
+    self._starts.insert(i, first)
+    self._ends.insert(i, last)
+
+class SequenceOccupancy(object):
+  '''The frames used on each track of a sequence, by track name.
+     An item that doesn't fit on the track it asks for goes on the first of
+     trackName_1, trackName_2, ... it fits on.
+  '''
+  def __init__(self):
+    self._tracks = {}
+
+  def track(self, trackName):
+    '''The TrackOccupancy of the track called @trackName
+    '''
+    if trackName not in self._tracks:
+      self._tracks[trackName] = TrackOccupancy()
+    return self._tracks[trackName]
+
+  def place(self, trackName, first, last):
+    '''Find a track for the frames @first to @last and mark them used there.
+       Returns the name of the track.
+    '''
+    name = trackName
+    overflow = 0
+    while self.track(name).overlaps(first, last):
+      overflow += 1
+      name = "%s_%i" % (trackName, overflow)
+    self.track(name).add(first, last)
+    return name
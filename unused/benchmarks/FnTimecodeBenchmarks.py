@@ -0,0 +1,111 @@
+# FnTimecodeBenchmarks.py
+# Checks FnTimecode.py against reference timecodes, then times converting a
+# million frame numbers to timecode with it, with numpy if it is installed and
+# with hiero.core.Timecode when run inside Hiero.
+#
+# Usage: python FnTimecodeBenchmarks.py [conversions]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import FnTimecode
+
+# (fps, drop frame, frame, timecode)
+kReferenceTimecodes = [ (24, False, 0, "00:00:00:00"),
+                        (24, False, 23, "00:00:00:23"),
+                        (24, False, 86399, "00:59:59:23"),
+                        (24, False, 86400, "01:00:00:00"),
+                        (24, False, -1, "-00:00:00:01"),
+                        (23.976, False, 86400, "01:00:00:00"),
+                        (25, False, 90000, "01:00:00:00"),
+                        (25, False, 2159999, "23:59:59:24"),
+                        (30, False, 108000, "01:00:00:00"),
+                        (29.97, False, 1800, "00:01:00:00"),
+                        (29.97, True, 1799, "00:00:59;29"),
+                        (29.97, True, 1800, "00:01:00;02"),
+                        (29.97, True, 3598, "00:02:00;02"),
+                        (29.97, True, 17981, "00:09:59;29"),
+                        (29.97, True, 17982, "00:10:00;00"),
+                        (29.97, True, 17983, "00:10:00;01"),
+                        (29.97, True, 19782, "00:11:00;02"),
+                        (29.97, True, 107892, "01:00:00;00"),
+                        (29.97, True, 2589407, "23:59:59;29"),
+                        (59.94, True, 3599, "00:00:59;59"),
+                        (59.94, True, 3600, "00:01:00;04"),
+                        (59.94, True, 35964, "00:10:00;00"),
+                        (59.94, True, 215784, "01:00:00;00"),
+                        (60, False, 216000, "01:00:00:00") ]
+
+def checkReferenceTimecodes():
+  '''Check FnTimecode formats and parses every reference timecode, and that
+     timecodes round trip over the first ten minutes of each rate.
+  '''
+  failures = []
+  for fps, dropFrame, frame, timecode in kReferenceTimecodes:
+    formatted = FnTimecode.framesToTimecode(frame, fps, dropFrame)
+    if formatted != timecode:
+      failures.append("frame %i at %s fps%s gave %s, not %s" % (frame, fps, " drop frame" if dropFrame else "", formatted, timecode))
+    parsed = FnTimecode.timecodeToFrames(timecode, fps)
+    if parsed != frame:
+      failures.append("%s at %s fps gave frame %i, not %i" % (timecode, fps, parsed, frame))
+    if FnTimecode.numpy is not None:
+      formatted = FnTimecode.framesToTimecodes(FnTimecode.numpy.array([frame]), fps, dropFrame)[0]
+      if formatted != timecode:
+        failures.append("numpy: frame %i at %s fps gave %s, not %s" % (frame, fps, formatted, timecode))
+
+  for fps, dropFrame in ((24, False), (25, False), (29.97, True), (59.94, True)):
+    frames = range(0, 36000 * int(round(fps)) // 60 + 100)
+    timecodes = FnTimecode.framesToTimecodes(frames, fps, dropFrame)
+    if FnTimecode.timecodesToFrames(timecodes, fps) != frames:
+      failures.append("timecodes at %s fps don't round trip" % fps)
+    if len(set(timecodes)) != len(timecodes):
+      failures.append("timecodes at %s fps repeat" % fps)
+
+  for invalid, fps in (("00:01:00;00", 29.97), ("00:00:60:00", 24), ("1:2:3", 24), ("00:00:00:24", 24)):
+    try:
+      FnTimecode.timecodeToFrames(invalid, fps)
+      failures.append("%s at %s fps was accepted" % (invalid, fps))
+    except ValueError:
+      pass
+
+  for failure in failures:
+    print "FAILED:", failure
+  print "%i reference timecodes checked, %i failures" % (len(kReferenceTimecodes), len(failures))
+  return not failures
+
+def timeCall(function, *args):
+  start = time.time()
+  result = function(*args)
+  return time.time() - start, result
+
+def benchmarkConversions(count):
+  print "Converting %i frame numbers to timecode (conversions per second)" % count
+  print "%-10s %14s %14s %14s" % ("rate", "hiero", "pure Python", "numpy")
+  try:
+    import hiero.core
+  except ImportError:
+    hiero = None
+
+  frames = range(count)
+  for fps, dropFrame in ((24, False), (25, False), (29.97, True)):
+    pythonTime, timecodes = timeCall(FnTimecode.framesToTimecodes, frames, fps, dropFrame)
+    numpyRate = hieroRate = "-"
+    if FnTimecode.numpy is not None:
+      array = FnTimecode.numpy.arange(count)
+      numpyTime, numpyTimecodes = timeCall(FnTimecode.framesToTimecodes, array, fps, dropFrame)
+      assert numpyTimecodes.tolist() == timecodes
+      numpyRate = "%.0f" % (count / max(numpyTime, 1e-6))
+    if hiero is not None and not dropFrame:
+      timeBase = hiero.core.TimeBase(fps)
+      hieroTime, hieroTimecodes = timeCall(lambda: [hiero.core.Timecode.timeToString(frame, timeBase, hiero.core.Timecode.kDisplayTimecode) for frame in frames])
+      hieroRate = "%.0f" % (count / max(hieroTime, 1e-6))
+    print "%-10s %14s %14.0f %14s" % ("%s%s" % (fps, " DF" if dropFrame else ""), hieroRate, count / max(pythonTime, 1e-6), numpyRate)
+
+if __name__ == "__main__":
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+  if not checkReferenceTimecodes():
+    sys.exit(1)
+  print
+  benchmarkConversions(count)
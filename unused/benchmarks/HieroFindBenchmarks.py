@@ -0,0 +1,331 @@
+# HieroFindBenchmarks.py
+# Timings for the pure Python parts of the Find tools (HieroFindIndex.py and
+# the modules it shares work with).
+# These run outside Hiero using simple stand-ins for sequences, tracks and
+# track items, so they measure our own code and not the Hiero API.
+#
+# Usage: python HieroFindBenchmarks.py [--full]
+#   --full also times the old quadratic code at every size instead of
+#          estimating it from the largest size it was run at.
+
+import os
+import re
+import heapq
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import HieroFindIndex
+import HieroShotSnapshot
+import HieroTrackOccupancy
+
+class BenchTag(object):
+  def __init__(self, note):
+    self._note = note
+
+  def note(self):
+    return self._note
+
+class BenchMetadata(object):
+  def __init__(self, values):
+    self._values = values
+
+  def keys(self):
+    return self._values.keys()
+
+  def value(self, key):
+    return self._values[key]
+
+  def __str__(self):
+    return str(self._values)
+
+class BenchSource(object):
+  def __init__(self, name):
+    self._name = name
+    self._metadata = BenchMetadata({"foundry.source.filename" : "/jobs/bench/plates/%s.####.exr" % name,
+                                    "foundry.source.colourspace" : "linear",
+                                    "foundry.source.resolution" : "1920x1080"})
+
+  def name(self):
+    return self._name
+
+  def metadata(self):
+    return self._metadata
+
+class BenchTrackItem(object):
+  def __init__(self, name):
+    self._name = name
+    self._linked = [self]
+    self._source = BenchSource(name + "_plate_v001")
+    self._metadata = BenchMetadata({"tag.status" : "pending", "clip.name" : name,
+                                    "foundry.edl.sourceReel" : "A%03iC%03i" % (len(name) % 7, hash(name) % 1000)})
+    self._tags = [BenchTag("Check the grade on %s" % name)]
+
+  def name(self):
+    return self._name
+
+  def linkedItems(self):
+    return self._linked
+
+  def source(self):
+    return self._source
+
+  def metadata(self):
+    return self._metadata
+
+  def tags(self):
+    return self._tags
+
+def makeSequence(shotCount):
+  '''A sequence of one video and one audio track with each video item
+     linked to the audio item below it.
+  '''
+  video = []
+  audio = []
+  for i in range(shotCount):
+    videoItem = BenchTrackItem("shot%05i" % i)
+    audioItem = BenchTrackItem("shot%05i" % i)
+    videoItem._linked = [videoItem, audioItem]
+    audioItem._linked = [audioItem, videoItem]
+    video.append(videoItem)
+    audio.append(audioItem)
+  return [video, audio]
+
+def quadraticTrackItems(sequence):
+  '''FindDialog.trackItems as it was before uniqueTrackItems
+  '''
+  trackItems = []
+  for track in sequence:
+    for ti in track:
+      link = False
+      if ti not in trackItems:
+        for item in trackItems:
+          if ti in item.linkedItems():
+            link = True
+        if not link:
+          trackItems.append(ti)
+  return trackItems
+
+def timeCall(function, *args):
+  start = time.time()
+  result = function(*args)
+  return time.time() - start, result
+
+def benchmarkUniqueTrackItems(full=False):
+  print "Linked track item deduplication (seconds)"
+  print "%8s %12s %12s %10s" % ("shots", "quadratic", "linear", "speedup")
+  quadraticLimit = None if full else 10000
+  lastMeasured = None
+  for shotCount in (1000, 10000, 50000):
+    sequence = makeSequence(shotCount)
+    linearTime, linear = timeCall(HieroFindIndex.uniqueTrackItems, sequence)
+    assert len(linear) == shotCount
+
+    if quadraticLimit is None or shotCount <= quadraticLimit:
+      quadraticTime, quadratic = timeCall(quadraticTrackItems, sequence)
+      assert quadratic == linear
+      lastMeasured = (shotCount, quadraticTime)
+      estimate = ""
+    else:
+      # The old code grows with the square of the shot count
+      quadraticTime = lastMeasured[1] * (float(shotCount) / lastMeasured[0]) ** 2
+      estimate = " (estimated)"
+
+    print "%8i %12.4f %12.4f %9.0fx%s" % (shotCount, quadraticTime, linearTime, quadraticTime / max(linearTime, 1e-6), estimate)
+
+def branchingMatches(trackItems, searchText, searchOption, ignoreCase, useRegex):
+  '''The per track item checks of findMatches before compileQuery: every
+     field read, the regex compiled and the text lowered for each item.
+  '''
+  matchList = []
+  for trackItem in trackItems:
+    texts = {}
+    texts[HieroFindIndex.kNames] = [trackItem.name(), trackItem.source().name()]
+    texts[HieroFindIndex.kMetadata] = [str(trackItem.metadata()), str(trackItem.source().metadata())]
+    texts[HieroFindIndex.kTagNotes] = [tag.note() for tag in trackItem.tags()]
+    if useRegex:
+      regex = re.compile(searchText, re.IGNORECASE if ignoreCase else 0)
+    for field in HieroFindIndex.kSearchFields[searchOption]:
+      found = False
+      for text in texts[field]:
+        if useRegex:
+          found = regex.search(text.lower() if ignoreCase else text) is not None
+        elif ignoreCase:
+          found = searchText.lower() in text.lower()
+        else:
+          found = searchText in text
+        if found:
+          break
+      if found:
+        matchList.append(trackItem)
+        break
+  return matchList
+
+def benchmarkKeyedMetadata(shotCount=20000):
+  print "Metadata search for foundry.edl.sourceReel:A003C012 (milliseconds)"
+  print "%8s %14s %14s %10s" % ("shots", "str(metadata)", "key index", "speedup")
+  trackItems = [BenchTrackItem("shot%05i" % i) for i in range(shotCount)]
+  index = HieroFindIndex.TrackItemIndex()
+  index.indexSequence("bench", trackItems)
+  def strMatches():
+    return [ti for ti in trackItems if "A003C012" in str(ti.metadata()) or "A003C012" in str(ti.source().metadata())]
+  strTime, strResult = timeCall(strMatches)
+  keyedTime, keyed = timeCall(index.search, ["bench"], "foundry.edl.sourceReel:A003C012", HieroFindIndex.kSearchMetadata)
+  assert keyed == strResult
+  print "%8i %14.2f %14.2f %9.0fx" % (shotCount, strTime * 1e3, keyedTime * 1e3, strTime / max(keyedTime, 1e-6))
+  # A regex that happens to look like "key:value" is still a regex
+  pattern = r"shot.0012:?"
+  expected = [ti for ti in trackItems if re.search(pattern, ti.name())]
+  for searchOption in (HieroFindIndex.kSearchAll, HieroFindIndex.kSearchMetadata):
+    assert HieroFindIndex.compileQuery(pattern, searchOption, useRegex=True).metadataKey is None
+    assert index.search(["bench"], pattern, searchOption, useRegex=True) == expected
+
+def benchShot(i):
+  name = "shot%05i" % i
+  return { "name" : name,
+           "sourceName" : name + "_plate_v001",
+           "track" : "Video %i" % (i % 4 + 1),
+           "sequence" : "reel%02i_edit_v012" % (i % 20),
+           "project" : "bench",
+           "timelineIn" : i * 48,
+           "timelineOut" : i * 48 + 47,
+           "sourceIn" : 1001.0,
+           "sourceOut" : 1048.0,
+           "reel" : "A%03iC%03i" % (i % 50, i % 1000),
+           "tags" : ["Approved"] if i % 3 else ["Approved", "VFX"],
+           "notes" : ["Check the grade on %s" % name],
+           "metadata" : [("foundry.edl.sourceReel", "A%03iC%03i" % (i % 50, i % 1000)),
+                         ("foundry.source.filename", "/jobs/bench/plates/%s.####.exr" % name),
+                         ("foundry.source.colourspace", "linear")],
+           "sourceMetadata" : [("media.input.filename", "/jobs/bench/plates/%s.1001.exr" % name)] }
+
+def benchmarkSnapshot(shotCount=50000):
+  print "Shot snapshot of %i shots" % shotCount
+  shots = [benchShot(i) for i in range(shotCount)]
+  snapshot = HieroShotSnapshot.ShotSnapshot(os.path.abspath(__file__), 0.0)
+  buildTime, unused = timeCall(lambda: [snapshot.addShot(shot) for shot in shots])
+  path = os.path.join(tempfile.mkdtemp(), "bench.snapshot")
+  try:
+    writeTime, unused = timeCall(snapshot.write, path)
+    size = os.path.getsize(path)
+    readTime, loaded = timeCall(HieroShotSnapshot.ShotSnapshot.read, path)
+    columnTime, names = timeCall(loaded.column, "name")
+  finally:
+    shutil.rmtree(os.path.dirname(path))
+  assert loaded.row(shotCount - 1) == shots[-1]
+  assert names == [shot["name"] for shot in shots]
+  print "%-28s %10.1f ms" % ("build", buildTime * 1e3)
+  print "%-28s %10.1f ms" % ("write", writeTime * 1e3)
+  print "%-28s %10.1f ms" % ("load", readTime * 1e3)
+  print "%-28s %10.1f ms" % ("decode the name column", columnTime * 1e3)
+  print "%-28s %10.1f MB" % ("file size", size / 1048576.0)
+
+def benchmarkFuzzy(shotCount=50000):
+  print "Fuzzy top %i name search of %i shots (milliseconds)" % (HieroFindIndex.kFuzzyResults, shotCount)
+  print "%-12s %14s %14s %10s" % ("search", "score every", "trigram top-k", "speedup")
+  trackItems = [BenchTrackItem("shot%05i" % i) for i in range(shotCount)]
+  index = HieroFindIndex.TrackItemIndex()
+  index.indexSequence("bench", trackItems)
+  for searchText in ("shot01234", "shto01234", "sht1234"):
+    query = HieroFindIndex.compileQuery(searchText, HieroFindIndex.kSearchFuzzy)
+    def scoreEvery():
+      scores = [(query.score(HieroFindIndex.readNames(ti)), i, ti) for i, ti in enumerate(trackItems)]
+      return [ti for score, i, ti in heapq.nsmallest(HieroFindIndex.kFuzzyResults, scores, key=lambda match: (-match[0], match[1]))]
+    everyTime, every = timeCall(scoreEvery)
+    rankedTime, ranked = timeCall(index.searchQuery, ["bench"], query)
+    assert ranked[0] is every[0]
+    print "%-12s %14.1f %14.1f %9.1fx" % (searchText, everyTime * 1e3, rankedTime * 1e3, everyTime / max(rankedTime, 1e-6))
+
+def benchmarkResultCache(shotCount=50000):
+  print "Repeated search of %i shots through the result cache (milliseconds)" % shotCount
+  print "%-12s %12s %12s %10s" % ("search", "indexed", "cached", "speedup")
+  trackItems = [BenchTrackItem("shot%05i" % i) for i in range(shotCount)]
+  index = HieroFindIndex.TrackItemIndex()
+  index.indexSequence("bench", trackItems)
+  cache = HieroFindIndex.SearchResultCache()
+  for searchText in ("shot0", "grade", "shot012"):
+    # Keyed and stamped the way the Find panel caches its searches
+    query = HieroFindIndex.compileQuery(searchText, HieroFindIndex.kSearchAll)
+    key = (query.cacheKey(), ("bench",))
+    stamp = HieroFindIndex.indexStamp([index])
+    assert cache.get(key, stamp) is None
+    indexedTime, matches = timeCall(index.searchQuery, ["bench"], query)
+    cache.put(key, stamp, matches)
+    sameQuery = HieroFindIndex.compileQuery(searchText, HieroFindIndex.kSearchAll)
+    cachedTime, cached = timeCall(cache.get, (sameQuery.cacheKey(), ("bench",)), HieroFindIndex.indexStamp([index]))
+    assert cached == matches
+    print "%-12s %12.2f %12.2f %9.0fx" % (searchText, indexedTime * 1e3, cachedTime * 1e3, indexedTime / max(cachedTime, 1e-6))
+
+  # An edit to the index must stop the cached results being returned
+  index.indexTrackItem(BenchTrackItem("shot%05i" % shotCount), "bench", shotCount)
+  assert cache.get(key, HieroFindIndex.indexStamp([index])) is None
+
+def rangeSetPlacement(shots):
+  '''Track placement as CreateNewSequence used to do it: the frames of each
+     shot as a set, intersected with those of every shot on its track.
+  '''
+  tracks = {}
+  placed = []
+  for trackName, first, last in shots:
+    itemrange = set(range(first, last+1))
+    name = trackName
+    overflow = 0
+    while [clip for clip in tracks.get(name, []) if set(range(clip[0], clip[1]+1)) & itemrange]:
+      overflow += 1
+      name = "%s_%i" % (trackName, overflow)
+    tracks.setdefault(name, []).append((first, last))
+    placed.append(name)
+  return placed
+
+def benchmarkTrackOccupancy(full=False):
+  print "Placing shots on the first free track (milliseconds)"
+  print "%8s %14s %14s %10s" % ("shots", "range sets", "occupancy", "speedup")
+  for shotCount in (100, 500, 1000, 10000):
+    # Shots from several feature length sequences, so some overlap
+    shots = [("Video 1", (i * 997) % 150000, (i * 997) % 150000 + 24 + i % 100) for i in range(shotCount)]
+    def occupancyPlacement():
+      occupancy = HieroTrackOccupancy.SequenceOccupancy()
+      return [occupancy.place(*shot) for shot in shots]
+    occupancyTime, placed = timeCall(occupancyPlacement)
+    if full or shotCount <= 1000:
+      rangeTime, expected = timeCall(rangeSetPlacement, shots)
+      assert placed == expected
+      print "%8i %14.1f %14.1f %9.1fx" % (shotCount, rangeTime * 1e3, occupancyTime * 1e3, rangeTime / max(occupancyTime, 1e-6))
+    else:
+      print "%8i %14s %14.1f" % (shotCount, "-", occupancyTime * 1e3)
+
+def benchmarkQuery(shotCount=20000):
+  print "Per track item cost of a search without the index (microseconds)"
+  print "%-18s %-6s %-6s %10s %10s %8s" % ("option", "case", "regex", "branching", "compiled", "speedup")
+  trackItems = [BenchTrackItem("shot%05i" % i) for i in range(shotCount)]
+  for searchOption in (HieroFindIndex.kSearchAll, HieroFindIndex.kSearchNames,
+                       HieroFindIndex.kSearchMetadata, HieroFindIndex.kSearchTagNotes):
+    for ignoreCase in (False, True):
+      for useRegex in (False, True):
+        searchText = "SHOT0001[0-9]" if useRegex else "shot00012"
+        if not ignoreCase:
+          searchText = searchText.lower()
+        branchingTime, branching = timeCall(branchingMatches, trackItems, searchText, searchOption, ignoreCase, useRegex)
+        query = HieroFindIndex.compileQuery(searchText, searchOption, ignoreCase, useRegex)
+        compiledTime, compiled = timeCall(lambda: [ti for ti in trackItems if query.matchesTrackItem(ti)])
+        assert compiled == branching
+        print "%-18s %-6s %-6s %10.2f %10.2f %7.1fx" % (searchOption, "ignore" if ignoreCase else "match", "yes" if useRegex else "no",
+                                                         branchingTime / shotCount * 1e6, compiledTime / shotCount * 1e6,
+                                                         branchingTime / max(compiledTime, 1e-6))
+
+if __name__ == "__main__":
+  benchmarkUniqueTrackItems(full="--full" in sys.argv)
+  print
+  benchmarkQuery()
+  print
+  benchmarkKeyedMetadata()
+  print
+  benchmarkSnapshot()
+  print
+  benchmarkFuzzy()
+  print
+  benchmarkResultCache()
+  print
+  benchmarkTrackOccupancy(full="--full" in sys.argv)